@@ -0,0 +1,220 @@
+import os
+import time
+import json
+import asyncio
+import argparse
+import warnings
+import aiohttp
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urljoin, urldefrag, urlparse
+from ..parser import ScrivrParser
+from ..parser.sources import url_to_path
+from ..parser.workers import init_worker, parse_bytes
+
+
+class CrawlResult(NamedTuple):
+    url: str
+    # None when the page failed before a response, or while it was parsed or written
+    status: Optional[int]
+    text: Optional[str]
+    output_path: Optional[str]
+    error: Optional[str] = None
+
+
+class LinkExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+class ScrivrCrawler:
+    """
+    Asyncio crawler that hands fetched pages straight to the ScrivrParser rule chain.
+
+    Connections are pooled per host by a shared aiohttp session. Requests to the same host
+    are spaced by `politeness_delay` seconds, and ETag/Last-Modified validators are sent
+    back as conditional requests so unchanged pages are skipped with a 304. Bodies are
+    parsed in a pool of `num_processes` worker processes without touching disk.
+    """
+
+    def __init__(self, start_urls: List[str], output_dir: Optional[str] = None, parser: Optional[ScrivrParser] = None,
+                 max_concurrency: int = 10, max_connections_per_host: int = 2, politeness_delay: float = 1.0,
+                 num_processes: int = 1, follow_links: bool = False, max_pages: Optional[int] = None,
+                 state_path: Optional[str] = None, timeout: float = 30):
+        self.start_urls = start_urls
+        self.output_dir = output_dir
+        self.parser = parser or ScrivrParser()
+        self.max_concurrency = max_concurrency
+        self.max_connections_per_host = max_connections_per_host
+        self.politeness_delay = politeness_delay
+        self.num_processes = num_processes
+        self.follow_links = follow_links
+        self.max_pages = max_pages
+        self.state_path = state_path
+        self.timeout = timeout
+
+        # ETag and Last-Modified validators by url, persisted to state_path between runs
+        self.validators: Dict[str, Dict[str, str]] = {}
+        if state_path and os.path.isfile(state_path):
+            with open(state_path, 'r') as f:
+                self.validators = json.load(f)
+
+        self.allowed_hosts = {urlparse(url).netloc for url in start_urls}
+        self.host_locks: Dict[str, asyncio.Lock] = {}
+        self.host_last_request: Dict[str, float] = {}
+
+    def run(self) -> List[CrawlResult]:
+        return asyncio.run(self.crawl())
+
+    async def crawl(self) -> List[CrawlResult]:
+        """Crawls the start urls, and every same-host link when follow_links is set"""
+        queue = asyncio.Queue()
+        seen = set()
+        results = []
+
+        for url in self.start_urls:
+            url = urldefrag(url)[0]
+            if url not in seen:
+                seen.add(url)
+                queue.put_nowait(url)
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_connections_per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        with ProcessPoolExecutor(max_workers=self.num_processes, initializer=init_worker, initargs=(self.parser,)) as pool:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+                async def worker():
+                    while True:
+                        url = await queue.get()
+                        try:
+                            result, links = await self.fetch_and_parse(session, pool, url)
+                            results.append(result)
+                            for link in links:
+                                if link in seen or (self.max_pages and len(seen) >= self.max_pages):
+                                    continue
+                                seen.add(link)
+                                queue.put_nowait(link)
+                        except Exception as e:
+                            # Any failure, including in a processing rule or the worker pool, is this url's
+                            # alone, so the worker carries on and queue.join() still returns
+                            results.append(CrawlResult(url, None, None, None, repr(e)))
+                            warnings.warn(f"Failed to crawl {url}: {e!r}")
+                        finally:
+                            queue.task_done()
+
+                workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+                await queue.join()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        self.save_state()
+        return results
+
+    async def fetch_and_parse(self, session, pool, url):
+        """Fetches a url and parses its body, returns the CrawlResult and any links to follow"""
+        headers = {}
+        validators = self.validators.get(url, {})
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        await self.wait_politely(urlparse(url).netloc)
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return CrawlResult(url, 304, None, None), []
+            if response.status != 200:
+                return CrawlResult(url, response.status, None, None), []
+
+            body = await response.read()
+            validators = {}
+            if 'ETag' in response.headers:
+                validators['etag'] = response.headers['ETag']
+            if 'Last-Modified' in response.headers:
+                validators['last_modified'] = response.headers['Last-Modified']
+            final_url = str(response.url)
+            is_html = 'html' in response.headers.get('Content-Type', '')
+
+        # Parsing is CPU bound, so it runs in the worker pool while other fetches continue
+        text = await asyncio.get_running_loop().run_in_executor(pool, parse_bytes, body)
+        output_path = self.write_output(url, text) if self.output_dir and text is not None else None
+
+        # Only a page that was parsed and written may be skipped as unchanged next time
+        if validators:
+            self.validators[url] = validators
+
+        links = []
+        if self.follow_links and is_html:
+            links = self.extract_links(final_url, body.decode('utf-8', errors='replace'))
+
+        return CrawlResult(url, 200, text, output_path), links
+
+    async def wait_politely(self, host: str) -> None:
+        """Waits until politeness_delay has passed since the last request to the host"""
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            last_request = self.host_last_request.get(host)
+            if last_request is not None:
+                delay = self.politeness_delay - (time.monotonic() - last_request)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.host_last_request[host] = time.monotonic()
+
+    def extract_links(self, base_url: str, html: str) -> List[str]:
+        """Returns the absolute, same-host http(s) links found in the page"""
+        extractor = LinkExtractor()
+        extractor.feed(html)
+
+        links = []
+        for href in extractor.links:
+            link = urldefrag(urljoin(base_url, href))[0]
+            parsed = urlparse(link)
+            if parsed.scheme in ('http', 'https') and parsed.netloc in self.allowed_hosts:
+                links.append(link)
+        return links
+
+    def write_output(self, url: str, text: str) -> str:
+        """
+        Writes parsed text under output_dir at a path mirroring the url, with the parser's output_filetype
+        and compression_level
+        """
+        output_file_path = self.parser.get_output_path(url_to_path(url), self.output_dir)
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        self.parser.write_output(output_file_path, text)
+        return output_file_path
+
+    def save_state(self) -> None:
+        if self.state_path:
+            with open(self.state_path, 'w') as f:
+                json.dump(self.validators, f)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Crawl pages and process them with the parser rule chain.")
+    arg_parser.add_argument("urls", nargs="+", help="the urls to start crawling from")
+    arg_parser.add_argument("-o", "--output_dir", required=True, help="the directory to write the processed pages to")
+    arg_parser.add_argument("-c", "--config_path", help="the path to the config file to use for processing rules")
+    arg_parser.add_argument("-n", "--num_processes", type=int, default=1, help="the number of processes to use for parsing pages")
+    arg_parser.add_argument("--max_concurrency", type=int, default=10, help="the maximum number of concurrent requests")
+    arg_parser.add_argument("--max_connections_per_host", type=int, default=2, help="the maximum number of connections per host")
+    arg_parser.add_argument("--politeness_delay", type=float, default=1.0, help="seconds to wait between requests to the same host")
+    arg_parser.add_argument("--follow_links", action="store_true", help="follow links to pages on the same host")
+    arg_parser.add_argument("--max_pages", type=int, help="the maximum number of pages to crawl")
+    arg_parser.add_argument("--state_path", help="a file to persist ETag/Last-Modified validators to between runs")
+    args = arg_parser.parse_args()
+
+    ScrivrCrawler(args.urls, output_dir=args.output_dir, parser=ScrivrParser(config_path=args.config_path),
+                  max_concurrency=args.max_concurrency, max_connections_per_host=args.max_connections_per_host,
+                  politeness_delay=args.politeness_delay, num_processes=args.num_processes,
+                  follow_links=args.follow_links, max_pages=args.max_pages, state_path=args.state_path).run()
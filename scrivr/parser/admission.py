@@ -0,0 +1,58 @@
+import os
+from typing import List, Optional
+from .compression import get_compression
+
+# Documents are held as bytes and as decoded text while they're parsed
+DECODE_MEMORY_FACTOR = 3
+
+# Assumed size of a compressed file's content relative to the file
+COMPRESSION_RATIO = 5
+
+
+def estimate_memory(file_path: str, processing_rules: list) -> int:
+    """Estimates the peak memory in bytes of parsing a file, from its size and the rule chain's memory factors"""
+    size = os.path.getsize(file_path)
+    if get_compression(file_path):
+        size *= COMPRESSION_RATIO
+    rule_factor = max((rule.memory_factor for rule in processing_rules), default=0)
+    return int(size * (DECODE_MEMORY_FACTOR + rule_factor))
+
+
+class AdmissionScheduler:
+    """
+    Hands out files so the estimated memory of the documents in flight stays within a budget.
+
+    Files are admitted in order while they fit. A file that doesn't fit waits for running
+    documents to finish, and smaller files behind it are admitted meanwhile, but only until it
+    has been passed over `max_bypass` times, after which nothing else starts before it. A file
+    larger than the whole budget is admitted once nothing else is running.
+    """
+
+    # How far past a waiting file to look for one that fits
+    LOOKAHEAD = 1000
+
+    def __init__(self, file_paths: List[str], processing_rules: list, memory_budget: int, max_bypass: int = 100):
+        self.memory_budget = memory_budget
+        self.max_bypass = max_bypass
+        self.pending = [(file_path, estimate_memory(file_path, processing_rules)) for file_path in file_paths]
+        self.running = {}
+        self.in_use = 0
+        self.head_bypasses = 0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def next(self) -> Optional[str]:
+        """Returns the next file to start, or None if no file can start until a running one is released"""
+        candidates = self.pending[:1] if self.head_bypasses >= self.max_bypass else self.pending[:self.LOOKAHEAD]
+        for i, (file_path, estimate) in enumerate(candidates):
+            if self.in_use + estimate <= self.memory_budget or not self.running:
+                del self.pending[i]
+                self.head_bypasses = self.head_bypasses + 1 if i else 0
+                self.running[file_path] = estimate
+                self.in_use += estimate
+                return file_path
+        return None
+
+    def release(self, file_path: str) -> None:
+        self.in_use -= self.running.pop(file_path)
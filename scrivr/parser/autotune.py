@@ -0,0 +1,159 @@
+import os
+import copy
+import time
+import random
+import shutil
+import tempfile
+import multiprocessing
+from typing import List, Optional
+import yaml
+from .supervisor import read_rss
+
+
+def stratified_sample(file_paths: List[str], sample_size: int, strata: int = 4, seed: int = 0) -> List[str]:
+    """
+    Returns up to sample_size files drawn evenly from `strata` size bands, smallest to largest.
+
+    Sampling by size keeps the rare large files that dominate memory and run time in the sample,
+    where a uniform sample of a corpus of mostly small files would likely miss them.
+    """
+    if len(file_paths) <= sample_size:
+        return list(file_paths)
+
+    rng = random.Random(seed)
+    by_size = sorted(file_paths, key=os.path.getsize)
+    bands = [by_size[i * len(by_size) // strata:(i + 1) * len(by_size) // strata] for i in range(strata)]
+
+    sample = []
+    for i, band in enumerate(bands):
+        # Spread the remainder over the largest bands
+        count = sample_size // strata + (1 if i >= strata - sample_size % strata else 0)
+        sample.extend(rng.sample(band, min(count, len(band))))
+    return sample
+
+
+def default_worker_counts() -> List[int]:
+    """Returns powers of two up to the number of cores, and the number of cores itself"""
+    cpu_count = os.cpu_count() or 1
+    counts = []
+    count = 1
+    while count < cpu_count:
+        counts.append(count)
+        count *= 2
+    counts.append(cpu_count)
+    return counts
+
+
+class AutoTuner:
+    """
+    Finds the num_processes and batch_size with the best throughput for a parser's rule chain.
+
+    Every combination of `worker_counts` and `batch_sizes` processes the same stratified sample
+    of input files into a temporary directory, the way process_files does. Throughput is measured
+    in bytes per second, and peak memory as the sum of the workers' resident memory, polled from
+    /proc on Linux. Combinations whose peak memory goes over `memory_limit` bytes, or couldn't be
+    measured while there is a limit, are never picked, nor are combinations where a worker failed.
+    """
+
+    # How often worker memory is polled during a trial, in seconds
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, parser, sample_size: int = 64, worker_counts: Optional[List[int]] = None,
+                 batch_sizes: Optional[List[int]] = None, memory_limit: Optional[int] = None):
+        self.parser = parser
+        self.sample_size = sample_size
+        self.worker_counts = worker_counts or default_worker_counts()
+        self.batch_sizes = batch_sizes or [1, 16]
+        self.memory_limit = memory_limit
+
+    def run(self, file_paths: List[str]) -> List[dict]:
+        """Runs every combination on a sample of the files, returns a result for each"""
+        sample = stratified_sample(file_paths, self.sample_size)
+
+        # Read the sample once so the first trial doesn't pay for a cold page cache
+        for file_path in sample:
+            with open(file_path, 'rb') as f:
+                f.read()
+
+        num_bytes = sum(os.path.getsize(file_path) for file_path in sample)
+        results = []
+        for num_processes in self.worker_counts:
+            for batch_size in self.batch_sizes:
+                seconds, peak_memory, exit_codes = self.trial(sample, num_processes, batch_size)
+                results.append({
+                    'num_processes': num_processes,
+                    'batch_size': batch_size,
+                    'seconds': seconds,
+                    'files_per_second': len(sample) / seconds,
+                    'bytes_per_second': num_bytes / seconds,
+                    'peak_memory': peak_memory,
+                    'failed': any(exit_code != 0 for exit_code in exit_codes),
+                })
+        return results
+
+    def trial(self, file_paths: List[str], num_processes: int, batch_size: int):
+        """Processes the files with the given settings, returns the seconds taken, the peak memory in bytes and the workers' exit codes"""
+        output_dir = tempfile.mkdtemp()
+        parser = copy.copy(self.parser)
+        parser.output_dir = output_dir
+        parser.num_processes = num_processes
+        parser.batch_size = batch_size
+
+        chunks = [file_paths[i::num_processes] for i in range(num_processes)]
+        try:
+            started = time.perf_counter()
+            processes = [multiprocessing.Process(target=parser.process_files_chunk, args=(chunk,)) for chunk in chunks]
+            for p in processes:
+                p.start()
+
+            peak_memory = None
+            while any(p.is_alive() for p in processes):
+                rss = [read_rss(p.pid) for p in processes if p.is_alive()]
+                if rss and None not in rss:
+                    peak_memory = max(peak_memory or 0, sum(rss))
+                time.sleep(self.POLL_INTERVAL)
+            for p in processes:
+                p.join()
+            seconds = time.perf_counter() - started
+        finally:
+            shutil.rmtree(output_dir)
+
+        return seconds, peak_memory, [p.exitcode for p in processes]
+
+    def best(self, results: List[dict]) -> dict:
+        """Returns the result with the highest throughput whose workers all succeeded and whose peak memory is within memory_limit"""
+        allowed = [result for result in results if not result.get('failed')]
+        if not allowed:
+            raise ValueError("Workers failed with every setting tried")
+        if self.memory_limit:
+            allowed = [result for result in allowed
+                       if result['peak_memory'] is not None and result['peak_memory'] <= self.memory_limit]
+            if not allowed:
+                raise ValueError(f"No settings were measured to stay within the memory limit of {self.memory_limit} bytes")
+        return max(allowed, key=lambda result: result['bytes_per_second'])
+
+    def apply(self, result: dict) -> None:
+        """Sets the parser to use a result's settings"""
+        self.parser.num_processes = result['num_processes']
+        self.parser.batch_size = result['batch_size']
+
+    @staticmethod
+    def write_config(config_path: str, result: dict) -> None:
+        """Writes a result's settings into a YAML config file, keeping its other keys"""
+        config = {}
+        if os.path.isfile(config_path):
+            with open(config_path, 'r') as f:
+                config = yaml.safe_load(f) or {}
+        config['num_processes'] = result['num_processes']
+        config['batch_size'] = result['batch_size']
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f, sort_keys=False)
+
+    @staticmethod
+    def format_results(results: List[dict]) -> str:
+        lines = ["processes  batch  files/s     MB/s  peak MB  note"]
+        for result in results:
+            peak = f"{result['peak_memory'] / 1e6:8.1f}" if result['peak_memory'] is not None else "       -"
+            lines.append(f"{result['num_processes']:9d}  {result['batch_size']:5d}  {result['files_per_second']:7.1f}  "
+                         f"{result['bytes_per_second'] / 1e6:7.2f}  {peak}" + ("  failed" if result.get('failed') else ""))
+        return "\n".join(lines)
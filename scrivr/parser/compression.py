@@ -0,0 +1,87 @@
+import io
+import gzip
+from typing import Optional
+
+# Compressed file extensions and the codec used to read and write them
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+}
+
+
+def get_compression(path: str) -> Optional[str]:
+    """Returns the codec for a path's extension, or None if the path isn't compressed"""
+    for ext, codec in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(ext):
+            return codec
+    return None
+
+
+def strip_compression_extension(path: str) -> str:
+    for ext in COMPRESSION_EXTENSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("The 'zstandard' package is required to read or write .zst files.") from e
+    return zstandard
+
+
+def open_file(path: str, mode: str = 'rb', level: Optional[int] = None, encoding: Optional[str] = None):
+    """
+    Opens a file, transparently (de)compressing it in a streaming fashion based on its extension.
+
+    Args:
+        path (str): The path of the file. `.gz` and `.zst` files are (de)compressed.
+        mode (str): One of 'rb', 'wb', 'r' or 'w'.
+        level (int): The compression level used when writing. Defaults to the codec's default.
+        encoding (str): The text encoding used in text modes.
+
+    Returns:
+        A file object reading or writing the uncompressed content.
+    """
+    if mode not in ('rb', 'wb', 'r', 'w'):
+        raise ValueError(f"Invalid mode: {mode}")
+
+    codec = get_compression(path)
+    binary_mode = mode[0] + 'b'
+    level = level if level is not None else DEFAULT_LEVELS.get(codec)
+
+    if codec is None:
+        return open(path, mode, encoding=encoding) if 'b' not in mode else open(path, mode)
+
+    if codec == 'gzip':
+        f = gzip.open(path, binary_mode, compresslevel=level) if binary_mode == 'wb' else gzip.open(path, binary_mode)
+    else:
+        zstandard = import_zstandard()
+        if binary_mode == 'wb':
+            f = zstandard.open(path, binary_mode, cctx=zstandard.ZstdCompressor(level=level))
+        else:
+            f = zstandard.open(path, binary_mode)
+
+    if 'b' in mode:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding)
+
+
+def decompress_bytes(path: str, data: bytes) -> bytes:
+    """Decompresses in-memory data read from a path with a compressed extension, returns other data unchanged"""
+    codec = get_compression(path)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        # A .zst file may hold several frames, as written by `zstd --rsyncable` or by concatenating files
+        reader = import_zstandard().ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+        with reader:
+            return reader.read()
+    return data
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import warnings
+import threading
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+
+class WorkCoordinator:
+    """
+    Shares the files of one run between any number of worker nodes through a sqlite database.
+
+    `plan()` splits the file list into batches in a work table. Workers `claim()` the next
+    pending batch with a lease of `lease_seconds`, renew it with `heartbeat()` while they work
+    and mark it `complete()` when its outputs are written. A batch whose lease runs out, because
+    its worker died or lost the store, is handed to the next worker that claims work.
+
+    A batch is tried at most `max_attempts` times. A batch whose processing raised goes back to
+    pending until it has used its attempts, and is then marked `failed` with the error, as is a
+    batch whose last lease expired, so one poison batch can't take down every worker in turn.
+
+    Paths are stored relative to the planned input directory, so nodes may mount the shared
+    storage at different paths. Claims run in an immediate transaction, which sqlite serialises
+    with a file lock, so the database can live on any storage with working file locks.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60, worker_id: Optional[str] = None, max_attempts: int = 3):
+        if max_attempts < 1:
+            raise ValueError(f"Invalid max attempts: {max_attempts}")
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def connect(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are started explicitly where they're needed
+        connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        connection.execute("""CREATE TABLE IF NOT EXISTS batches (
+            id INTEGER PRIMARY KEY,
+            files TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )""")
+
+        # Tables planned before batches could fail have no error column
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(batches)")]
+        if 'error' not in columns:
+            try:
+                connection.execute("ALTER TABLE batches ADD COLUMN error TEXT")
+            except sqlite3.OperationalError:
+                # Another worker added it first
+                pass
+        return connection
+
+    def plan(self, input_dir: str, file_paths: List[str], batch_size: int = 64) -> int:
+        """Adds the files to the work table in batches of batch_size, returns the number of batches"""
+        if batch_size < 1:
+            raise ValueError(f"Invalid batch size: {batch_size}")
+
+        rel_paths = [os.path.relpath(file_path, input_dir) for file_path in file_paths]
+        batches = [rel_paths[i:i + batch_size] for i in range(0, len(rel_paths), batch_size)]
+
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany("INSERT INTO batches (files) VALUES (?)",
+                                       [(json.dumps(batch),) for batch in batches])
+        finally:
+            connection.close()
+        return len(batches)
+
+    def claim(self) -> Optional[Tuple[int, List[str]]]:
+        """Leases the next pending or expired batch to this worker, returns (batch id, relative paths) or None when no work is left"""
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                now = time.time()
+
+                # A batch whose last allowed attempt ran out of lease most likely kills its workers
+                connection.execute(
+                    "UPDATE batches SET status = 'failed', lease_expires = NULL, "
+                    "error = COALESCE(error, 'lease expired') || ' after ' || attempts || ' attempts' "
+                    "WHERE status = 'claimed' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+
+                row = connection.execute(
+                    "SELECT id, files FROM batches WHERE status = 'pending' OR (status = 'claimed' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE batches SET status = 'claimed', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (self.worker_id, now + self.lease_seconds, row[0]))
+                return row[0], json.loads(row[1])
+        finally:
+            connection.close()
+
+    def heartbeat(self, batch_id: int) -> bool:
+        """Renews this worker's lease on a batch, returns False if the batch was reclaimed by another worker"""
+        return self.update_claimed(batch_id, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, batch_id: int) -> bool:
+        """Marks a batch leased to this worker as done, returns False if the batch was reclaimed by another worker"""
+        return self.update_claimed(batch_id, "status = 'done', lease_expires = NULL", ())
+
+    def fail(self, batch_id: int, error: str) -> bool:
+        """
+        Records that processing a batch leased to this worker raised. The batch goes back to pending,
+        or is marked failed once it has used max_attempts. Returns False if the batch was reclaimed by another worker.
+        """
+        return self.update_claimed(
+            batch_id, "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                      "worker = CASE WHEN attempts >= ? THEN worker END, lease_expires = NULL, error = ?",
+            (self.max_attempts, self.max_attempts, error))
+
+    def failures(self) -> List[Tuple[int, List[str], str]]:
+        """Returns (batch id, relative paths, error) for every failed batch"""
+        connection = self.connect()
+        try:
+            rows = connection.execute("SELECT id, files, error FROM batches WHERE status = 'failed' ORDER BY id").fetchall()
+        finally:
+            connection.close()
+        return [(batch_id, json.loads(files), error) for batch_id, files, error in rows]
+
+    def update_claimed(self, batch_id: int, assignments: str, params: tuple) -> bool:
+        connection = self.connect()
+        try:
+            cursor = connection.execute(
+                f"UPDATE batches SET {assignments} WHERE id = ? AND worker = ? AND status = 'claimed'",
+                params + (batch_id, self.worker_id))
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def progress(self) -> Dict[str, int]:
+        """Returns the number of batches in each status"""
+        connection = self.connect()
+        try:
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+        finally:
+            connection.close()
+        return {status: counts.get(status, 0) for status in ('pending', 'claimed', 'done', 'failed')}
+
+    def run_worker(self, parser) -> int:
+        """
+        Processes batches with the parser until none are left, returns the number of batches completed.
+
+        A background thread renews the lease every third of lease_seconds while a batch is processed.
+        While other workers still hold leases this worker waits rather than exiting, so it can take
+        over their batches if they die. A batch that raises is recorded with fail() and the worker
+        moves on to the next one.
+        """
+        os.makedirs(parser.output_dir, exist_ok=True)
+
+        completed = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if not self.progress()['claimed']:
+                    return completed
+                time.sleep(min(self.lease_seconds / 3, 1))
+                continue
+            batch_id, rel_paths = claimed
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self.keep_alive, args=(batch_id, stop), daemon=True)
+            heartbeat.start()
+            try:
+                parser.process_files_chunk([os.path.join(parser.input_dir, rel_path) for rel_path in rel_paths])
+            except Exception as e:
+                warnings.warn(f"Batch {batch_id} failed on worker {self.worker_id}: {e!r}")
+                self.fail(batch_id, repr(e))
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            if self.complete(batch_id):
+                completed += 1
+
+    def keep_alive(self, batch_id: int, stop: threading.Event) -> None:
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.heartbeat(batch_id):
+                return
+
+
+def run_worker(db_path: str, parser, lease_seconds: float, max_attempts: int = 3) -> int:
+    return WorkCoordinator(db_path, lease_seconds=lease_seconds, max_attempts=max_attempts).run_worker(parser)
+
+
+def run_workers(db_path: str, parser, lease_seconds: float = 60, max_attempts: int = 3) -> None:
+    """Runs parser.num_processes workers on this node, each claiming batches independently"""
+    if parser.num_processes <= 1:
+        run_worker(db_path, parser, lease_seconds, max_attempts)
+        return
+
+    processes = [multiprocessing.Process(target=run_worker, args=(db_path, parser, lease_seconds, max_attempts))
+                 for _ in range(parser.num_processes)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
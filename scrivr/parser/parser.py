@@ -1,20 +1,101 @@
 import os
+import sys
+import json
 import argparse
+import queue
+import importlib
 import multiprocessing
-from typing import List
+from collections import deque
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple, Union
 from .processing_rules import read_config_file
+from .compression import decompress_bytes, get_compression, open_file, strip_compression_extension
+from .workers import create_pool, parse_items, process_item, process_paths, process_source_partition
 import yaml
-import chardet
 import warnings
 
+# Run modes, input sources and telemetry are imported where they're used, so importing the parser
+# or starting the CLI only pays for the modules a run needs
+if TYPE_CHECKING:
+    from .sources import InputItem, InputSource
+    from .telemetry import ProgressReporter, RunMonitor
+
+
+def process_line_segment(args) -> List[str]:
+    """Runs a sequence of line-local rules over one segment of a document's lines"""
+    rules, lines = args
+    for rule in rules:
+        lines = rule.process_lines(lines)
+    return lines
+
+
+# Pools that segments of large documents are parsed on by the main process, by number of processes
+segment_pools = {}
+
+
+def get_segment_pool(num_processes: int):
+    """Returns the segment pool of num_processes, starting it on first use"""
+    if num_processes not in segment_pools:
+        segment_pools[num_processes] = multiprocessing.Pool(num_processes)
+    return segment_pools[num_processes]
+
+
+def split_lines(lines: List[str], segment_size: int) -> List[List[str]]:
+    """Splits lines into consecutive segments of roughly segment_size characters"""
+    segments = []
+    start = 0
+    size = 0
+    for i, line in enumerate(lines):
+        size += len(line) + 1
+        if size >= segment_size:
+            segments.append(lines[start:i + 1])
+            start = i + 1
+            size = 0
+    if start < len(lines) or not segments:
+        segments.append(lines[start:])
+    return segments
+
+
 class ScrivrParser:
-    def __init__(self, input_dir=None, output_dir=None, num_processes=1, config_path=None, output_filetype=''):
+    def __init__(self, input_dir=None, output_dir=None, num_processes=1, config_path=None, output_filetype='', input_source=None,
+                 compression_level=None, split_threshold=64 * 1024 * 1024, segment_size=4 * 1024 * 1024, batch_size=1,
+                 start_method=None, document_timeout=None, document_memory_limit=None, quarantine_dir=None,
+                 memory_budget=None, status_path=None, show_progress=False, stall_seconds=60):
         self.input_dir = input_dir
+        self.input_source = input_source
         self.output_dir = output_dir
         self.num_processes = num_processes
         self.config_path = config_path
         self.processing_rules = []
         self.output_filetype = output_filetype
+        self.compression_level = compression_level
+
+        # Documents longer than split_threshold characters run their line-local rules in segments across processes
+        self.split_threshold = split_threshold
+        self.segment_size = segment_size
+
+        # Workers parse batch_size documents at a time, running each rule over the whole batch
+        self.batch_size = batch_size
+
+        # With a start method, files are processed by a warm pool of workers started that way instead of one process per chunk
+        self.start_method = start_method
+
+        # With a per-document budget in seconds or bytes, files are processed by supervised workers
+        # that are killed and replaced when a document exceeds it, see DocumentSupervisor
+        self.document_timeout = document_timeout
+        self.document_memory_limit = document_memory_limit
+        self.quarantine_dir = quarantine_dir
+
+        # With a memory budget in bytes, supervised workers only start documents while the estimated
+        # memory of the documents in flight fits in it, see AdmissionScheduler
+        self.memory_budget = memory_budget
+
+        # Worker processes report progress to the parent when a status file or progress output is wanted, see RunMonitor
+        self.status_path = status_path
+        self.show_progress = show_progress
+        self.stall_seconds = stall_seconds
+
+        # Set by supervised workers to a shared value that tracks the index of the rule being run
+        self.rule_tracker = None
 
         if config_path:
             self.load_config()
@@ -32,86 +113,596 @@ class ScrivrParser:
                     self.num_processes = config['num_processes']
                 if 'output_filetype' in config:
                     self.output_filetype = config['output_filetype']
+                if 'compression_level' in config:
+                    self.compression_level = config['compression_level']
+                if 'split_threshold' in config:
+                    self.split_threshold = config['split_threshold']
+                if 'segment_size' in config:
+                    self.segment_size = config['segment_size']
+                if 'batch_size' in config:
+                    self.batch_size = config['batch_size']
+                if 'start_method' in config:
+                    self.start_method = config['start_method']
+                if 'document_timeout' in config:
+                    self.document_timeout = config['document_timeout']
+                if 'document_memory_limit' in config:
+                    self.document_memory_limit = config['document_memory_limit']
+                if 'memory_budget' in config:
+                    self.memory_budget = config['memory_budget']
+                if 'status_path' in config and not self.status_path:
+                    self.status_path = config['status_path']
+                if 'show_progress' in config:
+                    self.show_progress = config['show_progress']
+                if 'stall_seconds' in config:
+                    self.stall_seconds = config['stall_seconds']
+                if 'quarantine_dir' in config and not self.quarantine_dir:
+                    self.quarantine_dir = config['quarantine_dir']
+                if 'input_source' in config and not self.input_source:
+                    from .sources import create_input_source
+                    self.input_source = create_input_source(config['input_source'])
 
             self.processing_rules = read_config_file(self.config_path)
 
     def process_files(self) -> None:
         """Processes files in the input directory using the given processing rules and writes the results to the output directory"""
 
-        if not self.input_dir:
+        if not self.input_dir and not self.input_source:
             raise ValueError("No input directory specified.")
         if not self.output_dir:
             raise ValueError("No output directory specified.")
 
-        # Walk the input_dir for all files in all subdirectories
-        file_paths = []
-        for root, _, files in os.walk(self.input_dir):
-            if not files:
-                warnings.warn(f"No files found in input directory {self.input_dir}")
-            for filename in files:
-                file_paths.append(os.path.join(root, filename))
+        monitored = bool(self.status_path or self.show_progress)
+
+        # Input sources and archives are read in place rather than walked
+        from .sources import open_input_source
+        source = self.input_source or open_input_source(self.input_dir)
+        if source:
+            self.process_source(source)
+            return
+
+        file_paths = self.list_files()
 
         os.makedirs(self.output_dir, exist_ok=True)
 
+        if self.document_timeout or self.document_memory_limit or self.memory_budget:
+            from .supervisor import DocumentSupervisor
+            DocumentSupervisor(self, timeout=self.document_timeout, memory_limit=self.document_memory_limit,
+                               quarantine_dir=self.quarantine_dir, memory_budget=self.memory_budget,
+                               monitor=self.run_monitor(file_paths)).run(file_paths)
+            return
+
+        # Large documents are parsed first by this process, which spreads their segments over every
+        # process, and are reported to the monitor as one more worker after the others
+        file_paths, large_file_paths = self.split_large_files(file_paths)
+        monitor = self.run_monitor(file_paths + large_file_paths, extra_workers=1 if large_file_paths else 0)
+        self.process_large_files(large_file_paths, monitor)
+
+        if self.start_method:
+            self.process_files_pool(file_paths, monitor=monitor)
+            return
+
         chunks = [[] for _ in range(self.num_processes)]
 
         for i, file_path in enumerate(file_paths):
             chunks[i % self.num_processes].append(file_path)
 
+        progress_queue = multiprocessing.Queue() if monitored else None
+        if monitored:
+            from .telemetry import ProgressReporter
+
         processes = []
 
         for i in range(self.num_processes):
+            args = (chunks[i], ProgressReporter(progress_queue, i)) if monitored else (chunks[i],)
             p = multiprocessing.Process(
-                target=self.process_files_chunk, args=(chunks[i],)
+                target=self.process_files_chunk, args=args
             )
             p.start()
             processes.append(p)
 
+        if monitored:
+            monitor.watch(processes, progress_queue)
+
         for p in processes:
             p.join()
 
-    def process_files_chunk(self, file_paths: List[str]) -> None:
-        """Processes files using the provided processing rules and saves the results to the output directory"""
+    def list_files(self) -> List[str]:
+        """Walks the input_dir for all files in all subdirectories"""
+        file_paths = []
+        for root, _, files in os.walk(self.input_dir):
+            if not files:
+                warnings.warn(f"No files found in input directory {self.input_dir}")
+            for filename in files:
+                file_paths.append(os.path.join(root, filename))
+        return file_paths
+
+    def run_monitor(self, file_paths: Optional[List[str]], extra_workers: int = 0,
+                    files_total: Optional[int] = None) -> Optional['RunMonitor']:
+        """
+        Returns a RunMonitor for a run over the files if status_path or show_progress is set, following
+        num_processes workers and extra_workers more numbered after them. Runs over an input source pass
+        None for file_paths, with the number of documents in files_total if it's known.
+        """
+        if not (self.status_path or self.show_progress):
+            return None
+        from .telemetry import RunMonitor
+        return RunMonitor(file_paths, max(1, self.num_processes) + extra_workers, status_path=self.status_path,
+                          show_progress=self.show_progress, stall_seconds=self.stall_seconds, files_total=files_total)
+
+    def split_large_files(self, file_paths: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Returns (file paths, large file paths), where large files are over split_threshold bytes and
+        would be parsed in segments. The size of compressed files is their compressed size.
+        """
+        if not self.segments_enabled():
+            return file_paths, []
+        large = [file_path for file_path in file_paths if os.path.getsize(file_path) > self.split_threshold]
+        if not large:
+            return file_paths, []
+        large_set = set(large)
+        return [file_path for file_path in file_paths if file_path not in large_set], large
+
+    def process_large_files(self, file_paths: List[str], monitor: Optional['RunMonitor'] = None) -> None:
+        """
+        Processes large files one at a time in this process, so parse_text spreads the segments of
+        each over the segment pool rather than a worker running them one after another. With a
+        monitor, they're reported as the worker numbered after the num_processes others.
+        """
+        if not file_paths:
+            return
+        worker = max(1, self.num_processes)
         for file_path in file_paths:
-            base_name, ext = os.path.splitext(os.path.basename(file_path))
+            self.process_file(file_path)
+            if monitor:
+                monitor.update('file', worker, file_path, os.path.getsize(file_path))
+                monitor.report()
+        if monitor:
+            monitor.update('done', worker, None, 0)
+
+    def process_files_pool(self, file_paths: List[str], monitor: Optional['RunMonitor'] = None) -> None:
+        """
+        Processes files on a warm worker pool, handing out small chunks of paths so workers stay balanced.
+        With a monitor, workers report each file as it's written.
+        """
+        chunk_size = max(self.batch_size, 16)
+        chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+        progress_queue = multiprocessing.get_context(self.start_method).Queue() if monitor else None
+        with create_pool(self, self.start_method, progress_queue) as pool:
+            if monitor:
+                result = pool.map_async(process_paths, chunks)
+                monitor.watch_result(result, progress_queue)
+                result.get()
+                return
+            for _ in pool.imap_unordered(process_paths, chunks):
+                pass
+
+    def required_modules(self) -> List[str]:
+        """Returns the modules the configured rules and decoding import when they run"""
+        modules = ['chardet']
+        for rule in self.processing_rules:
+            modules.extend(module for module in rule.requires if module not in modules)
+        return modules
+
+    def preload(self) -> None:
+        """Imports the modules required by the configured rules, so the first document doesn't pay for them"""
+        for module in self.required_modules():
+            importlib.import_module(module)
+
+    def process_files_chunk(self, file_paths: List[str], progress: Optional['ProgressReporter'] = None) -> None:
+        """
+        Processes files using the provided processing rules and saves the results to the output directory.
+        A progress reporter is started for the chunk and stopped once it's done.
+        """
+        if progress:
+            progress.start()
+        try:
+            self.process_file_paths(file_paths, progress)
+        finally:
+            if progress:
+                progress.stop()
+
+    def process_file_paths(self, file_paths: List[str], progress: Optional['ProgressReporter'] = None) -> None:
+        """Processes files like process_files_chunk, reporting each to a running progress reporter as it's written"""
+        if self.batch_size > 1:
+            for start in range(0, len(file_paths), self.batch_size):
+                batch = file_paths[start:start + self.batch_size]
+                parsed_texts = self.parse_texts([self.read_file(file_path) for file_path in batch])
+                for file_path, parsed_text in zip(batch, parsed_texts):
+                    if parsed_text is not None:
+                        self.write_output(self.get_output_path(os.path.basename(file_path)), parsed_text)
+                    if progress:
+                        progress.file_done(file_path)
+            return
+
+        for file_path in file_paths:
+            self.process_file(file_path)
+            if progress:
+                progress.file_done(file_path)
+
+    def process_file(self, file_path: str) -> None:
+        """Processes a file and saves the result to the output directory"""
+        output_file_path = self.get_output_path(os.path.basename(file_path))
+
+        parsed_text = self.parse_file(file_path)
+
+        # Documents dropped by a filter rule have no output
+        if parsed_text is not None:
+            self.write_output(output_file_path, parsed_text)
+
+    def write_output(self, output_file_path: str, text: str) -> None:
+        """Writes parsed text, compressing it if the output path ends in .gz or .zst"""
+        with open_file(output_file_path, "w", level=self.compression_level) as f:
+            f.write(text)
+
+    def get_output_path(self, relative_path: str, output_dir: Optional[str] = None) -> str:
+        """Returns the output path for a relative input path under output_dir, or the parser's, applying output_filetype"""
+        output_dir = output_dir or self.output_dir
+        base_name, ext = os.path.splitext(relative_path)
+
+        # Compressed inputs keep their name, unless output_filetype replaces the extension under the compression one
+        if self.output_filetype and get_compression(relative_path):
+            base_name, ext = os.path.splitext(strip_compression_extension(relative_path))
+
+        output_file_path = os.path.join(output_dir, "{}{}".format(base_name, ext))
 
-            output_file_path = os.path.join(self.output_dir, "{}{}".format(base_name, ext))
+        # Modify output_file_path extension if output_filetype is not empty
+        if self.output_filetype:
+            output_file_root = os.path.join(output_dir, base_name)
 
-            # Modify output_file_path extension if output_filetype is not empty
-            if self.output_filetype:
-                output_file_root = os.path.join(self.output_dir, base_name)
+            # Avoid creating `file..txt` if output_filetype starts with '.'
+            ext = self.output_filetype[1:] if self.output_filetype.startswith(".") else self.output_filetype
+            output_file_path = output_file_root + '.' + ext
 
-                # Avoid creating `file..txt` if output_filetype starts with '.'
-                ext = self.output_filetype[1:] if self.output_filetype.startswith(".") else self.output_filetype
-                output_file_path = output_file_root + '.' + ext
+        return output_file_path
 
-            parsed_text = self.parse_file(file_path)
+    def process_source(self, source: 'InputSource') -> None:
+        """
+        Processes every document in an archive or repository without extracting it.
 
-            with open(output_file_path, "w") as f:
-                f.write(parsed_text)
+        Archives that allow random access are split by member offset and each worker reads its
+        own members. Stream-only archives are read by this process and the documents parsed by
+        the pool, with a bounded number in flight. Every output's archive and member is recorded
+        in `provenance.jsonl` in the output directory.
+
+        With status_path or show_progress set, workers report each document as it's written. The
+        number of documents is only known up front for partitioned sources.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        records = []
+        partitions = source.partitions(self.num_processes)
+        monitor = self.run_monitor(None, files_total=sum(len(p) for p in partitions) if partitions else None)
+        progress_queue = multiprocessing.get_context(self.start_method).Queue() if monitor else None
+        # Workers get the parser once from the pool initializer rather than with every task
+        with create_pool(self, self.start_method, progress_queue) as pool:
+            if partitions:
+                result = pool.map_async(process_source_partition, [(source, p) for p in partitions])
+                if monitor:
+                    monitor.watch_result(result, progress_queue)
+                for partition_records in result.get():
+                    records.extend(partition_records)
+            else:
+                pending = deque()
+                for item in source.iter_items():
+                    pending.append(pool.apply_async(process_item, (item,)))
+                    if len(pending) >= self.num_processes * 4:
+                        records.append(self.wait_for_result(pending.popleft(), monitor, progress_queue))
+                while pending:
+                    records.append(self.wait_for_result(pending.popleft(), monitor, progress_queue))
+                if monitor:
+                    # Messages sent just before the last document finished may still be in the queue
+                    monitor.poll(progress_queue, timeout=0.1)
+                    monitor.finish()
+
+        with open(os.path.join(self.output_dir, "provenance.jsonl"), "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def wait_for_result(result, monitor: Optional['RunMonitor'] = None, progress_queue=None):
+        """Returns the value of a pool's async result, following the monitor's messages while it waits"""
+        if monitor:
+            while not result.ready():
+                result.wait(1.0)
+                monitor.poll(progress_queue)
+        return result.get()
+
+    def process_source_partition(self, args, progress: Optional['ProgressReporter'] = None) -> List[dict]:
+        """
+        Processes the members of one partition of an input source, returns their provenance records.
+        Each document is reported to a running progress reporter as it's written.
+        """
+        source, partition = args
+        records = []
+        if self.batch_size <= 1:
+            for item in source.iter_items(partition):
+                records.append(self.process_item(item))
+                self.report_items([item], progress)
+            return records
+
+        batch = []
+        for item in source.iter_items(partition):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                records.extend(self.process_items(batch))
+                self.report_items(batch, progress)
+                batch = []
+        if batch:
+            records.extend(self.process_items(batch))
+            self.report_items(batch, progress)
+        return records
+
+    @staticmethod
+    def report_items(items: List['InputItem'], progress: Optional['ProgressReporter'] = None) -> None:
+        if progress:
+            for item in items:
+                progress.file_done(item.name, len(item.data))
+
+    def process_items(self, items: List['InputItem']) -> List[dict]:
+        """Parses a batch of documents read from an input source and writes them to the output directory"""
+        parsed_texts = self.parse_texts([self.decode_bytes(decompress_bytes(item.name, item.data)) for item in items])
+        return [self.write_item(item, parsed_text) for item, parsed_text in zip(items, parsed_texts)]
+
+    def process_item(self, item: 'InputItem') -> dict:
+        """Parses a document read from an input source and writes it to the output directory"""
+        return self.write_item(item, self.parse_bytes(decompress_bytes(item.name, item.data)))
+
+    def write_item(self, item: 'InputItem', parsed_text: str) -> dict:
+        """Writes a parsed input source document to the output directory, returns its provenance record"""
+        if parsed_text is None:
+            return dict(item.provenance, output=None)
+
+        output_file_path = self.get_output_path(item.name)
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+
+        self.write_output(output_file_path, parsed_text)
+
+        return dict(item.provenance, output=os.path.relpath(output_file_path, self.output_dir))
 
 
+    def parse_iter(self, items: Iterable[Tuple[str, Union[bytes, str]]], ordered: bool = True,
+                   prefetch: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Parses in-memory documents, yielding (id, parsed text) for each (id, bytes or str) item.
+        The parsed text is None for documents dropped by a filter rule.
+
+        With num_processes of 1 documents are parsed in this process as they are read. Otherwise
+        batches of batch_size documents are parsed on a worker pool, with at most `prefetch`
+        batches (default 4 per process) read ahead of the results consumed. Results come in input
+        order, or as they complete when `ordered` is False. Nothing is written to disk.
+        """
+        batches = self.iter_batches(items)
+
+        if self.num_processes <= 1:
+            for batch in batches:
+                yield from self.parse_items(batch)
+            return
+
+        prefetch = prefetch or self.num_processes * 4
+        with create_pool(self, self.start_method) as pool:
+            if ordered:
+                pending = deque()
+                for batch in batches:
+                    pending.append(pool.apply_async(parse_items, (batch,)))
+                    if len(pending) >= prefetch:
+                        yield from pending.popleft().get()
+                while pending:
+                    yield from pending.popleft().get()
+                return
+
+            # Workers put their results, or the exception they raised, on a queue as they finish
+            completed = queue.Queue()
+
+            def next_completed():
+                result = completed.get()
+                if isinstance(result, BaseException):
+                    raise result
+                return result
+
+            in_flight = 0
+            for batch in batches:
+                pool.apply_async(parse_items, (batch,), callback=completed.put, error_callback=completed.put)
+                in_flight += 1
+                if in_flight >= prefetch:
+                    yield from next_completed()
+                    in_flight -= 1
+            for _ in range(in_flight):
+                yield from next_completed()
+
+    def iter_batches(self, items: Iterable[tuple]) -> Iterator[List[tuple]]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def parse_items(self, items: List[Tuple[str, Union[bytes, str]]]) -> List[Tuple[str, str]]:
+        """Parses a batch of (id, bytes or str) documents, returns (id, parsed text) for each"""
+        texts = [self.decode_bytes(data) if isinstance(data, bytes) else data for _, data in items]
+        if len(texts) == 1:
+            return [(items[0][0], self.parse_text(texts[0]))]
+        return [(item_id, text) for (item_id, _), text in zip(items, self.parse_texts(texts))]
+
     def parse_file(self, file_path: str) -> str:
-        """Parses a file using the provided processing rules"""
+        """Parses a file using the provided processing rules, decompressing .gz and .zst files"""
 
-        with open(file_path, "rb") as f:
-            bytes = f.read()
-            encoding = chardet.detect(bytes)["encoding"]
-        with open(file_path, "r", encoding=encoding) as f:
-            text = f.read()
+        return self.parse_text(self.read_file(file_path))
 
-        for rule in self.processing_rules:
+    def read_file(self, file_path: str) -> str:
+        """Reads a file as text, decompressing .gz and .zst files"""
+
+        with open_file(file_path, "rb") as f:
+            return self.decode_bytes(f.read())
+
+    def decode_bytes(self, data: bytes) -> str:
+        """Decodes raw bytes with their detected encoding"""
+        import chardet
+
+        encoding = chardet.detect(data)["encoding"] or "utf-8"
+
+        # Match the universal newlines translation of reading the file in text mode
+        return data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
+    def parse_bytes(self, data: bytes) -> str:
+        """Decodes raw bytes with their detected encoding and parses the text using the provided processing rules"""
+
+        return self.parse_text(self.decode_bytes(data))
+
+    def parse_text(self, text: str) -> str:
+        """Parses text using the provided processing rules, returns None if a filter rule drops it"""
+
+        if self.should_segment(text):
+            return self.parse_text_segmented(text)
+
+        for index, rule in enumerate(self.processing_rules):
+            if self.rule_tracker is not None:
+                self.rule_tracker.value = index
             text = rule.process(text)
+            if text is None:
+                return None
+
+        return text
+
+    def parse_texts(self, texts: List[str]) -> List[str]:
+        """
+        Parses a batch of texts, running each rule over the whole batch at once.
+
+        The results are identical to calling parse_text on each text. Documents large enough
+        to be split into segments are parsed on their own.
+        """
+
+        results = list(texts)
+        batch = [i for i, text in enumerate(texts) if not self.should_segment(text)]
+
+        batch_texts = [texts[i] for i in batch]
+        for rule in self.processing_rules:
+            batch_texts = rule.process_batch(batch_texts)
+
+            # Documents dropped by a filter rule leave the batch
+            if None in batch_texts:
+                for i, text in zip(batch, batch_texts):
+                    if text is None:
+                        results[i] = None
+                kept = [(i, text) for i, text in zip(batch, batch_texts) if text is not None]
+                batch = [i for i, _ in kept]
+                batch_texts = [text for _, text in kept]
+        for i, text in zip(batch, batch_texts):
+            results[i] = text
+
+        for i, text in enumerate(texts):
+            if self.should_segment(text):
+                results[i] = self.parse_text_segmented(text)
+
+        return results
+
+    def should_segment(self, text: str) -> bool:
+        """Returns whether text is large enough to run its line-local rules in segments"""
+        return len(text) > (self.split_threshold or 0) and self.segments_enabled()
+
+    def segments_enabled(self) -> bool:
+        """Returns whether large documents are parsed in segments at all"""
+        return bool(self.split_threshold and self.num_processes > 1 and any(rule.line_local for rule in self.processing_rules))
+
+    def parse_text_segmented(self, text: str) -> str:
+        """
+        Parses a large document, running line-local rules over segments of it in parallel.
+
+        Consecutive line-local rules are run together on each segment of lines, and the segments
+        joined back in order. Rules that need the whole document run on the joined text in between.
+        The result is identical to processing it whole.
+
+        In the main process segments are spread over a pool of num_processes, started once and
+        reused for every large document. process_files parses large files there for this reason.
+        Worker processes, which already run alongside num_processes - 1 others, run the segments
+        one after another themselves.
+        """
+        if multiprocessing.parent_process() is None:
+            map_segments = get_segment_pool(self.num_processes).imap
+        else:
+            map_segments = map
+
+        rules = self.processing_rules
+        i = 0
+        while i < len(rules):
+            if not rules[i].line_local:
+                text = rules[i].process(text)
+                if text is None:
+                    return None
+                i += 1
+                continue
+
+            # Collect the run of consecutive line-local rules starting here
+            j = i
+            while j < len(rules) and rules[j].line_local:
+                j += 1
+            run = rules[i:j]
+
+            segments = split_lines(text.split("\n"), self.segment_size)
+            lines = []
+            for segment in map_segments(process_line_segment, [(run, segment) for segment in segments]):
+                lines.extend(segment)
+            text = "\n".join(lines)
+            i = j
 
         return text
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process some files.")
-    parser.add_argument("-i", "--input_dir", help="the directory containing the files to process")
+    parser.add_argument("-i", "--input_dir", help="the directory, or tar/zip/WARC archive, containing the files to process")
     parser.add_argument("-o", "--output_dir", help="the directory to write the processed files to")
-    parser.add_argument("-f", "--output_filetype", help="The extension type of outputted files")
+    parser.add_argument("-f", "--output_filetype", help="The extension type of outputted files, ending in .gz or .zst to compress them")
+    parser.add_argument("-l", "--compression_level", type=int, help="the compression level for compressed outputs")
     parser.add_argument("-n", "--num_processes", type=int, default=1, help="the number of processes to use for processing files")
+    parser.add_argument("-b", "--batch_size", type=int, default=1, help="the number of documents each process parses at a time")
     parser.add_argument("-c", "--config_path", help="the path to the config file to use for processing rules")
+    parser.add_argument("-s", "--start_method", choices=["fork", "forkserver", "spawn"], help="process files on a warm worker pool started with this method")
+    parser.add_argument("-g", "--git_repo", action="append", help="a local git repository to read files from instead of input_dir, may be repeated")
+    parser.add_argument("--git_ref", default="HEAD", help="the ref to read git repository files at")
+    parser.add_argument("--git_extension", action="append", help="only read git repository files with this extension, may be repeated")
+    parser.add_argument("--document_timeout", type=float, help="seconds a document may take before its worker is killed and the document quarantined")
+    parser.add_argument("--document_memory_limit", type=int, help="bytes of memory a worker may use on a document before it is killed and the document quarantined")
+    parser.add_argument("--memory_budget", type=int, help="bytes of estimated document memory all workers may use at once, larger files wait for smaller ones to finish")
+    parser.add_argument("--quarantine_dir", help="the directory quarantined documents and their report are written to, defaults to output_dir/quarantine")
+    parser.add_argument("--status_path", help="a JSON file the run's progress, throughput, ETA and worker heartbeats are written to")
+    parser.add_argument("--progress", action="store_true", help="print progress, throughput and ETA to stderr during the run")
+    parser.add_argument("--stall_seconds", type=float, default=60, help="seconds without a heartbeat before a worker is flagged as stalled")
+    parser.add_argument("--autotune", choices=["apply", "write"], help="time worker counts and batch sizes on a sample of the input files, then process with the best ('apply') or write them to the config file ('write')")
+    parser.add_argument("--plan", metavar="DB_PATH", help="plan the files of input_dir into a shared sqlite work table instead of processing them")
+    parser.add_argument("--plan_batch_size", type=int, default=64, help="the number of files in each planned batch")
+    parser.add_argument("--worker", metavar="DB_PATH", help="process batches claimed from a shared sqlite work table, with num_processes workers")
+    parser.add_argument("--lease_seconds", type=float, default=60, help="how long a claimed batch is leased to a worker between heartbeats")
+    parser.add_argument("--max_attempts", type=int, default=3, help="how many times a batch is tried before it is marked failed")
     args = parser.parse_args()
 
-    ScrivrParser(input_dir=args.input_dir, output_dir=args.output_dir, num_processes=args.num_processes, config_path=args.config_path, output_filetype=args.output_filetype).process_files()
+    if args.git_repo:
+        from .sources import GitSource
+    input_source = GitSource(args.git_repo, ref=args.git_ref, extensions=args.git_extension) if args.git_repo else None
+
+    scrivr = ScrivrParser(input_dir=args.input_dir, output_dir=args.output_dir, num_processes=args.num_processes, config_path=args.config_path, output_filetype=args.output_filetype, input_source=input_source, compression_level=args.compression_level, batch_size=args.batch_size, start_method=args.start_method, document_timeout=args.document_timeout, document_memory_limit=args.document_memory_limit, quarantine_dir=args.quarantine_dir, memory_budget=args.memory_budget, status_path=args.status_path, show_progress=args.progress, stall_seconds=args.stall_seconds)
+
+    if args.autotune:
+        from .autotune import AutoTuner
+        tuner = AutoTuner(scrivr)
+        results = tuner.run(scrivr.list_files())
+        best = tuner.best(results)
+        print(AutoTuner.format_results(results), file=sys.stderr)
+        print(f"Best: num_processes={best['num_processes']} batch_size={best['batch_size']}", file=sys.stderr)
+        if args.autotune == "write":
+            if not args.config_path:
+                parser.error("--autotune write requires a config file")
+            AutoTuner.write_config(args.config_path, best)
+            sys.exit()
+        tuner.apply(best)
+
+    if args.plan:
+        from .coordinator import WorkCoordinator
+        num_batches = WorkCoordinator(args.plan).plan(scrivr.input_dir, scrivr.list_files(), batch_size=args.plan_batch_size)
+        print(f"Planned {num_batches} batches in {args.plan}")
+    elif args.worker:
+        from .coordinator import run_workers
+        run_workers(args.worker, scrivr, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    else:
+        scrivr.process_files()
@@ -1,24 +1,79 @@
 import re
 import yaml
-import pypandoc
 import os
 import warnings
-from bs4 import BeautifulSoup
+
+# Line placed between documents when a batch of them is processed as one list of lines
+BATCH_BOUNDARY = "\x00scrivr-document-boundary\x00"
 
 class ProcessingRule:
+    # Modules the rule imports when it runs, preloaded by worker processes before any work starts
+    requires = ()
+
+    # Line-local rules transform each line independently of the rest of the document,
+    # so a document can be split at any line boundary and processed in segments
+    line_local = False
+
+    # Estimated peak memory of running the rule, as a multiple of the document's size
+    memory_factor = 2
+
     def process(self):
         pass
 
+    def process_lines(self, lines):
+        """Processes a list of lines, only supported by line-local rules"""
+        raise NotImplementedError(f"{type(self).__name__} is not line-local")
+
+    def process_batch(self, texts):
+        """
+        Processes a batch of documents, returning exactly what process() returns for each.
+
+        Line-local rules process the whole batch in a single pass over the concatenated lines
+        of every document, separated by a boundary line. Other rules, or batches where the
+        boundary line wouldn't survive the rule unchanged, are processed one document at a time.
+        """
+        if not self.line_local or len(texts) < 2 or any(BATCH_BOUNDARY in text for text in texts) \
+                or self.process_lines([BATCH_BOUNDARY]) != [BATCH_BOUNDARY]:
+            return [self.process(text) for text in texts]
+
+        lines = []
+        for text in texts:
+            lines.extend(text.split("\n"))
+            lines.append(BATCH_BOUNDARY)
+
+        results = []
+        document = []
+        for line in self.process_lines(lines):
+            if line == BATCH_BOUNDARY:
+                results.append("\n".join(document))
+                document = []
+            else:
+                document.append(line)
+        return results
+
 class RemoveDuplicateEmptyLinesRule(ProcessingRule):
+    line_local = True
+
     def process(self, text):
-        return "\n".join(filter(lambda x: x.strip(), text.split("\n")))
+        return "\n".join(self.process_lines(text.split("\n")))
+
+    def process_lines(self, lines):
+        return [line for line in lines if line.strip()]
 
 class HtmlToMarkdownRule(ProcessingRule):
+    requires = ('pypandoc',)
+    memory_factor = 10
+
     def process(self, text):
+        import pypandoc
         return pypandoc.convert_text(text, 'md', format='html')
 
 class HtmlVisibleTextRule(ProcessingRule):
+    requires = ('bs4',)
+    memory_factor = 10
+
     def process(self, html: str) -> str:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html, 'html.parser')
         for element in soup.find_all(['script', 'style', 'head', 'title', 'meta', 'link']):
             element.extract()
@@ -31,6 +86,12 @@ class ActionableRule(ProcessingRule):
         self.match = match
         self.action = action
 
+    def delete_lines_containing(self, lines, matches):
+        """Line-local equivalent of applying delete_line for every string in matches found in the text"""
+        # A match spanning lines is never contained in a single line, so it deletes nothing
+        matches = [match for match in matches if "\n" not in match]
+        return [line for line in lines if not any(match in line for match in matches)]
+
     def apply_action(self, text, match, replacement=""):
         if self.action == "delete":
             match = re.escape(match)
@@ -60,17 +121,32 @@ class MatchMultipleStringsAndActionRule(ActionableRule):
         super().__init__(match, action)
         self.path = path
 
-    def process(self, text):
+    @property
+    def line_local(self):
+        return self.action == "delete_line"
+
+    def read_path(self):
+        """Adds the contents of every file in path to the match strings, returns False if path is invalid"""
         if self.path:
             if not os.path.isdir(self.path):
                 warnings.warn(f"WARNING: Provided path '{self.path}' is invalid.")
-                return text
+                return False
 
             # If path is provided, read all files in the directory and concatenate their text
             for root, _, files in os.walk(self.path):
                 for file in files:
                     with open(os.path.join(root, file), "r") as f:
                         self.match.append(f.read())
+        return True
+
+    def process_lines(self, lines):
+        if not self.read_path():
+            return lines
+        return self.delete_lines_containing(lines, self.match)
+
+    def process(self, text):
+        if not self.read_path():
+            return text
 
         for match in self.match:
             match = re.escape(match)
@@ -85,14 +161,29 @@ class MatchStringsAction(ActionableRule):
         super().__init__(match_strings, action)
         self.path = path
 
-    def process(self, text):
+    @property
+    def line_local(self):
+        return self.action == "delete_line"
+
+    def read_path(self):
+        """Adds every line of the file at path to the match strings, returns False if path is invalid"""
         if self.path:
             if not os.path.isfile(self.path):
                 warnings.warn(f"WARNING: Provided path '{self.path}' is invalid.")
-                return text
+                return False
             with open(self.path, "r") as f:
                 file_strings = f.read().splitlines()
                 self.match.extend(file_strings)
+        return True
+
+    def process_lines(self, lines):
+        if not self.read_path():
+            return lines
+        return self.delete_lines_containing(lines, self.match)
+
+    def process(self, text):
+        if not self.read_path():
+            return text
 
         for match in self.match:
             match = re.escape(match)
@@ -102,19 +193,25 @@ class MatchStringsAction(ActionableRule):
         return text
 
 class DeleteTextAfterMatch(ProcessingRule):
+    line_local = True
+
     def __init__(self, match_string: str):
         self.match_string = match_string
 
     def process(self, text: str) -> str:
-        lines = text.split("\n")
+        return "\n".join(self.process_lines(text.split("\n")))
+
+    def process_lines(self, lines):
         new_lines = []
         for line in lines:
             if self.match_string in line:
                 line = line.split(self.match_string)[0]
             new_lines.append(line)
-        return "\n".join(new_lines)
+        return new_lines
 
 class TableFromPattern(ProcessingRule):
+    memory_factor = 4
+
     def process(self, text: str) -> str:
 
         # Loop this as many times as a convertable table is found
@@ -157,6 +254,136 @@ class TableFromPattern(ProcessingRule):
             lines[start_idx:start_idx] = ["\n".join([table_header, table_delim] + table_body)]
             text = "\n".join(lines)
 
+class QualityFilterRule(ProcessingRule):
+    """
+    Drops or tags low quality documents, like menu-only pages, symbol soup or repeated lines.
+
+    Features are computed for a whole batch at once with NumPy:
+
+    - alpha_ratio: alphabetic characters over non-whitespace characters
+    - line_repetition: fraction of non-empty lines repeating an earlier line of the document
+    - mean_word_length: mean length of the whitespace separated words
+    - ngram_repetition: fraction of word n-grams repeating an earlier n-gram of the document
+
+    A document fails when a feature is below its `min_` or above its `max_` threshold. Failing
+    documents are dropped (process returns None) with `action: drop`, or get a first line
+    listing the failed features with `action: tag`. Empty documents have every feature at 0.
+    """
+    requires = ('numpy',)
+    memory_factor = 8
+
+    THRESHOLDS = {
+        'min_alpha_ratio': ('alpha_ratio', min),
+        'max_line_repetition': ('line_repetition', max),
+        'min_mean_word_length': ('mean_word_length', min),
+        'max_mean_word_length': ('mean_word_length', max),
+        'max_ngram_repetition': ('ngram_repetition', max),
+    }
+
+    def __init__(self, action="drop", ngram_size=3, tag_format="<!-- low quality: {reasons} -->", **thresholds):
+        if action not in ("drop", "tag"):
+            raise ValueError(f"Invalid quality filter action: {action}")
+        if not isinstance(ngram_size, int) or isinstance(ngram_size, bool) or ngram_size < 1:
+            raise ValueError(f"Invalid quality filter ngram_size: {ngram_size}")
+        unknown = set(thresholds) - set(self.THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Invalid quality filter thresholds: {sorted(unknown)}")
+        self.action = action
+        self.ngram_size = ngram_size
+        self.tag_format = tag_format
+        self.thresholds = thresholds
+
+    def process(self, text):
+        return self.process_batch([text])[0]
+
+    def process_batch(self, texts):
+        if not texts:
+            return []
+        features = self.features(texts)
+
+        results = []
+        for i, text in enumerate(texts):
+            reasons = []
+            for threshold, limit in self.thresholds.items():
+                feature, bound = self.THRESHOLDS[threshold]
+                value = float(features[feature][i])
+                if (bound is min and value < limit) or (bound is max and value > limit):
+                    reasons.append(f"{feature}={value:.3f}")
+
+            if not reasons:
+                results.append(text)
+            elif self.action == "drop":
+                results.append(None)
+            else:
+                results.append(self.tag_format.format(reasons=", ".join(reasons)) + "\n" + text)
+        return results
+
+    def features(self, texts):
+        """Returns {feature name: array with the feature's value for each text}"""
+        import numpy as np
+
+        num_texts = len(texts)
+
+        # Character classes, looked up in a table for ASCII and per distinct code point otherwise
+        codes = np.frombuffer("".join(texts).encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+        ascii_alpha = np.array([chr(c).isalpha() for c in range(128)])
+        ascii_space = np.array([chr(c).isspace() for c in range(128)])
+        is_alpha = ascii_alpha[np.minimum(codes, 127)]
+        is_space = ascii_space[np.minimum(codes, 127)]
+        non_ascii = codes > 127
+        if non_ascii.any():
+            unique, inverse = np.unique(codes[non_ascii], return_inverse=True)
+            is_alpha[non_ascii] = np.array([chr(c).isalpha() for c in unique])[inverse]
+            is_space[non_ascii] = np.array([chr(c).isspace() for c in unique])[inverse]
+
+        bounds = np.concatenate([[0], np.cumsum([len(text) for text in texts])])
+        alpha = np.diff(np.concatenate([[0], np.cumsum(is_alpha)])[bounds])
+        non_space = np.diff(np.concatenate([[0], np.cumsum(~is_space)])[bounds])
+
+        # Words and lines are hashed, so repetitions can be counted with np.unique per document
+        words = [text.split() for text in texts]
+        word_counts = np.array([len(doc_words) for doc_words in words])
+        word_docs = np.repeat(np.arange(num_texts), word_counts)
+        word_hashes = np.array([hash(word) for doc_words in words for word in doc_words], dtype=np.int64)
+
+        lines = [[line.strip() for line in text.split("\n") if line.strip()] for text in texts]
+        line_docs = np.repeat(np.arange(num_texts), [len(doc_lines) for doc_lines in lines])
+        line_hashes = np.array([hash(line) for doc_lines in lines for line in doc_lines], dtype=np.int64)
+
+        n = self.ngram_size
+        if len(word_hashes) >= n:
+            ngram_hashes = np.zeros(len(word_hashes) - n + 1, dtype=np.uint64)
+            for k in range(n):
+                ngram_hashes = ngram_hashes * np.uint64(1000003) + word_hashes[k:len(word_hashes) - n + 1 + k].view(np.uint64)
+            ngram_docs = word_docs[:len(ngram_hashes)]
+            within_doc = ngram_docs == word_docs[n - 1:]
+            ngram_hashes, ngram_docs = ngram_hashes[within_doc].view(np.int64), ngram_docs[within_doc]
+        else:
+            ngram_hashes, ngram_docs = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        return {
+            'alpha_ratio': self.ratio(alpha, non_space),
+            'line_repetition': self.repetition(line_docs, line_hashes, num_texts),
+            'mean_word_length': self.ratio(non_space, word_counts),
+            'ngram_repetition': self.repetition(ngram_docs, ngram_hashes, num_texts),
+        }
+
+    @staticmethod
+    def ratio(numerator, denominator):
+        import numpy as np
+        return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+    @staticmethod
+    def repetition(docs, hashes, num_texts):
+        """Returns the fraction of each document's hashes that repeat an earlier one"""
+        import numpy as np
+        total = np.bincount(docs, minlength=num_texts)
+        if not len(docs):
+            return np.zeros(num_texts)
+        distinct = np.unique(np.stack([docs, hashes], axis=1), axis=0)
+        repeated = total - np.bincount(distinct[:, 0], minlength=num_texts)
+        return QualityFilterRule.ratio(repeated, total)
+
 
 def create_processing_rule(rule_config):
     """
@@ -0,0 +1,352 @@
+import os
+import gzip
+import hashlib
+import fnmatch
+import tarfile
+import zipfile
+import subprocess
+from typing import Iterator, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+
+class InputItem(NamedTuple):
+    """A document read from an input source, with where it came from"""
+    name: str
+    data: bytes
+    provenance: dict
+
+
+def url_to_path(url: str) -> str:
+    """
+    Returns a relative file path mirroring a url, `<host>/<path>` with `index.html` for directories.
+
+    Urls that only differ by query string get the first 8 hex digits of a hash of the query
+    appended to the file name, so they don't overwrite each other.
+    """
+    parsed = urlparse(url)
+    path = parsed.path
+    if not path or path.endswith('/'):
+        path += 'index.html'
+    if parsed.query:
+        root, ext = os.path.splitext(path)
+        path = f"{root}_{hashlib.sha1(parsed.query.encode('utf-8')).hexdigest()[:8]}{ext}"
+    return os.path.join(parsed.netloc.replace(':', '_'), path.lstrip('/'))
+
+
+def safe_member_name(name: str) -> Optional[str]:
+    """Normalizes an archive member name to a relative path, returns None for names escaping the archive"""
+    name = os.path.normpath(name.replace('\\', '/')).lstrip('/')
+    # Only a `..` component escapes, names like `..foo` are fine
+    if name == '.' or '..' in name.replace(os.sep, '/').split('/'):
+        return None
+    return name
+
+
+def split_round_robin(entries: list, num_partitions: int) -> List[list]:
+    partitions = [entries[i::num_partitions] for i in range(max(1, num_partitions))]
+    return [partition for partition in partitions if partition]
+
+
+class InputSource:
+    """
+    Base class for archives that documents are read from without extracting them.
+
+    Sources that allow random access split their members into partitions that worker
+    processes read independently. Stream-only sources have no partitions and are read
+    by a single process with `iter_items()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def partitions(self, num_partitions: int) -> List[list]:
+        """Returns member entries split for num_partitions workers, or an empty list if the source can only be streamed"""
+        return []
+
+    def iter_items(self, partition: Optional[list] = None) -> Iterator[InputItem]:
+        pass
+
+
+class TarSource(InputSource):
+    """Reads members of a tar archive. Uncompressed tars are split by member offset, compressed ones are streamed."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.compressed = not path.endswith('.tar')
+
+    def partitions(self, num_partitions: int) -> List[list]:
+        if self.compressed:
+            return []
+        entries = []
+        with tarfile.open(self.path, 'r:') as tar:
+            for member in tar:
+                name = safe_member_name(member.name)
+                if member.isfile() and name:
+                    entries.append((name, member.offset_data, member.size))
+        return split_round_robin(entries, num_partitions)
+
+    def iter_items(self, partition: Optional[list] = None) -> Iterator[InputItem]:
+        if partition is not None:
+            with open(self.path, 'rb') as f:
+                for name, offset, size in partition:
+                    f.seek(offset)
+                    yield InputItem(name, f.read(size), {'archive': self.path, 'member': name, 'offset': offset})
+            return
+
+        # Stream mode reads the archive front to back, which is all a compressed tar allows
+        with tarfile.open(self.path, 'r|*') as tar:
+            for member in tar:
+                name = safe_member_name(member.name)
+                if not member.isfile() or not name:
+                    continue
+                data = tar.extractfile(member).read()
+                yield InputItem(name, data, {'archive': self.path, 'member': name, 'offset': member.offset_data})
+
+
+class ZipSource(InputSource):
+    """Reads members of a zip archive, split across workers using the central directory"""
+
+    def partitions(self, num_partitions: int) -> List[list]:
+        with zipfile.ZipFile(self.path) as archive:
+            entries = [info.filename for info in archive.infolist() if not info.is_dir()]
+        return split_round_robin(entries, num_partitions)
+
+    def iter_items(self, partition: Optional[list] = None) -> Iterator[InputItem]:
+        wanted = set(partition) if partition is not None else None
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or (wanted is not None and info.filename not in wanted):
+                    continue
+                name = safe_member_name(info.filename)
+                if not name:
+                    continue
+                yield InputItem(name, archive.read(info),
+                                {'archive': self.path, 'member': info.filename, 'offset': info.header_offset})
+
+
+class WarcSource(InputSource):
+    """
+    Reads `response` and `resource` records from a WARC file.
+
+    Uncompressed WARCs are indexed by record offset and split across workers. `.warc.gz`
+    files are streamed. Response records have their HTTP headers stripped, and documents
+    are named after their target URI.
+    """
+
+    RECORD_TYPES = (b'response', b'resource')
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.compressed = path.endswith('.gz')
+
+    def open(self):
+        return gzip.open(self.path, 'rb') if self.compressed else open(self.path, 'rb')
+
+    @staticmethod
+    def read_headers(f):
+        """Reads a record's version line and headers, returns None at the end of the file"""
+        line = f.readline()
+        while line in (b'\r\n', b'\n'):
+            line = f.readline()
+        if not line:
+            return None
+        if not line.startswith(b'WARC/'):
+            raise ValueError(f"Invalid WARC record header: {line[:50]!r}")
+
+        headers = {}
+        for line in iter(f.readline, b''):
+            if line in (b'\r\n', b'\n'):
+                break
+            key, _, value = line.partition(b':')
+            headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def partitions(self, num_partitions: int) -> List[list]:
+        if self.compressed:
+            return []
+        offsets = []
+        with self.open() as f:
+            while True:
+                offset = f.tell()
+                headers = self.read_headers(f)
+                if headers is None:
+                    break
+                length = int(headers.get(b'content-length', 0))
+                if headers.get(b'warc-type') in self.RECORD_TYPES:
+                    offsets.append(offset)
+                f.seek(length, os.SEEK_CUR)
+        return split_round_robin(offsets, num_partitions)
+
+    def iter_items(self, partition: Optional[list] = None) -> Iterator[InputItem]:
+        with self.open() as f:
+            if partition is not None:
+                for offset in partition:
+                    f.seek(offset)
+                    item = self.read_record(f, offset)
+                    if item:
+                        yield item
+                return
+
+            while True:
+                offset = f.tell() if not self.compressed else None
+                item = self.read_record(f, offset)
+                if item is False:
+                    break
+                if item:
+                    yield item
+
+    def read_record(self, f, offset):
+        """Reads the record at the current position. Returns False at the end of the file and None for skipped records."""
+        headers = self.read_headers(f)
+        if headers is None:
+            return False
+        block = f.read(int(headers.get(b'content-length', 0)))
+
+        record_type = headers.get(b'warc-type')
+        uri = headers.get(b'warc-target-uri', b'').decode('utf-8', errors='replace').strip('<>')
+        if record_type not in self.RECORD_TYPES or not uri:
+            return None
+
+        if record_type == b'response':
+            # Drop the HTTP status line and headers, keeping only the payload
+            _, separator, payload = block.partition(b'\r\n\r\n')
+            block = payload if separator else block
+
+        provenance = {'archive': self.path, 'member': uri, 'offset': offset}
+        if b'warc-record-id' in headers:
+            provenance['record_id'] = headers[b'warc-record-id'].decode('utf-8', errors='replace')
+        return InputItem(url_to_path(uri), block, provenance)
+
+
+def repo_names(repos: List[str]) -> dict:
+    """Returns {repo: name}, the shortest trailing part of each repo's path not shared with a different repo"""
+    parts = {repo: os.path.abspath(repo).strip(os.sep).split(os.sep) for repo in repos}
+    names = {}
+    for repo, repo_parts in parts.items():
+        others = [other for other in parts.values() if other != repo_parts]
+        depth = 1
+        while depth < len(repo_parts) and any(other[-depth:] == repo_parts[-depth:] for other in others):
+            depth += 1
+        names[repo] = os.path.join(*repo_parts[-depth:])
+    return names
+
+
+class GitSource(InputSource):
+    """
+    Reads blobs at a ref straight from the object stores of local git repositories.
+
+    Nothing is checked out: files are listed with `git ls-tree` and their contents streamed
+    through `git cat-file --batch`. Blobs are filtered by extension and path glob, and a blob
+    shared by several repos (same SHA) is only read once. Documents are named
+    `<repo name>/<path>`, where the repo name is its directory name, or as many parent
+    directories as it takes to tell apart repos with the same directory name, e.g.
+    `org1/utils` and `org2/utils`.
+    """
+
+    def __init__(self, repos: List[str], ref: str = 'HEAD', extensions: Optional[List[str]] = None,
+                 paths: Optional[List[str]] = None):
+        super().__init__(repos[0] if repos else '')
+        self.repos = repos
+        self.ref = ref
+        self.extensions = tuple(extensions) if extensions else None
+        self.paths = paths
+        self.repo_names = repo_names(repos)
+
+    def entries(self) -> List[tuple]:
+        """Returns (repo, blob sha, path) for every matching blob at the ref, deduplicated by SHA across repos"""
+        entries = []
+        seen = set()
+        for repo in self.repos:
+            output = subprocess.run(['git', '-C', repo, 'ls-tree', '-r', '-z', '--full-tree', self.ref],
+                                    capture_output=True, check=True).stdout
+            for line in output.split(b'\0'):
+                if not line:
+                    continue
+                info, _, path = line.partition(b'\t')
+                _, object_type, sha = info.split()
+                path = path.decode('utf-8', errors='surrogateescape')
+                if object_type != b'blob' or sha in seen or not self.matches(path):
+                    continue
+                seen.add(sha)
+                entries.append((repo, sha.decode('ascii'), path))
+        return entries
+
+    def matches(self, path: str) -> bool:
+        if self.extensions and not path.endswith(self.extensions):
+            return False
+        if self.paths and not any(fnmatch.fnmatch(path, pattern) for pattern in self.paths):
+            return False
+        return True
+
+    def partitions(self, num_partitions: int) -> List[list]:
+        # Object stores allow random access, so any split works
+        return split_round_robin(self.entries(), num_partitions)
+
+    def iter_items(self, partition: Optional[list] = None) -> Iterator[InputItem]:
+        entries = partition if partition is not None else self.entries()
+
+        by_repo = {}
+        for repo, sha, path in entries:
+            by_repo.setdefault(repo, []).append((sha, path))
+
+        for repo, blobs in by_repo.items():
+            repo_name = self.repo_names[repo]
+            process = subprocess.Popen(['git', '-C', repo, 'cat-file', '--batch'],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                for sha, path in blobs:
+                    # One request at a time, so neither side of the pipe can fill up and block
+                    process.stdin.write(sha.encode('ascii') + b'\n')
+                    process.stdin.flush()
+                    header = process.stdout.readline().split()
+                    if len(header) != 3:
+                        raise ValueError(f"Blob {sha} not found in repo {repo}")
+                    data = process.stdout.read(int(header[2]))
+                    process.stdout.read(1)
+
+                    yield InputItem(os.path.join(repo_name, path), data,
+                                    {'repo': repo, 'ref': self.ref, 'member': path, 'blob': sha})
+            finally:
+                process.stdin.close()
+                process.wait()
+                process.stdout.close()
+
+
+def create_input_source(source_config: dict) -> InputSource:
+    """
+    Creates an InputSource object from a configuration dictionary.
+
+    Args:
+        source_config (dict): A dictionary with the InputSource class as `type` and its arguments.
+
+    Returns:
+        InputSource: An InputSource object corresponding to the configuration dictionary.
+
+    Raises:
+        ValueError: If the source_config dictionary is not valid or if the InputSource type is invalid.
+    """
+    if not isinstance(source_config, dict) or 'type' not in source_config:
+        raise ValueError("Invalid input source configuration")
+
+    source_config = dict(source_config)
+    source_type = source_config.pop('type')
+    source_class = globals().get(source_type)
+    if not isinstance(source_class, type) or not issubclass(source_class, InputSource):
+        raise ValueError(f"Invalid input source type: {source_type}")
+    try:
+        return source_class(**source_config)
+    except TypeError as e:
+        raise ValueError(f"Error creating input source from config: {source_config}") from e
+
+
+def open_input_source(path: str) -> Optional[InputSource]:
+    """Returns the InputSource for an archive path, or None if the path isn't a supported archive"""
+    if not os.path.isfile(path):
+        return None
+    if path.endswith(('.warc', '.warc.gz')):
+        return WarcSource(path)
+    if path.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
+        return TarSource(path)
+    if path.endswith('.zip'):
+        return ZipSource(path)
+    return None
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import signal
+import shutil
+import hashlib
+import warnings
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from typing import List, Optional
+from .admission import AdmissionScheduler
+
+
+def supervised_worker(parser, connection, rule_index) -> None:
+    """Parses the files sent over the connection one at a time, reporting each outcome back"""
+    # Lead a process group of our own, so subprocesses like pandoc are killed and measured with the worker
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    parser.rule_tracker = rule_index
+    parser.preload()
+    while True:
+        file_path = connection.recv()
+        if file_path is None:
+            return
+        rule_index.value = -1
+        try:
+            parser.process_file(file_path)
+        except MemoryError:
+            # The heap may be left fragmented, so the worker is replaced rather than reused
+            connection.send(('memory', None))
+            return
+        except Exception as e:
+            connection.send(('error', repr(e)))
+        else:
+            connection.send(('done', None))
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """Returns a process's resident memory in bytes, or None where /proc isn't available"""
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_tree_rss(pid: int) -> Optional[int]:
+    """
+    Returns the resident memory in bytes of a process, its descendants and the members of the
+    process group it leads, or None where /proc isn't available.
+    """
+    rss = read_rss(pid)
+    if rss is None:
+        return None
+
+    parents = {}
+    group = set()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces and parentheses, the fields after it don't
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        parents[int(entry)] = int(fields[1])
+        if int(fields[2]) == pid:
+            group.add(int(entry))
+
+    members = set(group)
+    for other in parents:
+        ancestor = parents.get(other)
+        seen = set()
+        while ancestor and ancestor not in seen:
+            if ancestor == pid:
+                members.add(other)
+                break
+            seen.add(ancestor)
+            ancestor = parents.get(ancestor)
+    members.discard(pid)
+
+    # Processes that exited since the scan don't count
+    return rss + sum(filter(None, (read_rss(member) for member in members)))
+
+
+def kill_group(process) -> None:
+    """Kills a supervised worker and everything left in its process group"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # No process groups on this platform, or the worker hadn't started its group yet
+        pass
+    process.kill()
+    process.join()
+
+
+class SupervisedWorker:
+    def __init__(self, context, parser):
+        self.connection, child_connection = context.Pipe()
+        self.rule_index = context.Value('i', -1, lock=False)
+        self.process = context.Process(target=supervised_worker, args=(parser, child_connection, self.rule_index), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.file_path = None
+        self.started = None
+
+    def assign(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.started = time.monotonic()
+        self.connection.send(file_path)
+
+    def kill(self) -> None:
+        kill_group(self.process)
+        self.connection.close()
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            kill_group(self.process)
+        self.connection.close()
+
+
+class DocumentSupervisor:
+    """
+    Processes files on worker processes that each get a wall-clock and memory budget per document.
+
+    A worker that takes longer than `timeout` seconds on a document, or whose resident memory
+    grows past `memory_limit` bytes, is killed and replaced by a fresh one, as is a worker that
+    dies. Each such document, and any that raises an exception, is copied into
+    `quarantine_dir` and reported in its `report.jsonl`, with the reason and the rule that was
+    running, and the run carries on with the remaining documents.
+
+    Each worker leads its own process group. A worker's memory includes its descendants, like a
+    pandoc subprocess, and killing a worker kills its whole group, so no subprocess is left
+    running. Memory is measured from /proc, so memory limits are only enforced on Linux.
+
+    With a `memory_budget` in bytes, files are started by an AdmissionScheduler so the estimated
+    memory of all the documents in flight stays within it.
+
+    With a RunMonitor as `monitor`, every document that finishes or is quarantined is reported
+    as done by the worker it ran on.
+    """
+
+    # How often worker memory is checked, in seconds
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, parser, timeout: Optional[float] = None, memory_limit: Optional[int] = None,
+                 quarantine_dir: Optional[str] = None, memory_budget: Optional[int] = None, monitor=None):
+        self.parser = parser
+        self.monitor = monitor
+        self.memory_budget = memory_budget
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.quarantine_dir = quarantine_dir or os.path.join(parser.output_dir, 'quarantine')
+        self.context = multiprocessing.get_context(parser.start_method)
+        self.records = []
+
+        if memory_limit and read_rss(os.getpid()) is None:
+            warnings.warn("Memory limits can't be enforced on this platform and are ignored")
+            self.memory_limit = None
+
+    def run(self, file_paths: List[str]) -> List[dict]:
+        """Processes the files, returns a record for each quarantined document"""
+        os.makedirs(self.parser.output_dir, exist_ok=True)
+
+        if self.memory_budget:
+            scheduler = AdmissionScheduler(file_paths, self.parser.processing_rules, self.memory_budget)
+        else:
+            scheduler = None
+            pending = deque(file_paths)
+
+        workers = [SupervisedWorker(self.context, self.parser) for _ in range(max(1, self.parser.num_processes))]
+        if self.monitor:
+            self.monitor.report(force=True)
+        try:
+            while True:
+                for worker in workers:
+                    if worker.file_path is not None:
+                        continue
+                    file_path = scheduler.next() if scheduler is not None else (pending.popleft() if pending else None)
+                    if file_path is None:
+                        break
+                    worker.assign(file_path)
+                busy = [worker for worker in workers if worker.file_path is not None]
+                if not busy:
+                    break
+
+                ready = wait([worker.connection for worker in busy] + [worker.process.sentinel for worker in busy],
+                             self.wait_timeout(busy))
+
+                for worker in busy:
+                    reason, detail = self.check(worker, ready)
+                    if reason is None:
+                        continue
+                    if reason != 'done':
+                        self.quarantine(worker, reason, detail)
+                    if self.monitor:
+                        self.monitor.update('file', workers.index(worker), worker.file_path, os.path.getsize(worker.file_path))
+                    if scheduler is not None:
+                        scheduler.release(worker.file_path)
+                    if reason == 'done' or reason == 'error':
+                        worker.file_path = None
+                        continue
+
+                    # The worker is gone or can't be trusted, so it is replaced
+                    worker.kill()
+                    workers[workers.index(worker)] = SupervisedWorker(self.context, self.parser)
+
+                if self.monitor:
+                    self.monitor.check_stalls()
+                    self.monitor.report()
+        finally:
+            for worker in workers:
+                worker.stop()
+
+        if self.monitor:
+            self.monitor.finish()
+
+        return self.records
+
+    def wait_timeout(self, busy: List[SupervisedWorker]) -> Optional[float]:
+        """Returns how long to wait for workers before budgets need checking"""
+        timeouts = []
+        if self.timeout:
+            timeouts.append(max(0.0, min(worker.started for worker in busy) + self.timeout - time.monotonic()))
+        if self.memory_limit:
+            timeouts.append(self.POLL_INTERVAL)
+        if self.monitor:
+            timeouts.append(min(1.0, self.monitor.report_interval))
+        return min(timeouts) if timeouts else None
+
+    def check(self, worker: SupervisedWorker, ready: list):
+        """Returns (outcome, detail) for a busy worker, or (None, None) if it is still within its budgets"""
+        if worker.connection in ready:
+            try:
+                return worker.connection.recv()
+            except EOFError:
+                return 'crashed', f"exit code {worker.process.exitcode}"
+        if worker.process.sentinel in ready:
+            worker.process.join()
+            return 'crashed', f"exit code {worker.process.exitcode}"
+
+        elapsed = time.monotonic() - worker.started
+        if self.timeout and elapsed > self.timeout:
+            return 'timeout', f"{elapsed:.1f}s"
+        if self.memory_limit:
+            rss = read_tree_rss(worker.process.pid)
+            if rss is not None and rss > self.memory_limit:
+                return 'memory', f"{rss} bytes"
+        return None, None
+
+    def quarantine(self, worker: SupervisedWorker, reason: str, detail: Optional[str]) -> None:
+        """Copies the document into the quarantine directory and records why, and in which rule, it failed"""
+        rules = self.parser.processing_rules
+        rule = type(rules[worker.rule_index.value]).__name__ if 0 <= worker.rule_index.value < len(rules) else None
+
+        quarantine_path = os.path.join(self.quarantine_dir, self.quarantine_name(worker.file_path))
+        os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+        shutil.copyfile(worker.file_path, quarantine_path)
+
+        record = {'path': worker.file_path, 'quarantine_path': os.path.relpath(quarantine_path, self.quarantine_dir),
+                  'reason': reason, 'detail': detail, 'rule': rule,
+                  'rule_index': worker.rule_index.value if rule else None,
+                  'seconds': round(time.monotonic() - worker.started, 3)}
+        self.records.append(record)
+        with open(os.path.join(self.quarantine_dir, 'report.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        warnings.warn(f"Quarantined {worker.file_path}: {reason} in {rule or 'decoding'} ({detail})")
+
+    def quarantine_name(self, file_path: str) -> str:
+        """
+        Returns where a document is copied to in the quarantine directory, its path relative to
+        input_dir, or its name prefixed with a hash of its path for files outside input_dir
+        """
+        if self.parser.input_dir:
+            rel_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.parser.input_dir))
+            if rel_path != '..' and not rel_path.startswith('..' + os.sep):
+                return rel_path
+        path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8', errors='surrogateescape')).hexdigest()[:8]
+        return f"{path_hash}-{os.path.basename(file_path)}"
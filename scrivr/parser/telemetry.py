@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import warnings
+from collections import deque
+from typing import List, Optional
+
+
+class ProgressReporter:
+    """
+    Sends a worker's progress to the parent process over a multiprocessing queue.
+
+    Besides a message for each finished file, a background thread sends a heartbeat every
+    `heartbeat_interval` seconds. A worker stuck in a rule that holds the GIL, like a regex
+    backtracking, stops sending heartbeats, which is how the parent tells it's stalled.
+    """
+
+    def __init__(self, progress_queue, worker: int, heartbeat_interval: float = 5):
+        self.progress_queue = progress_queue
+        self.worker = worker
+        self.heartbeat_interval = heartbeat_interval
+        self.stopped = None
+
+    def start(self) -> None:
+        self.stopped = threading.Event()
+        threading.Thread(target=self.send_heartbeats, daemon=True).start()
+
+    def send_heartbeats(self) -> None:
+        while not self.stopped.wait(self.heartbeat_interval):
+            self.progress_queue.put(('heartbeat', self.worker, None, 0))
+
+    def file_done(self, file_path: str, num_bytes: Optional[int] = None) -> None:
+        """Reports a finished file, or a document of an input source with its size in num_bytes"""
+        if num_bytes is None:
+            num_bytes = os.path.getsize(file_path)
+        self.progress_queue.put(('file', self.worker, file_path, num_bytes))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.progress_queue.put(('done', self.worker, None, 0))
+
+
+class RunMonitor:
+    """
+    Follows the progress of a process_files run from the messages its workers send.
+
+    Tracks files and bytes done, the files and bytes per second over the last `window` seconds,
+    the ETA and each worker's last heartbeat. A running worker that hasn't been heard from in
+    `stall_seconds` is flagged as stalled, and one that exits early as dead. Every
+    `report_interval` seconds the status is written as JSON to `status_path`, and printed as a
+    progress line to stderr if `show_progress` is set.
+
+    Runs over an input source pass None for file_paths, with the number of documents in `files_total`
+    if it's known. Their byte total isn't known, so their ETA is estimated from files.
+    """
+
+    def __init__(self, file_paths: Optional[List[str]], num_workers: int, status_path: Optional[str] = None,
+                 show_progress: bool = False, stall_seconds: float = 60, report_interval: float = 5, window: float = 30,
+                 files_total: Optional[int] = None):
+        if file_paths is not None:
+            self.files_total = len(file_paths)
+            self.bytes_total = sum(os.path.getsize(file_path) for file_path in file_paths)
+        else:
+            self.files_total = files_total
+            self.bytes_total = None
+        self.status_path = status_path
+        self.show_progress = show_progress
+        self.stall_seconds = stall_seconds
+        self.report_interval = report_interval
+        self.window = window
+
+        self.started = time.time()
+        self.files_done = 0
+        self.bytes_done = 0
+        self.samples = deque([(self.started, 0, 0)])
+        self.last_report = None
+        self.workers = [{'worker': i, 'state': 'running', 'files': 0, 'bytes': 0, 'last_heartbeat': self.started,
+                         'last_file': None, 'exit_code': None} for i in range(num_workers)]
+
+    def update(self, kind: str, worker: int, file_path: Optional[str], num_bytes: int) -> None:
+        now = time.time()
+        info = self.workers[worker]
+        info['last_heartbeat'] = now
+        if info['state'] == 'stalled':
+            info['state'] = 'running'
+
+        if kind == 'file':
+            info['files'] += 1
+            info['bytes'] += num_bytes
+            info['last_file'] = file_path
+            self.files_done += 1
+            self.bytes_done += num_bytes
+            self.samples.append((now, self.files_done, self.bytes_done))
+        elif kind == 'done':
+            info['state'] = 'finished'
+
+    def worker_exited(self, worker: int, exit_code: int) -> None:
+        info = self.workers[worker]
+        if info['exit_code'] is not None:
+            return
+        info['exit_code'] = exit_code
+        if exit_code != 0 or info['state'] != 'finished':
+            info['state'] = 'dead'
+            warnings.warn(f"Worker {worker} exited with code {exit_code} after {info['files']} files")
+        else:
+            info['state'] = 'finished'
+
+    def check_stalls(self) -> None:
+        now = time.time()
+        for info in self.workers:
+            if info['state'] == 'running' and now - info['last_heartbeat'] > self.stall_seconds:
+                info['state'] = 'stalled'
+                warnings.warn(f"Worker {info['worker']} stalled, no heartbeat for {now - info['last_heartbeat']:.0f}s "
+                              f"after {info['last_file'] or 'no files'}")
+
+    def rates(self):
+        """Returns the files and bytes per second over the last window seconds"""
+        now = time.time()
+        while len(self.samples) > 1 and self.samples[1][0] < now - self.window:
+            self.samples.popleft()
+        start, files, num_bytes = self.samples[0]
+        elapsed = now - start
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (self.files_done - files) / elapsed, (self.bytes_done - num_bytes) / elapsed
+
+    def status(self) -> dict:
+        files_per_second, bytes_per_second = self.rates()
+
+        # Bytes give a better ETA than files when file sizes vary
+        eta = None
+        if bytes_per_second > 0 and self.bytes_total is not None:
+            eta = (self.bytes_total - self.bytes_done) / bytes_per_second
+        elif files_per_second > 0 and self.files_total is not None:
+            eta = (self.files_total - self.files_done) / files_per_second
+
+        finished = all(info['state'] in ('finished', 'dead') for info in self.workers)
+        return {
+            'state': 'finished' if finished else 'running',
+            'started': self.started,
+            'updated': time.time(),
+            'elapsed_seconds': time.time() - self.started,
+            'files_done': self.files_done,
+            'files_total': self.files_total,
+            'bytes_done': self.bytes_done,
+            'bytes_total': self.bytes_total,
+            'files_per_second': files_per_second,
+            'bytes_per_second': bytes_per_second,
+            'eta_seconds': eta,
+            'stalled_workers': [info['worker'] for info in self.workers if info['state'] == 'stalled'],
+            'dead_workers': [info['worker'] for info in self.workers if info['state'] == 'dead'],
+            'workers': [dict(info) for info in self.workers],
+        }
+
+    def report(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and self.last_report is not None and now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+
+        status = self.status()
+        if self.status_path:
+            tmp_path = self.status_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(status, f, indent=2)
+            os.replace(tmp_path, self.status_path)
+        if self.show_progress:
+            print(self.format_status(status), file=sys.stderr)
+
+    @staticmethod
+    def format_status(status: dict) -> str:
+        files_total = f"/{status['files_total']}" if status['files_total'] is not None else ''
+        bytes_total = f"/{status['bytes_total'] / 1e6:.1f}" if status['bytes_total'] is not None else ''
+        line = (f"{status['files_done']}{files_total} files, "
+                f"{status['bytes_done'] / 1e6:.1f}{bytes_total} MB, "
+                f"{status['files_per_second']:.1f} files/s")
+        if status['eta_seconds'] is not None and status['state'] == 'running':
+            line += f", ETA {status['eta_seconds']:.0f}s"
+        if status['stalled_workers']:
+            line += f", stalled workers: {status['stalled_workers']}"
+        if status['dead_workers']:
+            line += f", dead workers: {status['dead_workers']}"
+        return line
+
+    def finish(self) -> None:
+        """Marks the workers still running as finished, for runs whose workers don't say when they're done"""
+        for info in self.workers:
+            if info['state'] in ('running', 'stalled'):
+                info['state'] = 'finished'
+        self.report(force=True)
+
+    def poll(self, progress_queue, timeout: float = 0) -> None:
+        """
+        Applies the messages waiting on the queue, waiting up to timeout for each, then checks for stalls
+        and reports, for a parent that has other work between checks
+        """
+        while True:
+            try:
+                self.update(*progress_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        self.check_stalls()
+        self.report()
+
+    def watch_result(self, result, progress_queue) -> None:
+        """Follows the messages of a pool's workers until the pool's async result is ready"""
+        self.report(force=True)
+        while not result.ready():
+            try:
+                self.update(*progress_queue.get(timeout=min(1.0, self.report_interval)))
+            except queue.Empty:
+                pass
+            self.check_stalls()
+            self.report()
+
+        # Messages sent just before the last task finished may still be in the queue
+        while True:
+            try:
+                self.update(*progress_queue.get(timeout=0.1))
+            except queue.Empty:
+                break
+        self.finish()
+
+    def watch(self, processes: list, progress_queue) -> None:
+        """Follows the workers' messages until every worker process has exited"""
+        self.report(force=True)
+        while True:
+            try:
+                self.update(*progress_queue.get(timeout=min(1.0, self.report_interval)))
+            except queue.Empty:
+                pass
+
+            exited = all(p.exitcode is not None for p in processes)
+            if exited:
+                # Messages sent just before the workers exited may still be in the queue
+                while True:
+                    try:
+                        self.update(*progress_queue.get(timeout=0.1))
+                    except queue.Empty:
+                        break
+                for worker, p in enumerate(processes):
+                    self.worker_exited(worker, p.exitcode)
+                break
+
+            for worker, p in enumerate(processes):
+                if p.exitcode is not None and p.exitcode != 0:
+                    self.worker_exited(worker, p.exitcode)
+            self.check_stalls()
+            self.report()
+
+        self.report(force=True)
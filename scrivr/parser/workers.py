@@ -0,0 +1,65 @@
+import multiprocessing
+from typing import List, Optional
+
+# Parser used by pool worker processes, set up once per process by init_worker
+worker_parser = None
+
+# Reports the files a pool worker finishes when a run is monitored, also set up by init_worker
+worker_progress = None
+
+
+def init_worker(parser, progress_queue=None, worker_counter=None) -> None:
+    """
+    Pool initializer, keeps the parser for every task and imports what its rules need up front.
+    With a progress queue, each worker takes the next index from worker_counter and reports its progress.
+    """
+    global worker_parser, worker_progress
+    parser.preload()
+    worker_parser = parser
+    if progress_queue is not None:
+        from .telemetry import ProgressReporter
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        worker_progress = ProgressReporter(progress_queue, index)
+        worker_progress.start()
+
+
+def process_paths(file_paths: List[str]) -> int:
+    worker_parser.process_file_paths(file_paths, worker_progress)
+    return len(file_paths)
+
+
+def parse_bytes(data: bytes) -> str:
+    return worker_parser.parse_bytes(data)
+
+
+def parse_items(items: list) -> list:
+    return worker_parser.parse_items(items)
+
+
+def process_item(item) -> dict:
+    record = worker_parser.process_item(item)
+    if worker_progress is not None:
+        worker_progress.file_done(item.name, len(item.data))
+    return record
+
+
+def process_source_partition(args) -> list:
+    return worker_parser.process_source_partition(args, worker_progress)
+
+
+def create_pool(parser, start_method: Optional[str] = None, progress_queue=None):
+    """
+    Returns a pool of parser.num_processes workers that each receive the parser once,
+    started with the platform's default start method if start_method is None. With a
+    progress_queue from the same start method's context, workers report to a RunMonitor.
+
+    With the forkserver start method the server process imports scrivr and the modules
+    required by the configured rules before forking, so workers start with them loaded.
+    """
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(['scrivr.parser'] + parser.required_modules())
+    initargs = (parser,) if progress_queue is None else (parser, progress_queue, context.Value('i', 0))
+    return context.Pool(parser.num_processes, initializer=init_worker, initargs=initargs)
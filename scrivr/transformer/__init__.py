@@ -1 +1,5 @@
-from .preprocessor import TransformerPreprocessor
\ No newline at end of file
+from .preprocessor import TransformerPreprocessor
+from .tokenizer import Tokenizer, HuggingFaceTokenizer, SimpleBPETokenizer, TokenCache, load_tokenizer
+from .dataset import PackedTokenDataset
+from .changes import ChangeSet
+from .scanner import IgnoreRules, scan_directory
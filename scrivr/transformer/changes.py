@@ -0,0 +1,73 @@
+class ChangeSet:
+    """
+    Paths added, modified, removed and renamed since the last observer notification.
+
+    Successive changes to the same path are coalesced, so a file that is added and then
+    modified before a notification is reported once as added, and a file that is added
+    and then removed is not reported at all. `renamed` maps old paths to new paths, and
+    a renamed file that is also modified is reported under its new path in `modified`.
+    """
+
+    def __init__(self, added=None, modified=None, removed=None, renamed=None):
+        self.added = set(added or [])
+        self.modified = set(modified or [])
+        self.removed = set(removed or [])
+        self.renamed = dict(renamed or {})
+
+    def add(self, path):
+        if path in self.removed:
+            # Removed and re-created within one window is a modification to observers
+            self.removed.discard(path)
+            self.modified.add(path)
+        else:
+            self.added.add(path)
+
+    def modify(self, path):
+        if path not in self.added:
+            self.modified.add(path)
+
+    def remove(self, path):
+        if path in self.added:
+            self.added.discard(path)
+            return
+        self.modified.discard(path)
+
+        # Removing a renamed file removes it under the path observers last knew
+        original = self.original_path(path)
+        self.renamed.pop(original, None)
+        self.removed.add(original)
+
+    def rename(self, old_path, new_path):
+        if old_path in self.added:
+            self.added.discard(old_path)
+            self.added.add(new_path)
+            return
+        if old_path in self.modified:
+            self.modified.discard(old_path)
+            self.modified.add(new_path)
+
+        original = self.original_path(old_path)
+        if original == new_path:
+            # Renamed back to where it started
+            self.renamed.pop(original, None)
+        else:
+            self.renamed[original] = new_path
+
+    def original_path(self, path):
+        """Returns the path observers last knew a renamed file by"""
+        for old_path, new_path in self.renamed.items():
+            if new_path == path:
+                return old_path
+        return path
+
+    def __len__(self):
+        return len(self.added) + len(self.modified) + len(self.removed) + len(self.renamed)
+
+    def __eq__(self, other):
+        return (isinstance(other, ChangeSet) and self.added == other.added
+                and self.modified == other.modified and self.removed == other.removed
+                and self.renamed == other.renamed)
+
+    def __repr__(self):
+        return (f"ChangeSet(added={sorted(self.added)}, modified={sorted(self.modified)}, "
+                f"removed={sorted(self.removed)}, renamed={self.renamed})")
@@ -0,0 +1,137 @@
+import os
+import json
+import numpy as np
+from typing import Optional
+
+
+class PackedTokenDataset:
+    """
+    Append-only token dataset for fine tuning, stored as a compact binary file.
+
+    Documents are written back to back (each followed by `eos_token_id` if one is set) into
+    `<path>.bin`, with the start offset of every document in `<path>.idx`. Training reads
+    the stream through a memory map as fixed-length packed sequences of `context_length`.
+    """
+
+    def __init__(self, path: str, dtype: Optional[str] = None, eos_token_id: Optional[int] = None):
+        self.path = path
+        self.bin_path = path + '.bin'
+        self.idx_path = path + '.idx'
+        self.meta_path = path + '.meta.json'
+        self.hashes_path = path + '.hashes'
+
+        if os.path.isfile(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            if dtype and np.dtype(dtype) != np.dtype(meta['dtype']):
+                raise ValueError(f"Dataset at path {path} was written as {meta['dtype']}, not {dtype}")
+            self.dtype = np.dtype(meta['dtype'])
+            self.eos_token_id = meta['eos_token_id']
+        else:
+            self.dtype = np.dtype(dtype or 'uint32')
+            if self.dtype not in (np.uint16, np.uint32):
+                raise ValueError(f"Invalid dataset dtype: {self.dtype}")
+            self.eos_token_id = eos_token_id
+
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(self.meta_path, 'w') as f:
+                json.dump({'dtype': self.dtype.name, 'eos_token_id': eos_token_id}, f)
+            for file_path in (self.bin_path, self.idx_path, self.hashes_path):
+                open(file_path, 'ab').close()
+
+        with open(self.hashes_path, 'r') as f:
+            self.hashes = set(f.read().split())
+
+    @classmethod
+    def for_tokenizer(cls, path: str, tokenizer, eos_token_id: Optional[int] = None) -> 'PackedTokenDataset':
+        """Opens a dataset using the smallest dtype that fits the tokenizer's vocab"""
+        dtype = 'uint16' if tokenizer.vocab_size <= np.iinfo(np.uint16).max + 1 else 'uint32'
+        return cls(path, dtype=dtype, eos_token_id=eos_token_id)
+
+    @property
+    def num_tokens(self) -> int:
+        return os.path.getsize(self.bin_path) // self.dtype.itemsize
+
+    @property
+    def num_documents(self) -> int:
+        return os.path.getsize(self.idx_path) // np.dtype(np.uint64).itemsize
+
+    def append(self, tokens, key: Optional[str] = None) -> bool:
+        """
+        Appends a document's tokens to the dataset.
+
+        Args:
+            tokens: The token ids of the document.
+            key (str): Optional content hash. Documents whose key was already written are skipped.
+
+        Returns:
+            bool: True if the document was written.
+        """
+        if key is not None and key in self.hashes:
+            return False
+
+        tokens = np.asarray(tokens)
+        if tokens.size and (tokens.min() < 0 or tokens.max() > np.iinfo(self.dtype).max):
+            raise ValueError(f"Token ids do not fit in dataset dtype {self.dtype}")
+        if self.eos_token_id is not None:
+            tokens = np.append(tokens, self.eos_token_id)
+
+        offset = self.num_tokens
+        with open(self.bin_path, 'ab') as f:
+            f.write(tokens.astype(self.dtype).tobytes())
+        with open(self.idx_path, 'ab') as f:
+            f.write(np.array([offset], dtype=np.uint64).tobytes())
+        if key is not None:
+            with open(self.hashes_path, 'a') as f:
+                f.write(key + '\n')
+            self.hashes.add(key)
+        return True
+
+    def update_from(self, preprocessor) -> int:
+        """Appends every tokenized document of a TransformerPreprocessor not yet in the dataset, returns the count"""
+        written = 0
+        for data_hash, tokens in zip(preprocessor.df['content_hash'], preprocessor.df['tokens']):
+            if tokens is None:
+                continue
+            if self.append(tokens, key=data_hash):
+                written += 1
+        return written
+
+    def tokens(self) -> np.ndarray:
+        """Returns a read-only memory map over every token in the dataset"""
+        if self.num_tokens == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.memmap(self.bin_path, dtype=self.dtype, mode='r', shape=(self.num_tokens,))
+
+    def offsets(self) -> np.ndarray:
+        """Returns the start offset of every document"""
+        if self.num_documents == 0:
+            return np.empty(0, dtype=np.uint64)
+        return np.fromfile(self.idx_path, dtype=np.uint64)
+
+    def document(self, i: int) -> np.ndarray:
+        """Returns a view of the tokens of the i-th document, including its eos token"""
+        offsets = self.offsets()
+        end = int(offsets[i + 1]) if i + 1 < len(offsets) else self.num_tokens
+        return self.tokens()[int(offsets[i]):end]
+
+    def sequences(self, context_length: int) -> np.ndarray:
+        """Returns a zero-copy (num_sequences, context_length) view of the packed token stream, dropping the remainder"""
+        if context_length <= 0:
+            raise ValueError("context_length must be positive")
+        tokens = self.tokens()
+        num_sequences = len(tokens) // context_length
+        return tokens[:num_sequences * context_length].reshape(num_sequences, context_length)
+
+    def random_batch(self, batch_size: int, context_length: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Returns a new (batch_size, context_length) array of packed sequences picked at random.
+
+        Random rows can't be a view, so the picked rows are copied out of the memory map. Only
+        those rows are read from the file.
+        """
+        sequences = self.sequences(context_length)
+        if len(sequences) == 0:
+            raise ValueError(f"Dataset has fewer than {context_length} tokens")
+        rng = rng or np.random.default_rng()
+        return sequences[rng.integers(0, len(sequences), size=batch_size)]
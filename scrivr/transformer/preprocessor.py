@@ -1,114 +1,542 @@
 import os
 import time
-import multiprocessing
 import pandas as pd
 import warnings
 import threading
+import queue
+import json
+import asyncio
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+from .tokenizer import TokenCache, content_hash
+from .changes import ChangeSet
+from .scanner import IgnoreRules, scan_directory
+
+# Bumped whenever the layout of a snapshot changes, older snapshots are ignored
+SNAPSHOT_VERSION = 2
+
+
+class FileRemoved(NamedTuple):
+    """Queue message for a file that disappeared from the watched directory"""
+    path: str
+
+
+class FileRenamed(NamedTuple):
+    """Queue message for a file that was moved within the watched directory"""
+    old_path: str
+    new_path: str
+    last_modified: float
+
 
 class TransformerPreprocessor:
-    def __init__(self, input_dir, seconds_for_empty_queue=5):
+    def __init__(self, input_dir, seconds_for_empty_queue=5, tokenizer=None, token_cache_dir=None, tokenize_batch_size=64,
+                 notify_interval=1.0, notify_max_changes=100, recursive=False, ignore_patterns=None,
+                 snapshot_path=None, snapshot_interval=60, poll_interval=1.0, executor=None):
         self.input_dir = input_dir
-        self.df = pd.DataFrame(columns=['ingest_file_path', 'ingest_file_last_modified', 'data'])
-        self.queue = multiprocessing.Queue()
+        self.file_stats = {}
+
+        # (inode, last_modified, size) of each row's file when it was read, persisted in the snapshot
+        # so a restart only re-reads files that changed since
+        self.row_stats = {}
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_dirty = False
+        self.snapshot_saved = time.monotonic()
+
+        # File paths are relative to input_dir, including subdirectories when watching recursively
+        self.recursive = recursive
+        self.ignore = IgnoreRules(ignore_patterns) if ignore_patterns else None
+        self.df = pd.DataFrame(columns=['ingest_file_path', 'ingest_file_last_modified', 'data', 'content_hash', 'tokens'])
         self.observers = []
         self.seconds_for_empty_queue = seconds_for_empty_queue
 
-        self.initialize_queue()
+        # run() watches and consumes on one event loop through the `updates` asyncio queue. The
+        # blocking check_directory, watch_directory and process_queue methods use the thread-safe `queue`.
+        self.poll_interval = poll_interval
+        # Updates change self.df in place, so they have to run in this process, one at a time
+        if isinstance(executor, ProcessPoolExecutor):
+            raise ValueError("executor must run updates in this process, e.g. ThreadPoolExecutor(max_workers=1)")
+        self.executor = executor
+        self.queue = queue.Queue()
+        self.updates = None
+        self.observer_tasks = set()
 
-        # Initialize the timer to send an empty queue message
-        self.empty_queue_timer = threading.Timer(10, self.empty_queue_message)
-        self.empty_queue_timer.start()
+        # Observer notifications are coalesced into one ChangeSet per window of time or number of changes
+        self.notify_interval = notify_interval
+        self.notify_max_changes = notify_max_changes
+        self.observer_loop = None
+
+        # Tokenization is optional, files are only stored as raw text without a tokenizer
+        self.tokenizer = tokenizer
+        self.tokenize_batch_size = tokenize_batch_size
+        # A snapshot only references tokens by content hash, so it keeps a token cache of its own if none is given
+        self.token_cache = None
+        if tokenizer and (token_cache_dir or snapshot_path):
+            self.token_cache = TokenCache(token_cache_dir or snapshot_path + '.tokens', tokenizer.name)
+
+        self.initialize_queue()
 
     def initialize_queue(self):
-        # Initialize the dataframe with existing files in the directory
+        # Initialize the dataframe with existing files in the directory. Files unchanged since the snapshot keep
+        # its hash and aren't read, their data is missing until load_data() reads it.
+        self.file_stats = self.scan_directory()
+        known = self.load_snapshot() if self.snapshot_path else {}
+
         rows = []
-        for filename in os.listdir(self.input_dir):
-            filepath = os.path.join(self.input_dir, filename)
-            if os.path.isfile(filepath):
-                last_modified = os.path.getmtime(filepath)
-                rows.append({'ingest_file_path': filename,
-                            'ingest_file_last_modified': last_modified,
-                            'data': self.process_file(filename)})
-        self.df = pd.concat([self.df, pd.DataFrame(rows)], ignore_index=True)
+        for filename, stats in self.file_stats.items():
+            if filename in known:
+                data, data_hash = None, known[filename]
+            else:
+                data = self.process_file(filename)
+                data_hash = content_hash(data)
+            self.row_stats[filename] = stats
+            rows.append({'ingest_file_path': filename,
+                        'ingest_file_last_modified': stats[1],
+                        'data': data,
+                        'content_hash': data_hash,
+                        'tokens': None})
+        if rows:
+            self.df = pd.concat([self.df, pd.DataFrame(rows)], ignore_index=True)
+
+        # Tokens of content seen before come from the token cache, only content missing from it is read
+        if self.tokenizer:
+            self.tokenize_rows(self.df.index.tolist())
+
+        if self.snapshot_path:
+            self.save_snapshot()
+
+    def load_snapshot(self):
+        """
+        Returns {filename: content hash} for the files unchanged since the snapshot was saved.
+
+        A file is unchanged if its inode, last modified time and size match the snapshot. A file at
+        a new path with the stats of a snapshot file that's gone was renamed, and keeps its hash.
+        A snapshot that can't be read, or is of another version or directory, is ignored.
+        """
+        if not os.path.isfile(self.snapshot_path):
+            return {}
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+            if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('input_dir') != os.path.abspath(self.input_dir):
+                warnings.warn(f"Ignoring snapshot {self.snapshot_path} of another version or directory")
+                return {}
+            rows = {filename: (tuple(stats), data_hash) for filename, stats, data_hash in snapshot['rows']}
+        except Exception as e:
+            warnings.warn(f"Ignoring unreadable snapshot {self.snapshot_path}: {e!r}")
+            return {}
+
+        gone_by_stats = {stats: data_hash for filename, (stats, data_hash) in rows.items() if filename not in self.file_stats}
+
+        known = {}
+        for filename, stats in self.file_stats.items():
+            if filename in rows:
+                if rows[filename][0] == stats:
+                    known[filename] = rows[filename][1]
+            elif stats in gone_by_stats:
+                known[filename] = gone_by_stats.pop(stats)
+        return known
+
+    def save_snapshot(self):
+        """
+        Writes the path, stats and content hash of every row to snapshot_path, replacing it atomically.
+        Content isn't part of the snapshot, and tokens are kept in the token cache by content hash.
+        """
+        rows = []
+        for filename, data_hash in zip(self.df['ingest_file_path'], self.df['content_hash']):
+            stats = self.row_stats.get(filename)
+            if stats is not None:
+                rows.append([filename, list(stats), data_hash])
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'input_dir': os.path.abspath(self.input_dir),
+            'rows': rows,
+        }
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+        self.snapshot_dirty = False
+        self.snapshot_saved = time.monotonic()
+
+    def stat_file(self, filename):
+        """Returns (inode, last_modified, size) of a file, or None if it doesn't exist"""
+        try:
+            stat = os.stat(os.path.join(self.input_dir, filename))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime, stat.st_size
 
     def start(self):
-        # Start watching the directory for changes
-        watcher = multiprocessing.Process(target=self.watch_directory)
-        watcher.start()
+        """Watches the directory and processes changes until interrupted, see run()"""
+        asyncio.run(self.run())
 
-        # Start processing the queue of changes
-        processor = multiprocessing.Process(target=self.process_queue)
-        processor.start()
+    async def run(self):
+        """
+        Watches the directory and processes its changes as tasks on the running event loop.
 
-        # Wait for both processes to finish
-        watcher.join()
-        processor.join()
+        Scanning runs on the loop's default executor. Reading, hashing and tokenizing changed files
+        runs on `executor`, a single thread by default. The updates change the DataFrame in place, so
+        an executor given instead must run in this process and one task at a time. Timers for
+        notification windows and the empty queue are timeouts of the consumer rather than threads, and
+        coroutine observers are scheduled as tasks on the same loop. Returns once a None is put on
+        `updates`, or runs until cancelled. Either way, rows changed since the last snapshot are saved.
+        """
+        self.updates = asyncio.Queue()
+        executor = self.executor or ThreadPoolExecutor(max_workers=1)
+        watcher = asyncio.create_task(self.watch())
+        try:
+            await self.consume(executor)
+        finally:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+            # Queued behind any update still applying, so the snapshot includes it
+            await asyncio.get_running_loop().run_in_executor(executor, self.save_snapshot_if_due, True)
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+
+    async def watch(self):
+        """
+        Polls the directory every poll_interval seconds, putting every change on the updates queue.
+        A scan that fails is skipped with a warning and retried at the next poll.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                file_stats = await loop.run_in_executor(None, self.scan_directory)
+                updates = self.diff_directory(file_stats)
+            except Exception as e:
+                warnings.warn(f"Failed to scan {self.input_dir}: {e!r}")
+            else:
+                for update in updates:
+                    self.updates.put_nowait(update)
+            await asyncio.sleep(self.poll_interval)
+
+    async def consume(self, executor):
+        """Applies batches of updates from the updates queue, notifying observers like process_queue does"""
+        loop = asyncio.get_running_loop()
+        changes = ChangeSet()
+        changes_since = None
+        empty_since = time.monotonic()
+        empty_notified = False
 
-    def watch_directory(self):
         while True:
-            # Check for new or modified files in the directory
-            for filename in os.listdir(self.input_dir):
-                filepath = os.path.join(self.input_dir, filename)
-                if os.path.isfile(filepath):
-                    last_modified = os.path.getmtime(filepath)
+            # Wake up when the notification window closes or the queue has been empty long enough
+            now = time.monotonic()
+            timeouts = []
+            if changes_since is not None:
+                timeouts.append(self.notify_interval - (now - changes_since))
+            if not empty_notified:
+                timeouts.append(self.seconds_for_empty_queue - (now - empty_since))
+            timeout = max(0, min(timeouts)) if timeouts else None
+
+            updates = []
+            finished = False
+            try:
+                update = await asyncio.wait_for(self.updates.get(), timeout)
+                while True:
+                    if not self.is_update(update):
+                        finished = True
+                        break
+                    updates.append(update)
+                    if len(updates) >= self.tokenize_batch_size or self.updates.empty():
+                        break
+                    update = self.updates.get_nowait()
+            except asyncio.TimeoutError:
+                pass
+
+            if updates:
+                await loop.run_in_executor(executor, self.apply_updates, updates, changes)
+                empty_since = time.monotonic()
+                empty_notified = False
+                await loop.run_in_executor(executor, self.save_snapshot_if_due, finished)
+            elif finished and self.snapshot_path and self.snapshot_dirty:
+                await loop.run_in_executor(executor, self.save_snapshot)
+
+            if changes and changes_since is None:
+                changes_since = time.monotonic()
+
+            window_closed = changes_since is not None and time.monotonic() - changes_since >= self.notify_interval
+            if changes and (finished or window_closed or len(changes) >= self.notify_max_changes):
+                self.notify_observers_async('queue_updated', changes)
+                changes = ChangeSet()
+                changes_since = None
+
+            if not empty_notified and self.updates.empty() and time.monotonic() - empty_since >= self.seconds_for_empty_queue:
+                self.notify_observers_async('queue_empty')
+                empty_notified = True
 
-                    # Add the update to the queue
-                    self.queue.put((filename, last_modified))
+            if finished:
+                # Let the observer tasks scheduled so far finish before returning
+                if self.observer_tasks:
+                    await asyncio.gather(*self.observer_tasks, return_exceptions=True)
+                return
 
-            # Check if the queue is empty
-            if self.queue.empty():
-                # Stop the timer
-                self.empty_queue_timer.cancel()
+    def notify_observers_async(self, method, *args):
+        """Calls the given method on every observer that has it, scheduling coroutine methods as tasks on the running loop"""
+        for observer in self.observers:
+            callback = getattr(observer, method, None)
+            if callback is None:
+                continue
+            if asyncio.iscoroutinefunction(callback):
+                task = asyncio.get_running_loop().create_task(callback(*args))
+                self.observer_tasks.add(task)
+                task.add_done_callback(self.observer_tasks.discard)
+            else:
+                callback(*args)
+
+    def scan_directory(self):
+        """Returns {filename: (inode, last_modified, size)} for every watched file in the input directory"""
+        return scan_directory(self.input_dir, recursive=self.recursive, ignore=self.ignore)
+
+    def check_directory(self):
+        """Compares the input directory against the last scan and queues an update for every change"""
+        for update in self.diff_directory(self.scan_directory()):
+            self.queue.put(update)
+
+    def diff_directory(self, file_stats):
+        """Returns the updates for every change between the last scan and file_stats, which becomes the last scan"""
+        updates = []
+        removed = {filename: stats for filename, stats in self.file_stats.items() if filename not in file_stats}
+        removed_by_inode = {stats[0]: filename for filename, stats in removed.items()}
+
+        for filename, stats in file_stats.items():
+            previous = self.file_stats.get(filename)
+            if previous is None and stats[0] in removed_by_inode:
+                # Same inode under a new name is a rename, the content doesn't need to be read again
+                old_filename = removed_by_inode.pop(stats[0])
+                updates.append(FileRenamed(old_filename, filename, stats[1]))
+                if removed[old_filename][1:] != stats[1:]:
+                    updates.append((filename, stats[1]))
+            elif previous != stats:
+                # A new inode at the same path is a replaced file, even with the same time and size
+                updates.append((filename, stats[1]))
 
-                # Start the timer again to send the empty queue message
-                self.empty_queue_timer = threading.Timer(10, self.empty_queue_message)
-                self.empty_queue_timer.start()
+        for filename in removed_by_inode.values():
+            updates.append(FileRemoved(filename))
+
+        self.file_stats = file_stats
+        return updates
+
+    def watch_directory(self):
+        """Polls the directory for changes, putting them on the queue, for use without the event loop"""
+        while True:
+            # Check for new, modified, renamed or removed files in the directory
+            self.check_directory()
 
             # Wait for a short period of time before checking again
-            time.sleep(1)
+            time.sleep(self.poll_interval)
 
     def process_queue(self):
-        queue_empty_time = None
+        """Applies updates from the queue until a None is put on it, for use without the event loop"""
+        changes = ChangeSet()
+        changes_since = None
 
         while True:
-            # Wait for an update to the DataFrame to be added to the queue
-            update = self.queue.get()
+            # Wait for updates to the DataFrame to be added to the queue, batching whatever else is already waiting.
+            # While changes are pending, only wait until their notification window closes.
+            timeout = None
+            if changes_since is not None:
+                timeout = max(0, self.notify_interval - (time.monotonic() - changes_since))
+            updates, finished = self.next_updates(timeout)
 
-            # Check if the update is a tuple with two elements
-            if not isinstance(update, tuple) or len(update) != 2:
+            self.apply_updates(updates, changes)
+
+            if changes and changes_since is None:
+                changes_since = time.monotonic()
+
+            self.save_snapshot_if_due(finished)
+
+            # Notify observers once the window closes, enough changes piled up, or the queue ends
+            window_closed = changes_since is not None and time.monotonic() - changes_since >= self.notify_interval
+            if changes and (finished or window_closed or len(changes) >= self.notify_max_changes):
+                self.notify_observers('queue_updated', changes)
+                changes = ChangeSet()
+                changes_since = None
+
+            if finished:
                 break
 
-            # Reset the queue empty time
-            queue_empty_time = None
+    def apply_updates(self, updates, changes):
+        """Applies a batch of updates to the DataFrame, recording them in the ChangeSet, and tokenizes changed rows"""
+        changed = []
+        for update in updates:
+            if isinstance(update, FileRemoved):
+                # The row may already have moved if the rename was matched by content hash
+                if self.remove_row(update.path):
+                    changes.remove(update.path)
+                    self.snapshot_dirty = True
+                continue
+
+            if isinstance(update, FileRenamed):
+                if self.rename_row(update.old_path, update.new_path, update.last_modified):
+                    changes.rename(update.old_path, update.new_path)
+                    self.snapshot_dirty = True
+                    continue
+                update = (update.new_path, update.last_modified)
+
+            filename, last_modified = update
+
+            # Stat before reading, so a write during the read makes the snapshot stale rather than wrong
+            stats = self.stat_file(filename)
+            data = self.process_file(filename)
+            self.snapshot_dirty = True
+            if stats is not None:
+                self.row_stats[filename] = stats
+            data_hash = content_hash(data)
 
             # Check if the file already exists in the DataFrame
-            index = self.df.index[self.df['ingest_file_path'] == update[0]].tolist()
+            index = self.df.index[self.df['ingest_file_path'] == filename].tolist()
+
+            # A new file with the content of a file that no longer exists is a rename the watcher couldn't match by inode
+            if len(index) == 0:
+                moved_from = self.find_moved_row(data_hash)
+                if moved_from is not None:
+                    self.rename_row(moved_from, filename, last_modified)
+                    changes.rename(moved_from, filename)
+                    continue
 
             if len(index) > 0:
-                # Update the existing row
-                self.df.at[index[0], 'ingest_file_last_modified'] = update[1]
-                self.df.at[index[0], 'data'] = self.process_file(update[0])
+                # Update the existing row, only re-tokenizing if the content actually changed
+                self.df.at[index[0], 'ingest_file_last_modified'] = last_modified
+                if self.df.at[index[0], 'content_hash'] != data_hash:
+                    self.df.at[index[0], 'data'] = data
+                    self.df.at[index[0], 'content_hash'] = data_hash
+                    changed.append(filename)
+                    changes.modify(filename)
             else:
                 # Add a new row to the DataFrame
-                new_row = pd.DataFrame({'ingest_file_path': [update[0]],
-                                        'ingest_file_last_modified': [update[1]],
-                                        'data': [self.process_file(update[0])]},
+                new_row = pd.DataFrame({'ingest_file_path': [filename],
+                                        'ingest_file_last_modified': [last_modified],
+                                        'data': [data],
+                                        'content_hash': [data_hash],
+                                        'tokens': [None]},
                                         )
                 self.df = pd.concat([self.df, new_row], ignore_index=True)
+                changed.append(filename)
+                changes.add(filename)
 
-            # Notify observers that the queue has been updated
-            for observer in self.observers:
-                observer.queue_updated(self.df)
+        # Rows are looked up by path as removals in the batch may have moved the index
+        self.tokenize_rows(self.df.index[self.df['ingest_file_path'].isin(changed)].tolist())
 
-        # Check if the queue has been empty for X seconds
-        if queue_empty_time is None:
-            queue_empty_time = time.monotonic()
+    def save_snapshot_if_due(self, finished=False):
+        """Saves the snapshot if rows changed since the last save and snapshot_interval passed, or the queue ended"""
+        if self.snapshot_path and self.snapshot_dirty and (finished or time.monotonic() - self.snapshot_saved >= self.snapshot_interval):
+            self.save_snapshot()
 
-        if time.monotonic() - queue_empty_time > self.seconds_for_empty_queue:
-            # Notify observers that the queue has been empty for X seconds
-            for observer in self.observers:
-                observer.queue_empty()
+    @staticmethod
+    def is_update(update):
+        """Anything that isn't a file message or a (filename, last_modified) tuple signals the end of the queue"""
+        return isinstance(update, (FileRemoved, FileRenamed)) or (isinstance(update, tuple) and len(update) == 2)
+
+    def next_updates(self, timeout=None):
+        """Blocks for the next update, then drains up to tokenize_batch_size updates already in the queue"""
+        updates = []
+        try:
+            update = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return updates, False
+        while True:
+            if not self.is_update(update):
+                return updates, True
+
+            updates.append(update)
+            if len(updates) >= self.tokenize_batch_size:
+                return updates, False
+
+            try:
+                update = self.queue.get_nowait()
+            except queue.Empty:
+                return updates, False
+
+    def remove_row(self, filename):
+        """Drops the row of a removed file from the DataFrame, returns False if there was no row"""
+        mask = self.df['ingest_file_path'] == filename
+        if not mask.any():
+            return False
+        self.df = self.df[~mask]
+        self.row_stats.pop(filename, None)
+        return True
+
+    def rename_row(self, old_filename, new_filename, last_modified):
+        """Moves a row to a new path without re-reading the file, returns False if there is no row to move"""
+        index = self.df.index[self.df['ingest_file_path'] == old_filename].tolist()
+        if len(index) == 0:
+            return False
+
+        # Renamed over an existing file, the old row for that path is replaced
+        self.remove_row(new_filename)
+        self.df.at[index[0], 'ingest_file_path'] = new_filename
+        self.df.at[index[0], 'ingest_file_last_modified'] = last_modified
+        stats = self.row_stats.pop(old_filename, None)
+        # A rename matched by content hash already recorded the stats of the file it read at the new path
+        if stats is not None and new_filename not in self.row_stats:
+            self.row_stats[new_filename] = (stats[0], last_modified, stats[2])
+        return True
+
+    def find_moved_row(self, data_hash):
+        """Returns the path of a row with the given content hash whose file no longer exists, if any"""
+        for filename in self.df.loc[self.df['content_hash'] == data_hash, 'ingest_file_path']:
+            if not os.path.exists(os.path.join(self.input_dir, filename)):
+                return filename
+        return None
+
+    def tokenize_rows(self, indices):
+        """Tokenizes the data of the given DataFrame rows, using the token cache and batching cache misses"""
+        if not self.tokenizer or not indices:
+            return
+
+        tokens_by_hash = {}
+        missing = {}
+        for i in indices:
+            data_hash = self.df.at[i, 'content_hash']
+            if data_hash in tokens_by_hash or data_hash in missing:
+                continue
+            cached = self.token_cache.get(data_hash) if self.token_cache else None
+            if cached is not None:
+                tokens_by_hash[data_hash] = cached
+            else:
+                self.load_data([i])
+                missing[data_hash] = self.df.at[i, 'data']
+
+        hashes = list(missing)
+        for start in range(0, len(hashes), self.tokenize_batch_size):
+            batch = hashes[start:start + self.tokenize_batch_size]
+            encoded = self.tokenizer.encode_batch([missing[h] for h in batch])
+            for data_hash, ids in zip(batch, encoded):
+                tokens = np.asarray(ids, dtype=np.uint32)
+                tokens_by_hash[data_hash] = tokens
+                if self.token_cache:
+                    self.token_cache.put(data_hash, tokens)
+
+        # Assign through a Series so single-token arrays aren't unpacked into scalars
+        self.df.loc[indices, 'tokens'] = pd.Series(
+            [tokens_by_hash[self.df.at[i, 'content_hash']] for i in indices], index=indices, dtype=object)
+
+    def load_data(self, indices=None):
+        """Reads the data of the given DataFrame rows, or of every row, that were restored from the snapshot without it"""
+        for i in self.df.index.tolist() if indices is None else indices:
+            if pd.isna(self.df.at[i, 'data']):
+                self.df.at[i, 'data'] = self.process_file(self.df.at[i, 'ingest_file_path'])
+
+    def notify_observers(self, method, *args):
+        """Calls the given method on every observer that has it, scheduling coroutine methods on the observer loop"""
+        for observer in self.observers:
+            callback = getattr(observer, method, None)
+            if callback is None:
+                continue
+            if asyncio.iscoroutinefunction(callback):
+                asyncio.run_coroutine_threadsafe(callback(*args), self.get_observer_loop())
+            else:
+                callback(*args)
 
+    def get_observer_loop(self):
+        """Returns the event loop async observers run on, starting it in a daemon thread on first use"""
+        if self.observer_loop is None:
+            self.observer_loop = asyncio.new_event_loop()
+            threading.Thread(target=self.observer_loop.run_forever, daemon=True).start()
+        return self.observer_loop
 
     def process_file(self, filename):
         file_path = os.path.join(self.input_dir, filename)
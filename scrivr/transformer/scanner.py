@@ -0,0 +1,125 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+class IgnoreRules:
+    """
+    Gitignore-style ignore patterns, matched against paths relative to the watched directory.
+
+    Supports `#` comments, `!` negation, a trailing `/` for directories only, a leading or
+    inner `/` to anchor a pattern to the root, and `*`, `?`, `[...]` and `**` wildcards.
+    As with gitignore the last matching pattern wins, and nothing inside an ignored
+    directory is ever looked at.
+    """
+
+    def __init__(self, patterns: Optional[List[str]] = None):
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for pattern in patterns or []:
+            self.add(pattern)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'IgnoreRules':
+        with open(path, 'r') as f:
+            return cls(f.read().splitlines())
+
+    def add(self, pattern: str) -> None:
+        pattern = pattern.rstrip()
+        if not pattern or pattern.startswith('#'):
+            return
+
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        # Patterns without an inner slash match a name at any depth
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        regex = self.translate(pattern)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+
+        self.rules.append((re.compile(regex + '$'), negate, dir_only))
+
+    @staticmethod
+    def translate(pattern: str) -> str:
+        """Converts a glob pattern to a regex where `*` and `?` don't cross directories"""
+        regex = ''
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+            elif pattern.startswith('**', i):
+                regex += '.*'
+                i += 2
+            elif pattern[i] == '*':
+                regex += '[^/]*'
+                i += 1
+            elif pattern[i] == '?':
+                regex += '[^/]'
+                i += 1
+            elif pattern[i] == '[' and ']' in pattern[i + 2 + pattern.startswith('!', i + 1):]:
+                # Like fnmatch, only a leading `!` negates, a `]` right after it is literal, and the
+                # rest of the class is taken literally apart from ranges
+                negate = pattern.startswith('!', i + 1)
+                start = i + 1 + negate
+                end = pattern.index(']', start + 1)
+                content = re.sub(r'([\\^\[\]])', r'\\\1', pattern[start:end])
+                regex += '[' + ('^' if negate else '') + content + ']'
+                i = end + 1
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        return regex
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        rel_path = rel_path.replace(os.sep, '/')
+        ignored = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+
+def scan_directory(root: str, recursive: bool = False, ignore: Optional[IgnoreRules] = None) -> Dict[str, Tuple[int, float, int]]:
+    """
+    Returns {relative path: (inode, last_modified, size)} for the files under root.
+
+    Uses os.scandir so file types come from the directory listing, and applies the ignore
+    rules before any file is stat'ed or any ignored directory is descended into. Files and
+    subdirectories that vanish or can't be read during the walk are left out.
+    """
+    file_stats = {}
+    directories = ['']
+    while directories:
+        rel_dir = directories.pop()
+        try:
+            entries = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            # A subdirectory removed or made unreadable during the walk is skipped, a missing root is an error
+            if not rel_dir:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if ignore and ignore.is_ignored(rel_path, is_dir):
+                        continue
+                    if is_dir:
+                        if recursive:
+                            directories.append(rel_path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        file_stats[rel_path] = (stat.st_ino, stat.st_mtime, stat.st_size)
+                except OSError:
+                    # Removed or unreadable since the directory was listed
+                    continue
+    return file_stats
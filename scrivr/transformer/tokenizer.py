@@ -0,0 +1,150 @@
+import os
+import hashlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+
+def content_hash(text: str) -> str:
+    """Returns the sha256 hex digest of the given text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class Tokenizer:
+    """Base class for tokenizers used by the TransformerPreprocessor"""
+    name = 'tokenizer'
+    vocab_size = 0
+
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        pass
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    """Wraps a local HuggingFace `tokenizers` vocab file (tokenizer.json)"""
+
+    def __init__(self, vocab_path: str):
+        try:
+            from tokenizers import Tokenizer as HFTokenizer
+        except ImportError as e:
+            raise ImportError("The 'tokenizers' package is required to load a HuggingFace vocab file.") from e
+
+        if not os.path.isfile(vocab_path):
+            raise FileNotFoundError(f"Tokenizer vocab file not found at path: {vocab_path}")
+
+        self.vocab_path = vocab_path
+        self._tokenizer = HFTokenizer.from_file(vocab_path)
+        self.vocab_size = self._tokenizer.get_vocab_size()
+
+        # Namespace cached tokens by vocab contents so swapping vocabs never serves stale tokens
+        with open(vocab_path, 'rb') as f:
+            self.name = 'hf-' + hashlib.sha256(f.read()).hexdigest()[:16]
+
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        return [encoding.ids for encoding in self._tokenizer.encode_batch(texts)]
+
+
+class SimpleBPETokenizer(Tokenizer):
+    """
+    Minimal byte-level BPE tokenizer.
+
+    Token ids 0-255 are raw bytes, each merge adds one id on top of that. With no merges
+    it degrades to a plain byte tokenizer, which is enough for tests and small corpora.
+    """
+
+    def __init__(self, merges: Optional[List[Tuple[int, int]]] = None):
+        self.merges = [tuple(merge) for merge in (merges or [])]
+        self.ranks: Dict[Tuple[int, int], int] = {pair: i for i, pair in enumerate(self.merges)}
+        self.vocab_size = 256 + len(self.merges)
+        self.name = 'bpe-' + hashlib.sha256(repr(self.merges).encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def train(cls, texts: List[str], vocab_size: int) -> 'SimpleBPETokenizer':
+        """Learns merges from the given texts until vocab_size is reached or no pair repeats"""
+        sequences = [list(text.encode('utf-8')) for text in texts]
+        merges = []
+
+        while 256 + len(merges) < vocab_size:
+            counts: Dict[Tuple[int, int], int] = {}
+            for ids in sequences:
+                for pair in zip(ids, ids[1:]):
+                    counts[pair] = counts.get(pair, 0) + 1
+            if not counts:
+                break
+            pair = max(counts, key=counts.get)
+            if counts[pair] < 2:
+                break
+            new_id = 256 + len(merges)
+            merges.append(pair)
+            sequences = [cls._merge(ids, pair, new_id) for ids in sequences]
+
+        return cls(merges)
+
+    @staticmethod
+    def _merge(ids: List[int], pair: Tuple[int, int], new_id: int) -> List[int]:
+        merged = []
+        i = 0
+        while i < len(ids):
+            if i < len(ids) - 1 and (ids[i], ids[i + 1]) == pair:
+                merged.append(new_id)
+                i += 2
+            else:
+                merged.append(ids[i])
+                i += 1
+        return merged
+
+    def encode(self, text: str) -> List[int]:
+        ids = list(text.encode('utf-8'))
+        while len(ids) > 1:
+            # Apply the earliest learned merge present in the sequence
+            pair = min(zip(ids, ids[1:]), key=lambda p: self.ranks.get(p, float('inf')))
+            if pair not in self.ranks:
+                break
+            ids = self._merge(ids, pair, 256 + self.ranks[pair])
+        return ids
+
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        return [self.encode(text) for text in texts]
+
+    def decode(self, ids: List[int]) -> str:
+        vocab = {i: bytes([i]) for i in range(256)}
+        for i, (a, b) in enumerate(self.merges):
+            vocab[256 + i] = vocab[a] + vocab[b]
+        return b''.join(vocab[i] for i in ids).decode('utf-8', errors='replace')
+
+
+def load_tokenizer(vocab_path: Optional[str] = None) -> Tokenizer:
+    """Returns a HuggingFaceTokenizer for the given vocab file, or a SimpleBPETokenizer if none is given"""
+    if vocab_path:
+        return HuggingFaceTokenizer(vocab_path)
+    return SimpleBPETokenizer()
+
+
+class TokenCache:
+    """
+    On-disk cache of token arrays keyed by content hash.
+
+    Arrays are stored as `.npy` files under a per-tokenizer namespace, so the same content
+    is tokenized at most once per tokenizer regardless of file path or restarts.
+    """
+
+    def __init__(self, cache_dir: str, namespace: str = ''):
+        self.cache_dir = os.path.join(cache_dir, namespace) if namespace else cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        return np.load(path)
+
+    def put(self, key: str, tokens: np.ndarray) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file and rename so readers never see a partial array
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, tokens)
+        os.replace(tmp_path, path)
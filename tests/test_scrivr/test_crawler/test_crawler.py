@@ -0,0 +1,155 @@
+import os
+import gzip
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from scrivr.crawler import ScrivrCrawler
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import ProcessingRule, RemoveDuplicateEmptyLinesRule
+
+PAGES = {
+    '/': b'<html><body>\n\n<a href="/a.html">a</a>\n\n<a href="b.html#top">b</a>\n<a href="http://elsewhere.invalid/">x</a></body></html>',
+    '/a.html': b'<p>page a</p>\n\n\n<a href="/">home</a>',
+    '/b.html': b'<p>page b</p>',
+}
+
+
+class FailingRule(ProcessingRule):
+    def process(self, text):
+        if 'page b' in text:
+            raise ValueError("rule failed")
+        return text
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        StandInHandler.requests.append((self.path, time.monotonic(), dict(self.headers)))
+        body = PAGES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = '"{}"'.format(hash(body))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestScrivrCrawler(unittest.TestCase):
+    def setUp(self):
+        StandInHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+        self.test_dir = tempfile.mkdtemp()
+        self.parser = ScrivrParser()
+        self.parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+
+    def test_crawl_parses_pages_without_disk(self):
+        crawler = ScrivrCrawler([self.base_url + '/a.html'], parser=self.parser, politeness_delay=0)
+        results = crawler.run()
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].status, 200)
+        self.assertEqual(results[0].text, '<p>page a</p>\n<a href="/">home</a>')
+        self.assertIsNone(results[0].output_path)
+
+    def test_follow_links_and_write_output(self):
+        crawler = ScrivrCrawler([self.base_url + '/'], output_dir=self.test_dir, parser=self.parser,
+                                politeness_delay=0, follow_links=True)
+        results = crawler.run()
+
+        self.assertCountEqual([result.url for result in results],
+                              [self.base_url + '/', self.base_url + '/a.html', self.base_url + '/b.html'])
+
+        host_dir = os.path.join(self.test_dir, '127.0.0.1_{}'.format(self.server.server_address[1]))
+        with open(os.path.join(host_dir, 'b.html')) as f:
+            self.assertEqual(f.read(), '<p>page b</p>')
+        self.assertTrue(os.path.exists(os.path.join(host_dir, 'index.html')))
+
+    def test_compressed_output_filetype(self):
+        self.parser.output_filetype = 'txt.gz'
+        results = ScrivrCrawler([self.base_url + '/b.html'], output_dir=self.test_dir, parser=self.parser, politeness_delay=0).run()
+
+        self.assertTrue(results[0].output_path.endswith('b.txt.gz'))
+        with gzip.open(results[0].output_path, 'rt') as f:
+            self.assertEqual(f.read(), '<p>page b</p>')
+
+    def test_conditional_requests_skip_unchanged_pages(self):
+        state_path = os.path.join(self.test_dir, 'state.json')
+        ScrivrCrawler([self.base_url + '/b.html'], parser=self.parser, politeness_delay=0, state_path=state_path).run()
+
+        results = ScrivrCrawler([self.base_url + '/b.html'], parser=self.parser, politeness_delay=0, state_path=state_path).run()
+
+        self.assertEqual(results[0].status, 304)
+        self.assertIsNone(results[0].text)
+        self.assertIn('If-None-Match', StandInHandler.requests[-1][2])
+
+    def test_politeness_delay(self):
+        urls = [self.base_url + path for path in PAGES]
+        ScrivrCrawler(urls, parser=self.parser, politeness_delay=0.2, max_concurrency=3).run()
+
+        times = sorted(request[1] for request in StandInHandler.requests)
+        self.assertEqual(len(times), 3)
+        for earlier, later in zip(times, times[1:]):
+            self.assertGreaterEqual(later - earlier, 0.15)
+
+    def test_max_pages(self):
+        crawler = ScrivrCrawler([self.base_url + '/'], parser=self.parser, politeness_delay=0, follow_links=True, max_pages=2)
+        self.assertEqual(len(crawler.run()), 2)
+
+
+    def test_failing_rule_is_recorded_and_crawl_returns(self):
+        self.parser.processing_rules = [FailingRule()]
+        crawler = ScrivrCrawler([self.base_url + '/b.html', self.base_url + '/a.html'], parser=self.parser,
+                                politeness_delay=0, max_concurrency=1)
+        with self.assertWarns(UserWarning):
+            results = crawler.run()
+
+        results = {result.url: result for result in results}
+        self.assertEqual(results[self.base_url + '/a.html'].status, 200)
+        failed = results[self.base_url + '/b.html']
+        self.assertIsNone(failed.status)
+        self.assertIsNone(failed.text)
+        self.assertIn('rule failed', failed.error)
+
+    def test_failed_page_is_fetched_again(self):
+        state_path = os.path.join(self.test_dir, 'state.json')
+        self.parser.processing_rules = [FailingRule()]
+        with self.assertWarns(UserWarning):
+            ScrivrCrawler([self.base_url + '/b.html'], parser=self.parser, politeness_delay=0, state_path=state_path).run()
+
+        self.parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        results = ScrivrCrawler([self.base_url + '/b.html'], parser=self.parser, politeness_delay=0, state_path=state_path).run()
+
+        self.assertEqual(results[0].status, 200)
+        self.assertEqual(results[0].text, '<p>page b</p>')
+        self.assertNotIn('If-None-Match', StandInHandler.requests[-1][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
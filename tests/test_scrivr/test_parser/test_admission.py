@@ -0,0 +1,100 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import HtmlToMarkdownRule, RemoveDuplicateEmptyLinesRule
+from scrivr.parser.admission import AdmissionScheduler, estimate_memory
+
+
+class TestAdmissionScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.rules = [RemoveDuplicateEmptyLinesRule()]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def write_file(self, filename, size):
+        path = os.path.join(self.test_dir, filename)
+        with open(path, "w") as f:
+            f.write("a\n" * (size // 2))
+        return path
+
+    def test_estimate_memory(self):
+        path = self.write_file("a.txt", 100)
+        self.assertEqual(estimate_memory(path, self.rules), 500)
+        self.assertEqual(estimate_memory(path, [RemoveDuplicateEmptyLinesRule(), HtmlToMarkdownRule()]), 1300)
+        self.assertEqual(estimate_memory(path, []), 300)
+
+        compressed_path = os.path.join(self.test_dir, "a.txt.gz")
+        with gzip.open(compressed_path, "wb") as f:
+            f.write(b"a" * 1000)
+        self.assertEqual(estimate_memory(compressed_path, []), os.path.getsize(compressed_path) * 5 * 3)
+
+    def test_small_files_flow_past_big_ones(self):
+        big = self.write_file("big.txt", 1000)
+        small = [self.write_file("small{}.txt".format(i), 100) for i in range(3)]
+        scheduler = AdmissionScheduler([big, *small], self.rules, memory_budget=5600)
+
+        self.assertEqual(scheduler.next(), big)
+        self.assertEqual(scheduler.next(), small[0])
+        self.assertIsNone(scheduler.next())
+
+        scheduler.release(small[0])
+        self.assertEqual(scheduler.next(), small[1])
+        scheduler.release(big)
+        self.assertEqual(scheduler.next(), small[2])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_waiting_file_is_not_starved(self):
+        big = self.write_file("big.txt", 1000)
+        waiting = self.write_file("waiting.txt", 1000)
+        small = [self.write_file("small{}.txt".format(i), 100) for i in range(5)]
+        scheduler = AdmissionScheduler([big, waiting, *small], self.rules, memory_budget=6000, max_bypass=2)
+
+        self.assertEqual(scheduler.next(), big)
+        self.assertEqual(scheduler.next(), small[0])
+        scheduler.release(small[0])
+        self.assertEqual(scheduler.next(), small[1])
+        scheduler.release(small[1])
+
+        # The waiting file has been passed over twice, so nothing else starts before it
+        self.assertIsNone(scheduler.next())
+        scheduler.release(big)
+        self.assertEqual(scheduler.next(), waiting)
+        self.assertEqual(scheduler.next(), small[2])
+
+    def test_file_larger_than_budget_runs_alone(self):
+        huge = self.write_file("huge.txt", 1000)
+        small = self.write_file("small.txt", 100)
+        scheduler = AdmissionScheduler([small, huge], self.rules, memory_budget=1000)
+
+        self.assertEqual(scheduler.next(), small)
+        self.assertIsNone(scheduler.next())
+        scheduler.release(small)
+        self.assertEqual(scheduler.next(), huge)
+
+
+class TestMemoryBudget(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.test_dir, "output")
+        os.makedirs(self.input_dir)
+        for i in range(10):
+            with open(os.path.join(self.input_dir, "file{}.txt".format(i)), "w") as f:
+                f.write("doc {}\n\n\n".format(i) * (1000 if i == 3 else 1))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def test_process_files_with_memory_budget(self):
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, num_processes=3, memory_budget=20000)
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        scrivr.process_files()
+
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted(os.listdir(self.input_dir)))
+        with open(os.path.join(self.output_dir, "file3.txt"), "r") as f:
+            self.assertEqual(f.read().count("doc 3"), 1000)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import ProcessingRule, RemoveDuplicateEmptyLinesRule
+from scrivr.parser.autotune import AutoTuner, default_worker_counts, stratified_sample
+
+
+class ExitRule(ProcessingRule):
+    def process(self, text):
+        os._exit(3)
+
+
+class TestAutoTuner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        os.makedirs(self.input_dir)
+        self.file_paths = []
+        for i in range(40):
+            path = os.path.join(self.input_dir, "file{}.txt".format(i))
+            with open(path, "w") as f:
+                f.write("line\n\n\n" * (1 + i * i))
+            self.file_paths.append(path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def parser(self):
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=os.path.join(self.test_dir, "output"))
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        return scrivr
+
+    def test_stratified_sample(self):
+        sample = stratified_sample(self.file_paths, 10)
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(len(set(sample)), 10)
+
+        # Every size band is represented, including the largest files
+        indices = sorted(self.file_paths.index(path) for path in sample)
+        self.assertEqual([sum(1 for i in indices if band * 10 <= i < (band + 1) * 10) for band in range(4)], [2, 2, 3, 3])
+        self.assertEqual(stratified_sample(self.file_paths, 10), sample)
+        self.assertEqual(stratified_sample(self.file_paths[:5], 10), self.file_paths[:5])
+
+    def test_default_worker_counts(self):
+        counts = default_worker_counts()
+        self.assertEqual(counts[0], 1)
+        self.assertEqual(counts[-1], os.cpu_count() or 1)
+
+    def test_run_and_apply(self):
+        scrivr = self.parser()
+        tuner = AutoTuner(scrivr, sample_size=12, worker_counts=[1, 2], batch_sizes=[1, 4])
+        results = tuner.run(self.file_paths)
+
+        self.assertEqual([(result["num_processes"], result["batch_size"]) for result in results], [(1, 1), (1, 4), (2, 1), (2, 4)])
+        for result in results:
+            self.assertGreater(result["bytes_per_second"], 0)
+            self.assertGreater(result["files_per_second"], 0)
+        self.assertFalse(os.path.exists(scrivr.output_dir))
+
+        best = tuner.best(results)
+        self.assertEqual(best["bytes_per_second"], max(result["bytes_per_second"] for result in results))
+        tuner.apply(best)
+        self.assertEqual((scrivr.num_processes, scrivr.batch_size), (best["num_processes"], best["batch_size"]))
+
+    def test_best_within_memory_limit(self):
+        results = [
+            {"num_processes": 8, "batch_size": 1, "bytes_per_second": 300, "peak_memory": 900},
+            {"num_processes": 4, "batch_size": 1, "bytes_per_second": 200, "peak_memory": 500},
+            {"num_processes": 1, "batch_size": 1, "bytes_per_second": 100, "peak_memory": 100},
+        ]
+        self.assertEqual(AutoTuner(self.parser()).best(results)["num_processes"], 8)
+        self.assertEqual(AutoTuner(self.parser(), memory_limit=600).best(results)["num_processes"], 4)
+        with self.assertRaises(ValueError):
+            AutoTuner(self.parser(), memory_limit=50).best(results)
+
+    def test_best_rejects_failed_and_unmeasured_results(self):
+        results = [
+            {"num_processes": 8, "batch_size": 1, "bytes_per_second": 400, "peak_memory": 100, "failed": True},
+            {"num_processes": 4, "batch_size": 1, "bytes_per_second": 300, "peak_memory": None, "failed": False},
+            {"num_processes": 1, "batch_size": 1, "bytes_per_second": 100, "peak_memory": 100, "failed": False},
+        ]
+        self.assertEqual(AutoTuner(self.parser()).best(results)["num_processes"], 4)
+        self.assertEqual(AutoTuner(self.parser(), memory_limit=600).best(results)["num_processes"], 1)
+        with self.assertRaises(ValueError):
+            AutoTuner(self.parser()).best(results[:1])
+
+    def test_crashing_workers_are_marked_failed(self):
+        scrivr = self.parser()
+        scrivr.processing_rules = [ExitRule()]
+        results = AutoTuner(scrivr, sample_size=4, worker_counts=[1], batch_sizes=[1]).run(self.file_paths)
+        self.assertTrue(results[0]["failed"])
+
+    def test_write_config(self):
+        config_path = os.path.join(self.test_dir, "config.yaml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump({"num_processes": 1, "processing_rules": [{"type": "RemoveDuplicateEmptyLinesRule"}]}, f)
+
+        AutoTuner.write_config(config_path, {"num_processes": 6, "batch_size": 16})
+
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f)
+        self.assertEqual(config["num_processes"], 6)
+        self.assertEqual(config["batch_size"], 16)
+        self.assertEqual(config["processing_rules"], [{"type": "RemoveDuplicateEmptyLinesRule"}])
+        self.assertEqual(ScrivrParser(config_path=config_path).num_processes, 6)
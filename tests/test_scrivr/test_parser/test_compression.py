@@ -0,0 +1,100 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import RemoveDuplicateEmptyLinesRule
+from scrivr.parser.compression import decompress_bytes, get_compression, open_file
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestOpenFile(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_get_compression(self):
+        self.assertEqual(get_compression('a.txt.gz'), 'gzip')
+        self.assertEqual(get_compression('a.txt.zst'), 'zstd')
+        self.assertIsNone(get_compression('a.txt'))
+
+    def test_gzip_round_trip(self):
+        path = os.path.join(self.test_dir, 'a.txt.gz')
+        with open_file(path, 'w', level=1) as f:
+            f.write('hello')
+
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(f.read(), 'hello')
+        with open_file(path, 'rb') as f:
+            self.assertEqual(f.read(), b'hello')
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        path = os.path.join(self.test_dir, 'a.txt.zst')
+        with open_file(path, 'w', level=10) as f:
+            f.write('hello' * 100)
+
+        self.assertLess(os.path.getsize(path), 100)
+        with open_file(path, 'rb') as f:
+            self.assertEqual(f.read(), b'hello' * 100)
+        self.assertEqual(decompress_bytes(path, zstandard.ZstdCompressor().compress(b'hi')), b'hi')
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_multiple_frames(self):
+        compressor = zstandard.ZstdCompressor()
+        data = compressor.compress(b'one ') + compressor.compress(b'two')
+        self.assertEqual(decompress_bytes('a.txt.zst', data), b'one two')
+
+    def test_plain_file(self):
+        path = os.path.join(self.test_dir, 'a.txt')
+        with open_file(path, 'w') as f:
+            f.write('hello')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'hello')
+
+
+class TestCompressedParsing(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, 'input')
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        os.makedirs(self.input_dir)
+        with gzip.open(os.path.join(self.input_dir, 'page.html.gz'), 'wb') as f:
+            f.write(b'<p>a</p>\r\n\r\n<p>b</p>')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def parse(self, **kwargs):
+        parser = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, **kwargs)
+        parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        parser.process_files()
+
+    def test_compressed_input_keeps_compressed_name(self):
+        self.parse()
+
+        with gzip.open(os.path.join(self.output_dir, 'page.html.gz'), 'rt') as f:
+            self.assertEqual(f.read(), '<p>a</p>\n<p>b</p>')
+
+    def test_output_filetype_replaces_inner_extension(self):
+        self.parse(output_filetype='md')
+
+        with open(os.path.join(self.output_dir, 'page.md')) as f:
+            self.assertEqual(f.read(), '<p>a</p>\n<p>b</p>')
+
+    def test_compressed_output_filetype(self):
+        self.parse(output_filetype='.md.gz', compression_level=9)
+
+        with gzip.open(os.path.join(self.output_dir, 'page.md.gz'), 'rt') as f:
+            self.assertEqual(f.read(), '<p>a</p>\n<p>b</p>')
+
+
+if __name__ == '__main__':
+    unittest.main()
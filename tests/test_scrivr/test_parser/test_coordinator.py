@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import ProcessingRule, RemoveDuplicateEmptyLinesRule
+from scrivr.parser.coordinator import WorkCoordinator, run_workers
+
+
+class PoisonRule(ProcessingRule):
+    def process(self, text):
+        if text.startswith("doc 4\n"):
+            raise ValueError("poison")
+        return text
+
+
+class TestWorkCoordinator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.test_dir, "output")
+        self.db_path = os.path.join(self.test_dir, "work.db")
+        os.makedirs(self.input_dir)
+        for i in range(20):
+            with open(os.path.join(self.input_dir, "file{}.txt".format(i)), "w") as f:
+                f.write("doc {}\n\n\nend".format(i))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def parser(self, num_processes=1):
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, num_processes=num_processes)
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        return scrivr
+
+    def plan(self, batch_size=3):
+        return WorkCoordinator(self.db_path).plan(self.input_dir, self.parser().list_files(), batch_size=batch_size)
+
+    def test_plan_and_claim(self):
+        self.assertEqual(self.plan(), 7)
+        coordinator = WorkCoordinator(self.db_path, worker_id="a")
+        self.assertEqual(coordinator.progress(), {"pending": 7, "claimed": 0, "done": 0, "failed": 0})
+
+        batch_id, rel_paths = coordinator.claim()
+        self.assertEqual(len(rel_paths), 3)
+        self.assertFalse(any(os.path.isabs(path) for path in rel_paths))
+        self.assertTrue(coordinator.heartbeat(batch_id))
+        self.assertTrue(coordinator.complete(batch_id))
+        self.assertEqual(coordinator.progress(), {"pending": 6, "claimed": 0, "done": 1, "failed": 0})
+
+        # Another worker gets a different batch
+        self.assertNotEqual(WorkCoordinator(self.db_path, worker_id="b").claim()[0], batch_id)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.plan(batch_size=20)
+        dead = WorkCoordinator(self.db_path, lease_seconds=-1, worker_id="dead")
+        batch_id, _ = dead.claim()
+
+        alive = WorkCoordinator(self.db_path, worker_id="alive")
+        self.assertEqual(alive.claim()[0], batch_id)
+        self.assertFalse(dead.heartbeat(batch_id))
+        self.assertFalse(dead.complete(batch_id))
+        self.assertTrue(alive.complete(batch_id))
+
+    def test_worker_waits_for_and_takes_over_dead_workers_batch(self):
+        self.plan()
+        WorkCoordinator(self.db_path, lease_seconds=0.3, worker_id="dead").claim()
+
+        completed = WorkCoordinator(self.db_path, lease_seconds=0.3).run_worker(self.parser())
+
+        self.assertEqual(completed, 7)
+        self.assertEqual(len(os.listdir(self.output_dir)), 20)
+
+    def test_several_worker_processes(self):
+        self.plan()
+        run_workers(self.db_path, self.parser(num_processes=3))
+
+        self.assertEqual(WorkCoordinator(self.db_path).progress(), {"pending": 0, "claimed": 0, "done": 7, "failed": 0})
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted(os.listdir(self.input_dir)))
+        with open(os.path.join(self.output_dir, "file5.txt"), "r") as f:
+            self.assertEqual(f.read(), "doc 5\nend")
+
+    def test_poison_batch_fails_and_other_batches_finish(self):
+        self.plan()
+        parser = self.parser()
+        parser.processing_rules = [PoisonRule()]
+
+        coordinator = WorkCoordinator(self.db_path, max_attempts=2)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            completed = coordinator.run_worker(parser)
+
+        self.assertEqual(completed, 6)
+        self.assertEqual(coordinator.progress(), {"pending": 0, "claimed": 0, "done": 6, "failed": 1})
+        (batch_id, rel_paths, error), = coordinator.failures()
+        self.assertIn("file4.txt", rel_paths)
+        self.assertIn("poison", error)
+
+    def test_expired_last_attempt_fails(self):
+        self.plan(batch_size=20)
+        WorkCoordinator(self.db_path, lease_seconds=-1, worker_id="dead", max_attempts=1).claim()
+
+        self.assertIsNone(WorkCoordinator(self.db_path, worker_id="alive", max_attempts=1).claim())
+        (_, _, error), = WorkCoordinator(self.db_path).failures()
+        self.assertEqual(error, "lease expired after 1 attempts")
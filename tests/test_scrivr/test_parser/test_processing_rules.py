@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import os.path
 from scrivr.parser.processing_rules import *
 import shutil
@@ -264,5 +265,87 @@ class TestTableFromPattern(unittest.TestCase):
         print(output_text)
         assert output_text == expected_output
 
+class TestProcessBatch(unittest.TestCase):
+    def setUp(self):
+        self.texts = [
+            "first\n\n\nsecret line\nkeep{#drop",
+            "",
+            "\n\n",
+            "secret",
+            "no newline at end{#",
+            "trailing newline\n",
+        ]
+
+    def assert_batch_matches(self, rule_factory):
+        expected = [rule_factory().process(text) for text in self.texts]
+        self.assertEqual(rule_factory().process_batch(self.texts), expected)
+
+    def test_line_local_rules(self):
+        self.assert_batch_matches(RemoveDuplicateEmptyLinesRule)
+        self.assert_batch_matches(lambda: DeleteTextAfterMatch("{#"))
+        self.assert_batch_matches(lambda: MatchStringsAction(action="delete_line", match_strings=["secret"]))
+        self.assert_batch_matches(lambda: MatchMultipleStringsAndActionRule("delete_line", ["secret", "keep"]))
+
+    def test_other_rules_fall_back_to_per_document(self):
+        self.assert_batch_matches(TableFromPattern)
+        self.assert_batch_matches(lambda: MatchAndActionRule("sec(ret)", "delete_line"))
+
+    def test_rule_that_would_change_boundary_falls_back(self):
+        rule = DeleteTextAfterMatch("\x00")
+        with unittest.mock.patch.object(rule, "process_lines", wraps=rule.process_lines) as mock_process_lines:
+            output = rule.process_batch(["a\nb", "c"])
+        self.assertEqual(output, ["a\nb", "c"])
+        self.assertEqual(mock_process_lines.call_count, 3)
+
+    def test_single_pass_over_batch(self):
+        rule = RemoveDuplicateEmptyLinesRule()
+        with unittest.mock.patch.object(rule, "process", wraps=rule.process) as mock_process:
+            rule.process_batch(self.texts)
+        mock_process.assert_not_called()
+
+class TestQualityFilterRule(unittest.TestCase):
+    def setUp(self):
+        self.good = "The quick brown fox jumps over the lazy dog.\nAnother line of normal text here."
+        self.symbols = "@@@ ### $$$ %%% 123 456"
+        self.menu = "Home\nAbout\nHome\nContact\nHome"
+        self.repeated = "buy now buy now buy now buy now buy now"
+
+    def test_features(self):
+        features = QualityFilterRule().features([self.good, self.symbols, self.menu, self.repeated, "", "caf\u00e9 na\u00efve"])
+        self.assertAlmostEqual(features["alpha_ratio"][0], 62 / 64)
+        self.assertEqual(features["alpha_ratio"][1], 0)
+        self.assertEqual(features["alpha_ratio"][5], 1)
+        self.assertAlmostEqual(features["line_repetition"][2], 2 / 5)
+        self.assertEqual(features["line_repetition"][0], 0)
+        self.assertAlmostEqual(features["mean_word_length"][1], 3)
+        self.assertAlmostEqual(features["ngram_repetition"][3], 6 / 8)
+        self.assertEqual(features["ngram_repetition"][0], 0)
+        self.assertEqual([features[name][4] for name in features], [0, 0, 0, 0])
+
+    def test_ngrams_do_not_cross_documents(self):
+        features = QualityFilterRule(ngram_size=2).features(["a b", "a b", "a b"])
+        self.assertEqual(list(features["ngram_repetition"]), [0, 0, 0])
+
+    def test_drop(self):
+        rule = create_processing_rule({"type": "QualityFilterRule", "min_alpha_ratio": 0.5,
+                                       "max_line_repetition": 0.3, "max_ngram_repetition": 0.5})
+        texts = [self.good, self.symbols, self.menu, self.repeated]
+        self.assertEqual(rule.process_batch(texts), [self.good, None, None, None])
+        self.assertEqual([rule.process(text) for text in texts], [self.good, None, None, None])
+
+    def test_tag(self):
+        rule = QualityFilterRule(action="tag", min_alpha_ratio=0.5, max_mean_word_length=10)
+        self.assertEqual(rule.process(self.good), self.good)
+        self.assertEqual(rule.process(self.symbols), "<!-- low quality: alpha_ratio=0.000 -->\n" + self.symbols)
+
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError):
+            QualityFilterRule(action="delete")
+        with self.assertRaises(ValueError):
+            QualityFilterRule(min_alpha=0.5)
+        for ngram_size in (0, -1, 1.5):
+            with self.assertRaises(ValueError):
+                QualityFilterRule(ngram_size=ngram_size)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,10 @@
 import os
 import io
+import json
 import shutil
+import time
 import tempfile
+import multiprocessing
 import unittest
 from unittest.mock import patch, MagicMock
 from typing import List
@@ -268,5 +271,232 @@ class TestParseFile(unittest.TestCase):
 
         os.remove(html_file_path)
 
+    def test_parse_bytes(self):
+        self.scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+
+        result = self.scrivr.parse_bytes('caf\u00e9\r\n\r\nbar'.encode('utf-8'))
+
+        self.assertEqual(result, 'caf\u00e9\nbar')
+
+class TestBatchParsing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        os.makedirs(self.input_dir)
+        for i in range(7):
+            with open(os.path.join(self.input_dir, "file{}.txt".format(i)), "w") as f:
+                f.write("doc {}\n\n\nsecret {}\n----\na    b\n----\n".format(i, i) * (i + 1))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def process(self, batch_size):
+        output_dir = os.path.join(self.test_dir, "output_{}".format(batch_size))
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=output_dir, num_processes=2, batch_size=batch_size)
+        scrivr.processing_rules = [
+            MatchStringsAction(action="delete_line", match_strings=["secret"]),
+            TableFromPattern(),
+            RemoveDuplicateEmptyLinesRule(),
+        ]
+        scrivr.process_files()
+        return output_dir
+
+    def test_batch_output_identical(self):
+        expected_dir = self.process(1)
+        batch_dir = self.process(3)
+
+        for filename in os.listdir(expected_dir):
+            self.assertTrue(filecmp.cmp(os.path.join(expected_dir, filename), os.path.join(batch_dir, filename), shallow=False))
+        self.assertEqual(len(os.listdir(batch_dir)), 7)
+
+    def test_dropped_documents_not_written(self):
+        output_dir = os.path.join(self.test_dir, "output_filtered")
+        with open(os.path.join(self.input_dir, "junk.txt"), "w") as f:
+            f.write("### 123 ### 456")
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=output_dir, batch_size=3)
+        scrivr.processing_rules = [QualityFilterRule(min_alpha_ratio=0.5), RemoveDuplicateEmptyLinesRule()]
+        scrivr.process_files()
+
+        self.assertEqual(len(os.listdir(output_dir)), 7)
+        self.assertNotIn("junk.txt", os.listdir(output_dir))
+        self.assertIsNone(scrivr.parse_text("### 123"))
+        self.assertEqual(scrivr.parse_texts(["### 123", "a\n\nb"]), [None, "a\nb"])
+
+    def test_parse_texts(self):
+        scrivr = ScrivrParser()
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule(), HtmlToMarkdownRule()]
+        texts = ["<h1>a</h1>\n\n<p>b</p>", "", "<p>c</p>"]
+
+        self.assertEqual(scrivr.parse_texts(texts), [scrivr.parse_text(text) for text in texts])
+
+def parse_in_child(parser, text, results):
+    """Parses text in a child process, reporting the output and whether a segment pool was asked for"""
+    from scrivr.parser import parser as parser_module
+    pool_requests = []
+    parser_module.get_segment_pool = pool_requests.append
+    results.put((parser.parse_text(text), len(pool_requests)))
+
+
+class SegmentPidRule(ProcessingRule):
+    """Replaces each segment with the id of the process that ran it"""
+    line_local = True
+
+    def process(self, text):
+        return "\n".join(self.process_lines(text.split("\n")))
+
+    def process_lines(self, lines):
+        time.sleep(0.01)
+        return [str(os.getpid())]
+
+
+class TestSegmentedParsing(unittest.TestCase):
+    def setUp(self) -> None:
+        lines = []
+        for i in range(400):
+            lines.append("line {} keep{{#drop".format(i) if i % 3 else "")
+            if i % 7 == 0:
+                lines.append("secret line {}".format(i))
+            if i % 50 == 0:
+                lines.append("----\nA    B\n1    2\n----")
+        self.text = "\n".join(lines) + "\n\n"
+
+    def parse(self, rules, split_threshold):
+        scrivr = ScrivrParser(num_processes=2, split_threshold=split_threshold, segment_size=200)
+        scrivr.processing_rules = rules
+        return scrivr.parse_text(self.text)
+
+    def rules(self):
+        return [
+            DeleteTextAfterMatch("{#"),
+            MatchStringsAction(action="delete_line", match_strings=["secret"]),
+            TableFromPattern(),
+            RemoveDuplicateEmptyLinesRule(),
+        ]
+
+    def test_line_local_flags(self):
+        self.assertTrue(RemoveDuplicateEmptyLinesRule().line_local)
+        self.assertTrue(DeleteTextAfterMatch("x").line_local)
+        self.assertTrue(MatchMultipleStringsAndActionRule("delete_line", ["x"]).line_local)
+        self.assertFalse(MatchMultipleStringsAndActionRule("delete", ["x"]).line_local)
+        self.assertFalse(MatchAndActionRule("x", "delete_line").line_local)
+        self.assertFalse(TableFromPattern().line_local)
+        self.assertFalse(HtmlToMarkdownRule().line_local)
+
+    def test_segmented_matches_whole_document(self):
+        expected = self.parse(self.rules(), split_threshold=None)
+
+        with patch.object(ScrivrParser, "parse_text_segmented", side_effect=ScrivrParser.parse_text_segmented, autospec=True) as mock_segmented:
+            output = self.parse(self.rules(), split_threshold=100)
+            mock_segmented.assert_called_once()
+
+        self.assertEqual(output, expected)
+        self.assertNotIn("secret", output)
+        self.assertNotIn("{#", output)
+
+    def test_segment_pool_is_reused(self):
+        scrivr = ScrivrParser(num_processes=2, split_threshold=100, segment_size=200)
+        scrivr.processing_rules = self.rules()
+
+        with patch("scrivr.parser.parser.multiprocessing.Pool", wraps=multiprocessing.Pool) as mock_pool:
+            first = scrivr.parse_text(self.text)
+            second = scrivr.parse_text(self.text)
+
+        self.assertEqual(first, second)
+        self.assertLessEqual(mock_pool.call_count, 1)
+
+    def test_worker_processes_segment_without_a_pool(self):
+        scrivr = ScrivrParser(num_processes=2, split_threshold=100, segment_size=200)
+        scrivr.processing_rules = self.rules()
+        expected = self.parse(self.rules(), split_threshold=None)
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        process = context.Process(target=parse_in_child, args=(scrivr, self.text, results))
+        process.start()
+        output, pool_requests = results.get(timeout=30)
+        process.join()
+
+        self.assertEqual(output, expected)
+        self.assertEqual(pool_requests, 0)
+
+    def test_process_files_spreads_segments_of_large_files(self):
+        test_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(test_dir, 'input')
+            output_dir = os.path.join(test_dir, 'output')
+            os.makedirs(input_dir)
+            with open(os.path.join(input_dir, 'large.txt'), 'w') as f:
+                f.write(self.text)
+            with open(os.path.join(input_dir, 'small.txt'), 'w') as f:
+                f.write('small')
+
+            status_path = os.path.join(test_dir, 'status.json')
+            scrivr = ScrivrParser(input_dir=input_dir, output_dir=output_dir, num_processes=2, split_threshold=1000,
+                                  segment_size=200, status_path=status_path)
+            scrivr.processing_rules = [SegmentPidRule()]
+            scrivr.process_files()
+
+            # The large file is reported by this process, as the worker after the two others
+            with open(status_path) as f:
+                status = json.load(f)
+            self.assertEqual((status['state'], status['files_done']), ('finished', 2))
+            self.assertEqual(status['workers'][2]['files'], 1)
+
+            with open(os.path.join(output_dir, 'large.txt')) as f:
+                pids = set(f.read().split("\n"))
+            self.assertGreater(len(pids), 1)
+            self.assertNotIn(str(os.getpid()), pids)
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, 'small.txt')))
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_split_lines(self):
+        from scrivr.parser.parser import split_lines
+        lines = ["a" * 10] * 10
+        segments = split_lines(lines, 25)
+        self.assertEqual(sum(segments, []), lines)
+        self.assertEqual([len(segment) for segment in segments], [3, 3, 3, 1])
+        self.assertEqual(split_lines([], 25), [[]])
+
+class TestParseIter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.items = [("doc{}".format(i), "doc {}\n\n\nsecret {}\nend".format(i, i)) for i in range(10)]
+        self.items.append(("bytes", "caf\u00e9\n\n\nsecret\n".encode("utf-8")))
+        self.expected = [(item_id, "doc {}\nend".format(i)) for i, (item_id, _) in enumerate(self.items[:-1])]
+        self.expected.append(("bytes", "caf\u00e9"))
+
+    def parser(self, **kwargs):
+        scrivr = ScrivrParser(**kwargs)
+        scrivr.processing_rules = [
+            MatchStringsAction(action="delete_line", match_strings=["secret"]),
+            RemoveDuplicateEmptyLinesRule(),
+        ]
+        return scrivr
+
+    def test_in_process(self):
+        results = self.parser().parse_iter(iter(self.items))
+        self.assertEqual(list(results), self.expected)
+
+    def test_pool_ordered(self):
+        results = self.parser(num_processes=2, batch_size=3).parse_iter(iter(self.items), prefetch=1)
+        self.assertEqual(list(results), self.expected)
+
+    def test_pool_unordered(self):
+        results = self.parser(num_processes=2).parse_iter(iter(self.items), ordered=False)
+        self.assertEqual(sorted(results), sorted(self.expected))
+
+    def test_reads_ahead_at_most_prefetch_batches(self):
+        consumed = []
+
+        def items():
+            for item in self.items:
+                consumed.append(item)
+                yield item
+
+        results = self.parser(num_processes=2).parse_iter(items(), prefetch=2)
+        self.assertEqual(next(results), self.expected[0])
+        self.assertEqual(len(consumed), 2)
+        results.close()
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,238 @@
+import io
+import os
+import gzip
+import json
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+import subprocess
+from unittest.mock import patch
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import RemoveDuplicateEmptyLinesRule
+from scrivr.parser.sources import TarSource, ZipSource, WarcSource, GitSource, create_input_source, open_input_source, safe_member_name, url_to_path
+
+FILES = {
+    'docs/a.html': b'<p>a</p>\n\n\n<p>a2</p>',
+    'docs/sub/b.html': b'<p>b</p>',
+    'c.txt': b'c\n\nc',
+}
+
+
+def warc_record(record_type, uri, block):
+    headers = 'WARC/1.0\r\nWARC-Type: {}\r\nWARC-Target-URI: {}\r\nWARC-Record-ID: <urn:uuid:{}>\r\nContent-Length: {}\r\n\r\n'.format(
+        record_type, uri, abs(hash(uri)), len(block))
+    return headers.encode('utf-8') + block + b'\r\n\r\n'
+
+
+class TestInputSources(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def make_tar(self, name, mode):
+        path = os.path.join(self.test_dir, name)
+        with tarfile.open(path, mode) as tar:
+            for member, data in FILES.items():
+                info = tarfile.TarInfo('./' + member)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def make_zip(self):
+        path = os.path.join(self.test_dir, 'input.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            for member, data in FILES.items():
+                archive.writestr(member, data)
+        return path
+
+    def make_warc(self, compressed=False):
+        records = [
+            warc_record('warcinfo', '', b'software: test'),
+            warc_record('response', 'http://example.com/', b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<p>home</p>'),
+            warc_record('request', 'http://example.com/', b'GET / HTTP/1.1\r\n\r\n'),
+            warc_record('response', 'http://example.com/docs/a.html', b'HTTP/1.1 200 OK\r\n\r\n<p>a</p>\n\n<p>a2</p>'),
+        ]
+        path = os.path.join(self.test_dir, 'input.warc' + ('.gz' if compressed else ''))
+        if compressed:
+            # Standard WARC.gz files compress each record as its own gzip member
+            with open(path, 'wb') as f:
+                for record in records:
+                    f.write(gzip.compress(record))
+        else:
+            with open(path, 'wb') as f:
+                f.write(b''.join(records))
+        return path
+
+    def read_all(self, source, num_partitions=2):
+        partitions = source.partitions(num_partitions)
+        if not partitions:
+            return {item.name: item for item in source.iter_items()}
+        return {item.name: item for partition in partitions for item in source.iter_items(partition)}
+
+    def test_tar_split_by_offset(self):
+        source = TarSource(self.make_tar('input.tar', 'w'))
+        self.assertEqual(len(source.partitions(2)), 2)
+
+        items = self.read_all(source)
+        self.assertEqual({name: item.data for name, item in items.items()}, FILES)
+        self.assertEqual(items['c.txt'].provenance['member'], 'c.txt')
+
+    def test_tar_gz_streamed(self):
+        source = TarSource(self.make_tar('input.tar.gz', 'w:gz'))
+        self.assertEqual(source.partitions(2), [])
+        self.assertEqual({name: item.data for name, item in self.read_all(source).items()}, FILES)
+
+    def test_zip(self):
+        source = ZipSource(self.make_zip())
+        self.assertEqual({name: item.data for name, item in self.read_all(source, 3).items()}, FILES)
+
+    def test_warc(self):
+        for compressed in (False, True):
+            source = WarcSource(self.make_warc(compressed))
+            items = self.read_all(source)
+
+            self.assertCountEqual(items, [url_to_path('http://example.com/'), url_to_path('http://example.com/docs/a.html')])
+            self.assertEqual(items[os.path.join('example.com', 'index.html')].data, b'<p>home</p>')
+            self.assertEqual(items[os.path.join('example.com', 'docs', 'a.html')].provenance['member'], 'http://example.com/docs/a.html')
+
+    def test_url_to_path_keeps_query_strings_apart(self):
+        paths = {url_to_path('http://example.com/search.html'), url_to_path('http://example.com/search.html?q=a'),
+                 url_to_path('http://example.com/search.html?q=b')}
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(url_to_path('http://example.com/search.html?q=a'), url_to_path('http://example.com/search.html?q=a'))
+        self.assertTrue(url_to_path('http://example.com/search.html?q=a').endswith('.html'))
+
+    def test_safe_member_name(self):
+        self.assertEqual(safe_member_name('..foo/a.txt'), os.path.join('..foo', 'a.txt'))
+        self.assertEqual(safe_member_name('/docs/./a.txt'), os.path.join('docs', 'a.txt'))
+        self.assertIsNone(safe_member_name('../a.txt'))
+        self.assertIsNone(safe_member_name('docs/../../a.txt'))
+        self.assertIsNone(safe_member_name('.'))
+
+    def test_open_input_source(self):
+        self.assertIsInstance(open_input_source(self.make_zip()), ZipSource)
+        self.assertIsInstance(open_input_source(self.make_warc()), WarcSource)
+        self.assertIsNone(open_input_source(self.test_dir))
+
+    def test_streamed_archive_sends_parser_once_per_worker(self):
+        path = self.make_tar('input.tgz', 'w:gz')
+        parser = ScrivrParser(input_dir=path, output_dir=os.path.join(self.test_dir, 'output'), num_processes=2)
+        parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+
+        pickled = []
+        def getstate(self):
+            pickled.append(1)
+            return self.__dict__
+
+        with patch.object(ScrivrParser, '__getstate__', getstate, create=True):
+            parser.process_files()
+
+        self.assertLessEqual(len(pickled), parser.num_processes)
+        self.assertTrue(os.path.isfile(os.path.join(self.test_dir, 'output', 'docs', 'a.html')))
+
+    def test_process_files_from_archive(self):
+        for path in (self.make_tar('input.tar', 'w'), self.make_tar('input.tgz', 'w:gz'), self.make_zip()):
+            output_dir = os.path.join(self.test_dir, 'output_' + os.path.basename(path))
+            parser = ScrivrParser(input_dir=path, output_dir=output_dir, num_processes=2)
+            parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+            parser.process_files()
+
+            with open(os.path.join(output_dir, 'docs', 'a.html')) as f:
+                self.assertEqual(f.read(), '<p>a</p>\n<p>a2</p>')
+
+            with open(os.path.join(output_dir, 'provenance.jsonl')) as f:
+                records = [json.loads(line) for line in f]
+            self.assertCountEqual([record['output'] for record in records],
+                                  [os.path.join('docs', 'a.html'), os.path.join('docs', 'sub', 'b.html'), 'c.txt'])
+            self.assertTrue(all(record['archive'] == path for record in records))
+
+
+class TestGitSource(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.repo_a = self.make_repo('repo_a', {'README.md': b'shared', 'docs/a.md': b'a\n\n\na', 'src/main.py': b'print()'})
+        self.repo_b = self.make_repo('repo_b', {'README.md': b'shared', 'docs/b.md': b'b'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def git(self, repo, *args):
+        env = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+                   GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+        subprocess.run(['git', '-C', repo] + list(args), check=True, capture_output=True, env=env)
+
+    def make_repo(self, name, files):
+        repo = os.path.join(self.test_dir, name)
+        os.makedirs(repo)
+        self.git(repo, 'init', '-q')
+        for path, data in files.items():
+            os.makedirs(os.path.dirname(os.path.join(repo, path)), exist_ok=True)
+            with open(os.path.join(repo, path), 'wb') as f:
+                f.write(data)
+        self.git(repo, 'add', '-A')
+        self.git(repo, 'commit', '-q', '-m', 'initial')
+        return repo
+
+    def test_reads_blobs_at_ref_with_dedup(self):
+        # Working tree changes are not part of the ref and must not be read
+        with open(os.path.join(self.repo_a, 'docs', 'a.md'), 'wb') as f:
+            f.write(b'uncommitted')
+
+        source = GitSource([self.repo_a, self.repo_b], extensions=['.md'])
+        items = {item.name: item for item in source.iter_items()}
+
+        self.assertCountEqual(items, [os.path.join('repo_a', 'README.md'), os.path.join('repo_a', 'docs', 'a.md'),
+                                      os.path.join('repo_b', 'docs', 'b.md')])
+        self.assertEqual(items[os.path.join('repo_a', 'docs', 'a.md')].data, b'a\n\n\na')
+        self.assertEqual(items[os.path.join('repo_b', 'docs', 'b.md')].provenance['member'], 'docs/b.md')
+
+    def test_repos_with_the_same_name_are_kept_apart(self):
+        utils_1 = self.make_repo(os.path.join('org1', 'utils'), {'README.md': b'one'})
+        utils_2 = self.make_repo(os.path.join('org2', 'utils'), {'README.md': b'two'})
+
+        items = {item.name: item.data for item in GitSource([utils_1, utils_2, self.repo_a], extensions=['.md']).iter_items()}
+
+        self.assertEqual(items[os.path.join('org1', 'utils', 'README.md')], b'one')
+        self.assertEqual(items[os.path.join('org2', 'utils', 'README.md')], b'two')
+        self.assertIn(os.path.join('repo_a', 'README.md'), items)
+
+    def test_path_filter_and_old_ref(self):
+        self.git(self.repo_b, 'rm', '-q', 'docs/b.md')
+        self.git(self.repo_b, 'commit', '-q', '-m', 'remove b')
+
+        self.assertEqual([item.name for item in GitSource([self.repo_b], paths=['docs/*']).iter_items()], [])
+        self.assertEqual([item.data for item in GitSource([self.repo_b], ref='HEAD~1', paths=['docs/*']).iter_items()], [b'b'])
+
+    def test_partitions_cover_all_blobs(self):
+        source = GitSource([self.repo_a, self.repo_b])
+        partitions = source.partitions(2)
+
+        names = [item.name for partition in partitions for item in source.iter_items(partition)]
+        self.assertEqual(len(names), 4)
+
+    def test_process_files_from_config(self):
+        output_dir = os.path.join(self.test_dir, 'output')
+        config_path = os.path.join(self.test_dir, 'config.yaml')
+        with open(config_path, 'w') as f:
+            f.write('output_dir: {}\nnum_processes: 2\ninput_source:\n  type: GitSource\n  repos: [{}]\n  extensions: [.md]\n'
+                    'processing_rules:\n  - type: RemoveDuplicateEmptyLinesRule\n'.format(output_dir, self.repo_a))
+
+        ScrivrParser(config_path=config_path).process_files()
+
+        with open(os.path.join(output_dir, 'repo_a', 'docs', 'a.md')) as f:
+            self.assertEqual(f.read(), 'a\na')
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'repo_a', 'src', 'main.py')))
+
+    def test_invalid_input_source_config(self):
+        with self.assertRaises(ValueError):
+            create_input_source({'type': 'ProcessingRule'})
+        with self.assertRaises(ValueError):
+            create_input_source({'type': 'GitSource', 'unknown': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import sys
+import unittest
+import subprocess
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import ProcessingRule, RemoveDuplicateEmptyLinesRule
+from scrivr.parser.supervisor import DocumentSupervisor, read_rss
+
+
+class PathologicalRule(ProcessingRule):
+    """Misbehaves on documents containing a trigger word"""
+
+    def process(self, text):
+        if "slow" in text:
+            time.sleep(30)
+        if "huge" in text:
+            blob = b"x" * (400 * 1024 * 1024)
+            time.sleep(30)
+        if "crash" in text:
+            os._exit(1)
+        if "spawn" in text:
+            # Stands in for a rule running pandoc, a subprocess that outlives its budget
+            child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+            with open(text.split()[1], "w") as f:
+                f.write(str(child.pid))
+            time.sleep(30)
+        if "hungry_child" in text:
+            subprocess.run([sys.executable, "-c", "import time; blob = b'x' * (400 * 1024 * 1024); time.sleep(30)"])
+        if "error" in text:
+            raise ValueError("bad document")
+        return text
+
+
+class TestDocumentSupervisor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.test_dir, "output")
+        os.makedirs(self.input_dir)
+        for i in range(6):
+            self.write_input("good{}.txt".format(i), "good {}\n\n\nend".format(i))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def write_input(self, filename, text):
+        with open(os.path.join(self.input_dir, filename), "w") as f:
+            f.write(text)
+
+    def parser(self, **kwargs):
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, num_processes=2, **kwargs)
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule(), PathologicalRule()]
+        return scrivr
+
+    def read_report(self):
+        with open(os.path.join(self.output_dir, "quarantine", "report.jsonl"), "r") as f:
+            return {os.path.basename(record["path"]): record for record in map(json.loads, f)}
+
+    def assert_good_outputs(self):
+        for i in range(6):
+            with open(os.path.join(self.output_dir, "good{}.txt".format(i)), "r") as f:
+                self.assertEqual(f.read(), "good {}\nend".format(i))
+
+    def test_timeout(self):
+        self.write_input("slow.txt", "slow")
+        started = time.monotonic()
+        with self.assertWarns(UserWarning):
+            self.parser(document_timeout=1).process_files()
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assert_good_outputs()
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "slow.txt")))
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, "quarantine", "slow.txt")))
+
+        record = self.read_report()["slow.txt"]
+        self.assertEqual(record["reason"], "timeout")
+        self.assertEqual(record["rule"], "PathologicalRule")
+        self.assertEqual(record["rule_index"], 1)
+
+    @unittest.skipIf(read_rss(os.getpid()) is None, "memory is only measured on Linux")
+    def test_memory_limit(self):
+        self.write_input("huge.txt", "huge")
+        memory_limit = read_rss(os.getpid()) + 200 * 1024 * 1024
+        with self.assertWarns(UserWarning):
+            self.parser(document_timeout=20, document_memory_limit=memory_limit).process_files()
+
+        self.assert_good_outputs()
+        record = self.read_report()["huge.txt"]
+        self.assertEqual(record["reason"], "memory")
+        self.assertEqual(record["rule"], "PathologicalRule")
+        self.assertLess(record["seconds"], 20)
+
+    def test_timeout_kills_subprocesses(self):
+        pid_path = os.path.join(self.test_dir, "child.pid")
+        self.write_input("spawn.txt", "spawn " + pid_path)
+        with self.assertWarns(UserWarning):
+            self.parser(document_timeout=2).process_files()
+
+        with open(pid_path, "r") as f:
+            pid = int(f.read())
+        self.assertEqual(self.read_report()["spawn.txt"]["reason"], "timeout")
+        self.assertFalse(self.running(pid))
+
+    @staticmethod
+    def running(pid):
+        """Returns whether a process is still running, counting an unreaped zombie as gone"""
+        for _ in range(50):
+            try:
+                with open("/proc/{}/stat".format(pid), "r") as f:
+                    if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                        return False
+            except OSError:
+                return False
+            time.sleep(0.1)
+        return True
+
+    @unittest.skipIf(read_rss(os.getpid()) is None, "memory is only measured on Linux")
+    def test_memory_limit_counts_subprocesses(self):
+        self.write_input("hungry_child.txt", "hungry_child")
+        memory_limit = read_rss(os.getpid()) + 200 * 1024 * 1024
+        with self.assertWarns(UserWarning):
+            self.parser(document_timeout=20, document_memory_limit=memory_limit).process_files()
+
+        record = self.read_report()["hungry_child.txt"]
+        self.assertEqual(record["reason"], "memory")
+        self.assertLess(record["seconds"], 20)
+
+    def test_same_named_documents_are_quarantined_apart(self):
+        for sub in ("a", "b"):
+            os.makedirs(os.path.join(self.input_dir, sub))
+            self.write_input(os.path.join(sub, "doc.txt"), "error in " + sub)
+        with self.assertWarns(UserWarning):
+            records = DocumentSupervisor(self.parser(), timeout=10).run(self.parser().list_files())
+
+        self.assertCountEqual([record["quarantine_path"] for record in records],
+                              [os.path.join("a", "doc.txt"), os.path.join("b", "doc.txt")])
+        for sub in ("a", "b"):
+            with open(os.path.join(self.output_dir, "quarantine", sub, "doc.txt"), "r") as f:
+                self.assertEqual(f.read(), "error in " + sub)
+
+    def test_crashes_and_errors(self):
+        self.write_input("crash.txt", "crash")
+        self.write_input("error.txt", "error")
+        with self.assertWarns(UserWarning):
+            records = DocumentSupervisor(self.parser(), timeout=10).run(self.parser().list_files())
+
+        self.assert_good_outputs()
+        reasons = {os.path.basename(record["path"]): record["reason"] for record in records}
+        self.assertEqual(reasons, {"crash.txt": "crashed", "error.txt": "error"})
+        self.assertEqual(self.read_report()["error.txt"]["detail"], "ValueError('bad document')")
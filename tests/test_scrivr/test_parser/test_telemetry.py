@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import queue
+import shutil
+import tempfile
+import unittest
+import warnings
+from unittest.mock import MagicMock, patch
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import ProcessingRule, RemoveDuplicateEmptyLinesRule
+from scrivr.parser.telemetry import ProgressReporter, RunMonitor
+
+
+class ExitRule(ProcessingRule):
+    def process(self, text):
+        if "exit" in text:
+            os._exit(3)
+        return text
+
+
+class TestRunMonitor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.file_paths = []
+        for i in range(4):
+            path = os.path.join(self.test_dir, "file{}.txt".format(i))
+            with open(path, "w") as f:
+                f.write("x" * 100)
+            self.file_paths.append(path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def test_progress_and_eta(self):
+        monitor = RunMonitor(self.file_paths, 2)
+        monitor.samples[0] = (monitor.started - 2, 0, 0)
+        monitor.update("file", 0, self.file_paths[0], 100)
+        monitor.update("file", 1, self.file_paths[1], 100)
+
+        status = monitor.status()
+        self.assertEqual((status["files_done"], status["files_total"]), (2, 4))
+        self.assertEqual((status["bytes_done"], status["bytes_total"]), (200, 400))
+        self.assertAlmostEqual(status["files_per_second"], 1, delta=0.1)
+        self.assertAlmostEqual(status["eta_seconds"], 2, delta=0.2)
+        self.assertEqual(status["workers"][1]["last_file"], self.file_paths[1])
+        self.assertEqual(status["state"], "running")
+
+    def test_stalled_worker(self):
+        monitor = RunMonitor(self.file_paths, 2, stall_seconds=10)
+        monitor.workers[1]["last_heartbeat"] -= 20
+        with self.assertWarns(UserWarning):
+            monitor.check_stalls()
+        self.assertEqual(monitor.status()["stalled_workers"], [1])
+
+        # A heartbeat clears the stall
+        monitor.update("heartbeat", 1, None, 0)
+        self.assertEqual(monitor.status()["stalled_workers"], [])
+
+    def test_reporter_messages(self):
+        progress_queue = queue.Queue()
+        reporter = ProgressReporter(progress_queue, 1, heartbeat_interval=0.01)
+        reporter.start()
+        reporter.file_done(self.file_paths[0])
+        time.sleep(0.05)
+        reporter.stop()
+
+        messages = []
+        while not progress_queue.empty():
+            messages.append(progress_queue.get())
+        self.assertIn(("file", 1, self.file_paths[0], 100), messages)
+        self.assertIn(("heartbeat", 1, None, 0), messages)
+        self.assertEqual(messages[-1], ("done", 1, None, 0))
+
+
+class TestMonitoredRun(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.test_dir, "output")
+        self.status_path = os.path.join(self.test_dir, "status.json")
+        os.makedirs(self.input_dir)
+        for i in range(10):
+            with open(os.path.join(self.input_dir, "file{}.txt".format(i)), "w") as f:
+                f.write("doc {}\n\n\nend".format(i))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def process(self, **kwargs):
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, num_processes=2,
+                              status_path=self.status_path, **kwargs)
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule(), ExitRule()]
+        scrivr.process_files()
+        with open(self.status_path, "r") as f:
+            return json.load(f)
+
+    def test_status_file(self):
+        status = self.process()
+
+        self.assertEqual(status["state"], "finished")
+        self.assertEqual(status["files_done"], 10)
+        self.assertEqual(status["bytes_done"], status["bytes_total"])
+        self.assertEqual([worker["files"] for worker in status["workers"]], [5, 5])
+        self.assertEqual(status["dead_workers"], [])
+        self.assertEqual(len(os.listdir(self.output_dir)), 10)
+
+    def test_dead_worker(self):
+        with open(os.path.join(self.input_dir, "file0.txt"), "w") as f:
+            f.write("exit")
+        with self.assertWarns(UserWarning):
+            status = self.process()
+
+        self.assertEqual(status["state"], "finished")
+        self.assertEqual(len(status["dead_workers"]), 1)
+        self.assertEqual(status["workers"][status["dead_workers"][0]]["exit_code"], 3)
+
+    def test_supervised_run(self):
+        with open(os.path.join(self.input_dir, "file0.txt"), "w") as f:
+            f.write("exit")
+        with self.assertWarns(UserWarning):
+            status = self.process(document_timeout=10)
+
+        # The crashed document is quarantined, and counts as handled
+        self.assertEqual(status["state"], "finished")
+        self.assertEqual(status["files_done"], 10)
+        self.assertEqual(sum(worker["files"] for worker in status["workers"]), 10)
+
+    def test_pool_run(self):
+        status = self.process(start_method="fork")
+
+        self.assertEqual(status["state"], "finished")
+        self.assertEqual(status["files_done"], 10)
+        self.assertEqual(status["bytes_done"], status["bytes_total"])
+        self.assertEqual(len(os.listdir(self.output_dir)), 10)
+
+    def test_pool_worker_reports_each_file_as_written(self):
+        from scrivr.parser import workers
+        scrivr = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir)
+        scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        os.makedirs(self.output_dir)
+
+        # The number of outputs written when each file is reported
+        written = []
+        progress = MagicMock()
+        progress.file_done.side_effect = lambda file_path, num_bytes=None: written.append(len(os.listdir(self.output_dir)))
+
+        file_paths = sorted(os.path.join(self.input_dir, name) for name in os.listdir(self.input_dir))
+        with patch.object(workers, "worker_parser", scrivr), patch.object(workers, "worker_progress", progress):
+            workers.process_paths(file_paths)
+
+        self.assertEqual(written, list(range(1, 11)))
+        progress.stop.assert_not_called()
+
+    def test_input_sources(self):
+        for fmt, files_total in (("zip", 10), ("gztar", None)):
+            archive_path = shutil.make_archive(os.path.join(self.test_dir, "input"), fmt, self.input_dir)
+            scrivr = ScrivrParser(input_dir=archive_path, output_dir=self.output_dir, num_processes=2, status_path=self.status_path)
+            scrivr.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                scrivr.process_files()
+
+            with open(self.status_path, "r") as f:
+                status = json.load(f)
+            self.assertEqual(status["state"], "finished")
+            self.assertEqual((status["files_done"], status["files_total"]), (10, files_total))
+            self.assertIsNone(status["bytes_total"])
+            self.assertEqual(sum(worker["files"] for worker in status["workers"]), 10)
+            self.assertIn("10 files", RunMonitor.format_status(status))
+
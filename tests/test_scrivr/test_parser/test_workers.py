@@ -0,0 +1,67 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from scrivr.parser import ScrivrParser
+from scrivr.parser.processing_rules import HtmlToMarkdownRule, RemoveDuplicateEmptyLinesRule
+
+# The import takes about 60 ms, the budget leaves room for slow machines while still catching an
+# eager import of pandas, pypandoc or the like
+IMPORT_BUDGET_SECONDS = 0.25
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_importing_parser_leaves_rule_dependencies_unimported(self):
+        # Checks which modules get imported, not how long the import takes
+        code = ("import sys, scrivr.parser; "
+                "print(','.join(m for m in ('pypandoc', 'bs4', 'chardet', 'aiohttp', 'pandas') if m in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+    def test_importing_parser_leaves_run_modes_unimported(self):
+        # Archives, git, supervision, coordination, autotuning and telemetry are imported by the runs that use them
+        modules = ('scrivr.parser.sources', 'scrivr.parser.supervisor', 'scrivr.parser.coordinator',
+                   'scrivr.parser.autotune', 'scrivr.parser.telemetry', 'sqlite3', 'tarfile', 'zipfile')
+        code = "import sys, scrivr.parser; print(','.join(m for m in {!r} if m in sys.modules))".format(modules)
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+    def test_import_time_within_budget(self):
+        def import_seconds():
+            # Cumulative time of the scrivr.parser import as reported by -X importtime, in microseconds
+            stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import scrivr.parser'],
+                                    capture_output=True, text=True, check=True).stderr
+            line = [line for line in stderr.splitlines() if line.rstrip().endswith('| scrivr.parser')][-1]
+            return int(line.split('|')[1]) / 1e6
+
+        # The fastest of a few runs, so a busy machine doesn't fail the test
+        self.assertLess(min(import_seconds() for _ in range(3)), IMPORT_BUDGET_SECONDS)
+
+
+class TestWarmPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.input_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        for i in range(20):
+            with open(os.path.join(self.input_dir, f'{i}.txt'), 'w') as f:
+                f.write(f'document {i}\n\n\n\nend\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.input_dir)
+        shutil.rmtree(self.output_dir)
+
+    def test_required_modules(self):
+        parser = ScrivrParser()
+        parser.processing_rules = [RemoveDuplicateEmptyLinesRule(), HtmlToMarkdownRule()]
+        self.assertEqual(parser.required_modules(), ['chardet', 'pypandoc'])
+
+    def test_process_files_forkserver(self):
+        parser = ScrivrParser(input_dir=self.input_dir, output_dir=self.output_dir, num_processes=2, start_method='forkserver')
+        parser.processing_rules = [RemoveDuplicateEmptyLinesRule()]
+        parser.process_files()
+
+        self.assertEqual(len(os.listdir(self.output_dir)), 20)
+        with open(os.path.join(self.output_dir, '7.txt'), 'r') as f:
+            self.assertEqual(f.read(), 'document 7\nend')
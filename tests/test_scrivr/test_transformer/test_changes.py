@@ -0,0 +1,54 @@
+import unittest
+from scrivr.transformer import ChangeSet
+
+
+class TestChangeSet(unittest.TestCase):
+    def test_add_then_modify_is_added(self):
+        changes = ChangeSet()
+        changes.add('a.txt')
+        changes.modify('a.txt')
+        self.assertEqual(changes, ChangeSet(added=['a.txt']))
+
+    def test_add_then_remove_is_dropped(self):
+        changes = ChangeSet()
+        changes.add('a.txt')
+        changes.remove('a.txt')
+        self.assertEqual(len(changes), 0)
+        self.assertFalse(changes)
+
+    def test_modify_then_remove_is_removed(self):
+        changes = ChangeSet()
+        changes.modify('a.txt')
+        changes.remove('a.txt')
+        self.assertEqual(changes, ChangeSet(removed=['a.txt']))
+
+    def test_remove_then_add_is_modified(self):
+        changes = ChangeSet()
+        changes.remove('a.txt')
+        changes.add('a.txt')
+        self.assertEqual(changes, ChangeSet(modified=['a.txt']))
+
+    def test_rename_of_added_is_added(self):
+        changes = ChangeSet()
+        changes.add('a.txt')
+        changes.rename('a.txt', 'b.txt')
+        self.assertEqual(changes, ChangeSet(added=['b.txt']))
+
+    def test_chained_renames(self):
+        changes = ChangeSet()
+        changes.rename('a.txt', 'b.txt')
+        changes.rename('b.txt', 'c.txt')
+        self.assertEqual(changes, ChangeSet(renamed={'a.txt': 'c.txt'}))
+
+        changes.rename('c.txt', 'a.txt')
+        self.assertEqual(len(changes), 0)
+
+    def test_rename_then_remove_is_removed(self):
+        changes = ChangeSet()
+        changes.rename('a.txt', 'b.txt')
+        changes.remove('b.txt')
+        self.assertEqual(changes, ChangeSet(removed=['a.txt']))
+
+
+if __name__ == '__main__':
+    unittest.main()
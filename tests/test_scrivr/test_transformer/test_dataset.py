@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from scrivr.transformer import PackedTokenDataset, SimpleBPETokenizer, TransformerPreprocessor
+
+
+class TestPackedTokenDataset(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'dataset')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_append_and_pack(self):
+        dataset = PackedTokenDataset(self.path, dtype='uint16', eos_token_id=0)
+        dataset.append([1, 2, 3])
+        dataset.append([4, 5])
+
+        self.assertEqual(dataset.num_documents, 2)
+        self.assertEqual(dataset.num_tokens, 7)
+        self.assertEqual(os.path.getsize(self.path + '.bin'), 14)
+        np.testing.assert_array_equal(dataset.document(1), [4, 5, 0])
+        np.testing.assert_array_equal(dataset.sequences(3), [[1, 2, 3], [0, 4, 5]])
+
+    def test_sequences_are_memory_mapped(self):
+        dataset = PackedTokenDataset(self.path)
+        dataset.append(range(10))
+
+        sequences = dataset.sequences(4)
+        self.assertEqual(sequences.shape, (2, 4))
+        self.assertIsInstance(sequences.base, np.memmap)
+
+    def test_reopen_keeps_dtype_and_appends(self):
+        PackedTokenDataset(self.path, dtype='uint16', eos_token_id=9).append([1, 2], key='a')
+
+        dataset = PackedTokenDataset(self.path)
+        self.assertEqual(dataset.dtype, np.uint16)
+        self.assertFalse(dataset.append([1, 2], key='a'))
+        self.assertTrue(dataset.append([3], key='b'))
+        np.testing.assert_array_equal(dataset.tokens(), [1, 2, 9, 3, 9])
+
+        with self.assertRaises(ValueError):
+            PackedTokenDataset(self.path, dtype='uint32')
+
+    def test_token_out_of_range(self):
+        dataset = PackedTokenDataset(self.path, dtype='uint16')
+        with self.assertRaises(ValueError):
+            dataset.append([70000])
+
+    def test_random_batch(self):
+        dataset = PackedTokenDataset(self.path)
+        dataset.append(range(12))
+
+        batch = dataset.random_batch(5, 4, rng=np.random.default_rng(0))
+        self.assertEqual(batch.shape, (5, 4))
+        for row in batch:
+            self.assertEqual(row[0] % 4, 0)
+
+    def test_update_from_preprocessor(self):
+        input_dir = os.path.join(self.test_dir, 'input')
+        os.makedirs(input_dir)
+        for i in range(2):
+            with open(os.path.join(input_dir, f'test_{i}.txt'), 'w') as f:
+                f.write(f'doc {i}')
+
+        tokenizer = SimpleBPETokenizer()
+        tp = TransformerPreprocessor(input_dir, tokenizer=tokenizer)
+        dataset = PackedTokenDataset.for_tokenizer(self.path, tokenizer)
+
+        self.assertEqual(dataset.dtype, np.uint16)
+        self.assertEqual(dataset.update_from(tp), 2)
+        self.assertEqual(dataset.update_from(tp), 0)
+        self.assertEqual(dataset.num_tokens, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,8 +5,15 @@ from scrivr.transformer import TransformerPreprocessor
 import multiprocessing
 import pandas as pd
 import warnings
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+import asyncio
+import threading
 import tempfile
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from scrivr.transformer import SimpleBPETokenizer, ChangeSet
+from scrivr.transformer.preprocessor import FileRemoved, FileRenamed
+from scrivr.transformer.tokenizer import content_hash
 
 
 class TestTransformerPreprocessor(unittest.TestCase):
@@ -22,9 +29,7 @@ class TestTransformerPreprocessor(unittest.TestCase):
 
     def tearDown(self):
         # remove the test files
-        for filename in os.listdir(self.test_dir):
-            os.remove(os.path.join(self.test_dir, filename))
-        os.rmdir(self.test_dir)
+        shutil.rmtree(self.test_dir)
 
     def test_initialize_queue(self):
         # initialize the transformer preprocessor
@@ -38,8 +43,17 @@ class TestTransformerPreprocessor(unittest.TestCase):
         # initialize the transformer preprocessor
         tp = TransformerPreprocessor(self.test_dir)
 
-        # start watching the directory
-        watcher = multiprocessing.Process(target=tp.watch_directory)
+        # start watching the directory, tp.queue is shared with threads rather than processes
+        class StopWatching(Exception):
+            pass
+
+        def watch():
+            try:
+                tp.watch_directory()
+            except StopWatching:
+                pass
+
+        watcher = threading.Thread(target=watch, daemon=True)
         watcher.start()
 
         # add a new file to the directory
@@ -47,21 +61,44 @@ class TestTransformerPreprocessor(unittest.TestCase):
         with open(os.path.join(self.test_dir, new_file), 'w') as f:
             f.write("test content 3")
 
-        # wait for two updates
-        time.sleep(4)
+        # wait for the watcher to pick up the change
+        time.sleep(2)
 
-        # check that the new file was added to the queue
-        update1 = tp.queue.get()
-        update2 = tp.queue.get()
-        updates = [update1, update2]
-        updates.sort()
-        self.assertEqual(updates[0][0], 'test_2.txt')
-        self.assertEqual(updates[1][0], 'test_3.txt')
+        # check that only the new file was added to the queue, unchanged files are not re-queued.
+        # A scan during the write may queue the new file once more.
+        update = tp.queue.get(timeout=5)
+        self.assertEqual(update[0], 'test_3.txt')
+        while not tp.queue.empty():
+            self.assertEqual(tp.queue.get()[0], 'test_3.txt')
 
         # stop the watcher
-        watcher.terminate()
+        tp.check_directory = MagicMock(side_effect=StopWatching)
         watcher.join()
 
+    def test_watch(self):
+        # initialize the transformer preprocessor
+        tp = TransformerPreprocessor(self.test_dir, poll_interval=0.1)
+
+        async def watch_and_add():
+            # start watching the directory on the event loop
+            tp.updates = asyncio.Queue()
+            watcher = asyncio.create_task(tp.watch())
+            await asyncio.sleep(0.2)
+
+            # add a new file to the directory and wait for the watcher to pick up the change
+            with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+                f.write("test content 3")
+            update = await asyncio.wait_for(tp.updates.get(), 5)
+
+            watcher.cancel()
+            return update
+
+        update = asyncio.run(watch_and_add())
+
+        # check that only the new file was queued, unchanged files are not re-queued
+        self.assertEqual(update[0], 'test_3.txt')
+        self.assertTrue(tp.updates.empty())
+
     def test_process_queue(self):
         # create a test DataFrame
         self.df = pd.DataFrame({
@@ -159,6 +196,456 @@ class TestTransformerPreprocessor(unittest.TestCase):
         # remove the temporary file
         os.remove(f.name)
 
+    def test_initialize_queue_tokenizes_files(self):
+        tp = TransformerPreprocessor(self.test_dir, tokenizer=SimpleBPETokenizer())
+
+        tokens = tp.df.loc[tp.df['ingest_file_path'] == 'test_0.txt', 'tokens'].values[0]
+        self.assertEqual(list(tokens), list(b'test content 0'))
+
+    def test_process_queue_only_tokenizes_changed_files(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            tokenizer = SimpleBPETokenizer()
+            tp = TransformerPreprocessor(self.test_dir, tokenizer=tokenizer, token_cache_dir=cache_dir)
+
+            with open(os.path.join(self.test_dir, 'test_1.txt'), 'w') as f:
+                f.write('changed content')
+
+            with patch.object(tokenizer, 'encode_batch', wraps=tokenizer.encode_batch) as mock_encode:
+                for i in range(3):
+                    tp.queue.put((f'test_{i}.txt', time.time()))
+                tp.queue.put(None)
+                tp.process_queue()
+
+            # Unchanged files are skipped, so only the changed file is tokenized
+            texts = [text for call in mock_encode.call_args_list for text in call.args[0]]
+            self.assertEqual(texts, ['changed content'])
+
+            tokens = tp.df.loc[tp.df['ingest_file_path'] == 'test_1.txt', 'tokens'].values[0]
+            self.assertEqual(list(tokens), list(b'changed content'))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_token_cache_reused_across_instances(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            TransformerPreprocessor(self.test_dir, tokenizer=SimpleBPETokenizer(), token_cache_dir=cache_dir)
+
+            tokenizer = SimpleBPETokenizer()
+            with patch.object(tokenizer, 'encode_batch', wraps=tokenizer.encode_batch) as mock_encode:
+                tp = TransformerPreprocessor(self.test_dir, tokenizer=tokenizer, token_cache_dir=cache_dir)
+                mock_encode.assert_not_called()
+
+            self.assertTrue(all(tokens is not None for tokens in tp.df['tokens']))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_process_queue_coalesces_notifications(self):
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=60)
+        observer = MagicMock()
+        tp.add_observer(observer)
+
+        with open(os.path.join(self.test_dir, 'test_0.txt'), 'w') as f:
+            f.write('changed content')
+        with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+            f.write('test content 3')
+
+        # Unchanged files are re-queued too, but only real changes are reported
+        for i in range(4):
+            tp.queue.put((f'test_{i}.txt', time.time()))
+            tp.queue.put((f'test_{i}.txt', time.time()))
+        tp.queue.put(None)
+        tp.process_queue()
+
+        observer.queue_updated.assert_called_once_with(ChangeSet(added=['test_3.txt'], modified=['test_0.txt']))
+
+    def test_process_queue_notifies_at_max_changes(self):
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=60, notify_max_changes=2, tokenize_batch_size=1)
+        observer = MagicMock()
+        tp.add_observer(observer)
+
+        for i in range(3, 6):
+            with open(os.path.join(self.test_dir, f'test_{i}.txt'), 'w') as f:
+                f.write(f'test content {i}')
+            tp.queue.put((f'test_{i}.txt', time.time()))
+        tp.queue.put(None)
+        tp.process_queue()
+
+        self.assertEqual([call.args[0] for call in observer.queue_updated.call_args_list],
+                         [ChangeSet(added=['test_3.txt', 'test_4.txt']), ChangeSet(added=['test_5.txt'])])
+
+    def test_async_observer(self):
+        received = []
+        done = threading.Event()
+
+        class AsyncObserver:
+            async def queue_updated(self, changes):
+                await asyncio.sleep(0)
+                received.append(changes)
+                done.set()
+
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=0)
+        tp.add_observer(AsyncObserver())
+
+        with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+            f.write('test content 3')
+        tp.queue.put(('test_3.txt', time.time()))
+        tp.queue.put(None)
+        tp.process_queue()
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received, [ChangeSet(added=['test_3.txt'])])
+
+    def test_run_processes_changes_on_one_loop(self):
+        events = []
+
+        class Observer:
+            async def queue_updated(self, changes):
+                await asyncio.sleep(0)
+                events.append(changes)
+
+            def queue_empty(self):
+                events.append('empty')
+
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=0, seconds_for_empty_queue=0.2, poll_interval=0.1)
+        tp.add_observer(Observer())
+
+        # The first scan of the watcher picks these up
+        with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+            f.write('test content 3')
+        os.remove(os.path.join(self.test_dir, 'test_0.txt'))
+
+        async def run():
+            runner = asyncio.create_task(tp.run())
+            for _ in range(50):
+                if 'empty' in events:
+                    break
+                await asyncio.sleep(0.1)
+            tp.updates.put_nowait(None)
+            await asyncio.wait_for(runner, 5)
+
+        asyncio.run(run())
+
+        self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_1.txt', 'test_2.txt', 'test_3.txt'])
+        self.assertEqual(events[-1], 'empty')
+        changes = events[:-1]
+        self.assertEqual(set().union(*(c.added for c in changes)), {'test_3.txt'})
+        self.assertEqual(set().union(*(c.removed for c in changes)), {'test_0.txt'})
+
+    def test_run_sends_queue_empty_once_per_idle_period(self):
+        events = []
+
+        class Observer:
+            def queue_empty(self):
+                events.append('empty')
+
+        tp = TransformerPreprocessor(self.test_dir, seconds_for_empty_queue=0.1, poll_interval=0.05)
+        tp.add_observer(Observer())
+
+        async def run():
+            runner = asyncio.create_task(tp.run())
+            await asyncio.sleep(0.5)
+            tp.updates.put_nowait(None)
+            await asyncio.wait_for(runner, 5)
+
+        asyncio.run(run())
+
+        self.assertEqual(events, ['empty'])
+
+    def test_run_keeps_watching_after_a_failed_scan(self):
+        tp = TransformerPreprocessor(self.test_dir, poll_interval=0.05)
+        scan_directory = tp.scan_directory
+        failures = [OSError('unavailable')]
+
+        def scan_failing_once():
+            if failures:
+                raise failures.pop()
+            return scan_directory()
+        tp.scan_directory = scan_failing_once
+
+        with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+            f.write('test content 3')
+
+        async def run():
+            runner = asyncio.create_task(tp.run())
+            for _ in range(50):
+                if 'test_3.txt' in set(tp.df['ingest_file_path']):
+                    break
+                await asyncio.sleep(0.1)
+            tp.updates.put_nowait(None)
+            await asyncio.wait_for(runner, 5)
+
+        with self.assertWarns(UserWarning):
+            asyncio.run(run())
+
+        self.assertIn('test_3.txt', list(tp.df['ingest_file_path']))
+
+    def test_cancelled_run_saves_snapshot(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            tp = TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path, snapshot_interval=3600, poll_interval=0.05)
+
+            with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+                f.write('test content 3')
+
+            async def run():
+                runner = asyncio.create_task(tp.run())
+                for _ in range(50):
+                    if 'test_3.txt' in set(tp.df['ingest_file_path']):
+                        break
+                    await asyncio.sleep(0.1)
+                runner.cancel()
+                await asyncio.gather(runner, return_exceptions=True)
+
+            asyncio.run(run())
+
+            tp, hashed = self.hash_files_on_restart(snapshot_path)
+            self.assertEqual(hashed, [])
+            self.assertIn('test_3.txt', list(tp.df['ingest_file_path']))
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_process_pool_executor_is_rejected(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(ValueError):
+                TransformerPreprocessor(self.test_dir, executor=executor)
+
+    def test_check_directory_detects_removal(self):
+        tp = TransformerPreprocessor(self.test_dir)
+        os.remove(os.path.join(self.test_dir, 'test_1.txt'))
+
+        tp.check_directory()
+
+        self.assertEqual(tp.queue.get(timeout=5), FileRemoved('test_1.txt'))
+        self.assertTrue(tp.queue.empty())
+
+    def test_check_directory_detects_rename_by_inode(self):
+        tp = TransformerPreprocessor(self.test_dir)
+        os.rename(os.path.join(self.test_dir, 'test_1.txt'), os.path.join(self.test_dir, 'renamed.txt'))
+
+        tp.check_directory()
+
+        update = tp.queue.get(timeout=5)
+        self.assertIsInstance(update, FileRenamed)
+        self.assertEqual((update.old_path, update.new_path), ('test_1.txt', 'renamed.txt'))
+        self.assertTrue(tp.queue.empty())
+
+    def test_check_directory_detects_atomic_replace(self):
+        tp = TransformerPreprocessor(self.test_dir)
+        path = os.path.join(self.test_dir, 'test_1.txt')
+        stat = os.stat(path)
+
+        # Replace the file with one of the same size and last modified time, as cp -p or rsync -t do
+        with open(path + '.new', 'w') as f:
+            f.write('test content X')
+        os.utime(path + '.new', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(path + '.new', path)
+
+        tp.check_directory()
+
+        self.assertEqual(tp.queue.get(timeout=5)[0], 'test_1.txt')
+        self.assertTrue(tp.queue.empty())
+
+    def test_process_queue_removes_and_renames_rows(self):
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=60)
+        observer = MagicMock()
+        tp.add_observer(observer)
+
+        os.remove(os.path.join(self.test_dir, 'test_0.txt'))
+        os.rename(os.path.join(self.test_dir, 'test_1.txt'), os.path.join(self.test_dir, 'renamed.txt'))
+        tp.check_directory()
+        tp.queue.put(None)
+
+        with patch.object(tp, 'process_file', wraps=tp.process_file) as mock_process_file:
+            tp.process_queue()
+            mock_process_file.assert_not_called()
+
+        self.assertCountEqual(list(tp.df['ingest_file_path']), ['renamed.txt', 'test_2.txt'])
+        self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == 'renamed.txt', 'data'].values[0], 'test content 1')
+        observer.queue_updated.assert_called_once_with(ChangeSet(removed=['test_0.txt'], renamed={'test_1.txt': 'renamed.txt'}))
+
+    def test_process_queue_detects_rename_by_content_hash(self):
+        tp = TransformerPreprocessor(self.test_dir, notify_interval=60)
+        observer = MagicMock()
+        tp.add_observer(observer)
+
+        # A copy and delete gets a new inode, so the watcher reports an add and a removal
+        with open(os.path.join(self.test_dir, 'copied.txt'), 'w') as f:
+            f.write('test content 2')
+        os.remove(os.path.join(self.test_dir, 'test_2.txt'))
+        tp.queue.put(('copied.txt', time.time()))
+        tp.queue.put(FileRemoved('test_2.txt'))
+        tp.queue.put(None)
+        tp.process_queue()
+
+        self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_0.txt', 'test_1.txt', 'copied.txt'])
+        observer.queue_updated.assert_called_once_with(ChangeSet(renamed={'test_2.txt': 'copied.txt'}))
+
+        # The copy keeps its own stats rather than those of the file it replaced
+        self.assertEqual(tp.row_stats['copied.txt'], tp.stat_file('copied.txt'))
+        self.assertNotIn('test_2.txt', tp.row_stats)
+
+    def test_recursive_watch_with_ignore_patterns(self):
+        os.makedirs(os.path.join(self.test_dir, 'sub', 'build'))
+        with open(os.path.join(self.test_dir, 'sub', 'nested.txt'), 'w') as f:
+            f.write('nested content')
+        with open(os.path.join(self.test_dir, 'sub', 'build', 'ignored.txt'), 'w') as f:
+            f.write('ignored content')
+
+        tp = TransformerPreprocessor(self.test_dir, recursive=True, ignore_patterns=['build/', 'test_2.txt'])
+
+        nested = os.path.join('sub', 'nested.txt')
+        self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_0.txt', 'test_1.txt', nested])
+        self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == nested, 'data'].values[0], 'nested content')
+
+        with open(os.path.join(self.test_dir, 'sub', 'build', 'ignored_too.txt'), 'w') as f:
+            f.write('ignored content')
+        with open(os.path.join(self.test_dir, 'sub', 'new.txt'), 'w') as f:
+            f.write('new content')
+        tp.check_directory()
+
+        self.assertEqual(tp.queue.get(timeout=5)[0], os.path.join('sub', 'new.txt'))
+        self.assertTrue(tp.queue.empty())
+
+
+    def hash_files_on_restart(self, snapshot_path, **kwargs):
+        """Starts a preprocessor from the snapshot, returns it and the contents it had to hash"""
+        with patch('scrivr.transformer.preprocessor.content_hash', wraps=content_hash) as mock_hash:
+            tp = TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path, **kwargs)
+        return tp, sorted(call.args[0] for call in mock_hash.call_args_list)
+
+    def test_restart_from_snapshot_hashes_only_changed_files(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+            self.assertTrue(os.path.isfile(snapshot_path))
+
+            tp, hashed = self.hash_files_on_restart(snapshot_path)
+            self.assertEqual(hashed, [])
+            self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_0.txt', 'test_1.txt', 'test_2.txt'])
+            tp.load_data()
+            self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == 'test_1.txt', 'data'].values[0], 'test content 1')
+
+            with open(os.path.join(self.test_dir, 'test_0.txt'), 'w') as f:
+                f.write('changed content 0')
+            with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+                f.write('test content 3')
+            os.rename(os.path.join(self.test_dir, 'test_1.txt'), os.path.join(self.test_dir, 'renamed.txt'))
+            os.remove(os.path.join(self.test_dir, 'test_2.txt'))
+
+            tp, hashed = self.hash_files_on_restart(snapshot_path)
+            self.assertEqual(hashed, ['changed content 0', 'test content 3'])
+            self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_0.txt', 'renamed.txt', 'test_3.txt'])
+            self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == 'test_0.txt', 'data'].values[0], 'changed content 0')
+            tp.load_data()
+            self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == 'renamed.txt', 'data'].values[0], 'test content 1')
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_restart_from_snapshot_reads_only_changed_files(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+            with open(os.path.join(self.test_dir, 'test_0.txt'), 'w') as f:
+                f.write('changed content 0')
+
+            with patch.object(TransformerPreprocessor, 'process_file', autospec=True,
+                              side_effect=TransformerPreprocessor.process_file) as mock_read:
+                tp = TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+                self.assertEqual([call.args[1] for call in mock_read.call_args_list], ['test_0.txt'])
+
+                # Unchanged rows are read on demand
+                self.assertTrue(pd.isna(tp.df.loc[tp.df['ingest_file_path'] == 'test_1.txt', 'data'].values[0]))
+                tp.load_data()
+                self.assertEqual(mock_read.call_count, 3)
+            self.assertEqual(tp.df.loc[tp.df['ingest_file_path'] == 'test_1.txt', 'data'].values[0], 'test content 1')
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_snapshot_keeps_tokens(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            TransformerPreprocessor(self.test_dir, tokenizer=SimpleBPETokenizer(), snapshot_path=snapshot_path)
+
+            tokenizer = SimpleBPETokenizer()
+            with patch.object(tokenizer, 'encode_batch', wraps=tokenizer.encode_batch) as mock_encode:
+                tp = TransformerPreprocessor(self.test_dir, tokenizer=tokenizer, snapshot_path=snapshot_path)
+                mock_encode.assert_not_called()
+            tokens = tp.df.loc[tp.df['ingest_file_path'] == 'test_2.txt', 'tokens'].values[0]
+            self.assertEqual(list(tokens), list(b'test content 2'))
+
+            # Without a tokenizer the snapshot's tokens don't apply
+            tp = TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+            self.assertTrue(tp.df['tokens'].isna().all())
+
+            # Content missing from the token cache is read to tokenize it again
+            shutil.rmtree(snapshot_path + '.tokens')
+            tp = TransformerPreprocessor(self.test_dir, tokenizer=SimpleBPETokenizer(), snapshot_path=snapshot_path)
+            tokens = tp.df.loc[tp.df['ingest_file_path'] == 'test_2.txt', 'tokens'].values[0]
+            self.assertEqual(list(tokens), list(b'test content 2'))
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_process_queue_saves_snapshot(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            tp = TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+
+            with open(os.path.join(self.test_dir, 'test_3.txt'), 'w') as f:
+                f.write('test content 3')
+            os.remove(os.path.join(self.test_dir, 'test_0.txt'))
+            tp.check_directory()
+            tp.queue.put(None)
+            tp.process_queue()
+
+            tp, hashed = self.hash_files_on_restart(snapshot_path)
+            self.assertEqual(hashed, [])
+            self.assertCountEqual(list(tp.df['ingest_file_path']), ['test_1.txt', 'test_2.txt', 'test_3.txt'])
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_snapshot_holds_no_content(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+            with open(snapshot_path, 'r') as f:
+                self.assertNotIn('test content', f.read())
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_unreadable_snapshot_is_ignored(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            for content in ('not json', '[]', '{"version": 2, "input_dir": "%s", "rows": [1]}' % os.path.abspath(self.test_dir)):
+                with open(snapshot_path, 'w') as f:
+                    f.write(content)
+                with self.assertWarns(UserWarning):
+                    tp, hashed = self.hash_files_on_restart(snapshot_path)
+                self.assertEqual(len(hashed), 3)
+                self.assertEqual(len(tp.df), 3)
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_snapshot_of_another_directory_is_ignored(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, 'snapshot.json')
+            TransformerPreprocessor(self.test_dir, snapshot_path=snapshot_path)
+            other_dir = os.path.join(snapshot_dir, 'other')
+            shutil.copytree(self.test_dir, other_dir)
+
+            with self.assertWarns(UserWarning):
+                tp = TransformerPreprocessor(other_dir, snapshot_path=snapshot_path)
+            self.assertEqual(len(tp.df), 3)
+        finally:
+            shutil.rmtree(snapshot_dir)
 
 if __name__ == '__main__':
     unittest.main()
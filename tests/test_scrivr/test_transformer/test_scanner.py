@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from scrivr.transformer import IgnoreRules, scan_directory
+
+
+class TestIgnoreRules(unittest.TestCase):
+    def test_name_matches_at_any_depth(self):
+        rules = IgnoreRules(['*.tmp'])
+        self.assertTrue(rules.is_ignored('a.tmp'))
+        self.assertTrue(rules.is_ignored('docs/deep/a.tmp'))
+        self.assertFalse(rules.is_ignored('a.txt'))
+
+    def test_anchored_pattern(self):
+        rules = IgnoreRules(['/build', 'docs/*.md'])
+        self.assertTrue(rules.is_ignored('build', is_dir=True))
+        self.assertFalse(rules.is_ignored('src/build', is_dir=True))
+        self.assertTrue(rules.is_ignored('docs/a.md'))
+        self.assertFalse(rules.is_ignored('docs/sub/a.md'))
+
+    def test_double_star(self):
+        rules = IgnoreRules(['docs/**/*.md'])
+        self.assertTrue(rules.is_ignored('docs/a.md'))
+        self.assertTrue(rules.is_ignored('docs/sub/deep/a.md'))
+
+    def test_dir_only_and_negation(self):
+        rules = IgnoreRules(['# comment', 'cache/', '*.log', '!keep.log'])
+        self.assertTrue(rules.is_ignored('cache', is_dir=True))
+        self.assertFalse(rules.is_ignored('cache', is_dir=False))
+        self.assertTrue(rules.is_ignored('a.log'))
+        self.assertFalse(rules.is_ignored('keep.log'))
+
+    def test_bracket_expressions(self):
+        rules = IgnoreRules(['[a!b].txt', '[!xy].md', '[\\^].log'])
+        self.assertTrue(rules.is_ignored('!.txt'))
+        self.assertTrue(rules.is_ignored('b.txt'))
+        self.assertFalse(rules.is_ignored('^.txt'))
+        self.assertTrue(rules.is_ignored('z.md'))
+        self.assertFalse(rules.is_ignored('x.md'))
+        self.assertTrue(rules.is_ignored('^.log'))
+        self.assertTrue(rules.is_ignored('\\.log'))
+        self.assertFalse(rules.is_ignored('a.log'))
+
+
+class TestScanDirectory(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for path in ['a.txt', 'sub/b.txt', 'sub/deep/c.txt', 'sub/skip.tmp', 'cache/d.txt']:
+            path = os.path.join(self.test_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_top_level_only(self):
+        self.assertEqual(list(scan_directory(self.test_dir)), ['a.txt'])
+
+    def test_recursive(self):
+        file_stats = scan_directory(self.test_dir, recursive=True)
+        self.assertCountEqual(file_stats, ['a.txt', os.path.join('sub', 'b.txt'), os.path.join('sub', 'deep', 'c.txt'),
+                                           os.path.join('sub', 'skip.tmp'), os.path.join('cache', 'd.txt')])
+        inode, last_modified, size = file_stats['a.txt']
+        self.assertEqual(size, os.path.getsize(os.path.join(self.test_dir, 'a.txt')))
+
+    def test_ignored_directories_are_never_scanned(self):
+        with patch('scrivr.transformer.scanner.os.scandir', wraps=os.scandir) as mock_scandir:
+            file_stats = scan_directory(self.test_dir, recursive=True, ignore=IgnoreRules(['*.tmp', 'cache/']))
+
+        self.assertCountEqual(file_stats, ['a.txt', os.path.join('sub', 'b.txt'), os.path.join('sub', 'deep', 'c.txt')])
+        scanned = [os.path.relpath(call.args[0], self.test_dir) for call in mock_scandir.call_args_list]
+        self.assertCountEqual(scanned, ['.', 'sub', os.path.join('sub', 'deep')])
+
+    def test_vanished_directories_and_files_are_skipped(self):
+        scandir = os.scandir
+        test_dir = self.test_dir
+
+        class VanishingScandir:
+            # The deep directory can't be listed, and a.txt is removed after being listed but before its stat
+            def __init__(self, path):
+                if os.path.relpath(path, test_dir) == os.path.join('sub', 'deep'):
+                    raise FileNotFoundError(path)
+                self.entries = list(scandir(path))
+
+            def __iter__(self):
+                for entry in self.entries:
+                    if entry.name == 'a.txt':
+                        os.remove(entry.path)
+                return iter(self.entries)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+        with patch('scrivr.transformer.scanner.os.scandir', VanishingScandir):
+            file_stats = scan_directory(self.test_dir, recursive=True)
+
+        self.assertCountEqual(file_stats, [os.path.join('sub', 'b.txt'), os.path.join('sub', 'skip.tmp'),
+                                           os.path.join('cache', 'd.txt')])
+
+    def test_missing_root_is_an_error(self):
+        with self.assertRaises(FileNotFoundError):
+            scan_directory(os.path.join(self.test_dir, 'missing'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import shutil
+import tempfile
+import numpy as np
+from scrivr.transformer.tokenizer import SimpleBPETokenizer, TokenCache, load_tokenizer, content_hash
+
+
+class TestSimpleBPETokenizer(unittest.TestCase):
+    def test_byte_fallback(self):
+        tokenizer = SimpleBPETokenizer()
+        self.assertEqual(tokenizer.encode_batch(['ab']), [[97, 98]])
+        self.assertEqual(tokenizer.vocab_size, 256)
+
+    def test_train_and_round_trip(self):
+        texts = ['the cat sat on the mat', 'the hat']
+        tokenizer = SimpleBPETokenizer.train(texts, vocab_size=270)
+
+        self.assertGreater(len(tokenizer.merges), 0)
+        for text in texts:
+            ids = tokenizer.encode(text)
+            self.assertLess(len(ids), len(text.encode('utf-8')))
+            self.assertEqual(tokenizer.decode(ids), text)
+
+    def test_name_depends_on_merges(self):
+        self.assertEqual(SimpleBPETokenizer().name, SimpleBPETokenizer([]).name)
+        self.assertNotEqual(SimpleBPETokenizer().name, SimpleBPETokenizer([(97, 98)]).name)
+
+    def test_load_tokenizer_default(self):
+        self.assertIsInstance(load_tokenizer(), SimpleBPETokenizer)
+
+    def test_load_tokenizer_missing_vocab(self):
+        with self.assertRaises((FileNotFoundError, ImportError)):
+            load_tokenizer('does_not_exist.json')
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_put_and_get(self):
+        cache = TokenCache(self.cache_dir, 'bpe-test')
+        key = content_hash('hello')
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, np.array([1, 2, 3], dtype=np.uint32))
+        np.testing.assert_array_equal(cache.get(key), [1, 2, 3])
+
+    def test_namespaces_are_isolated(self):
+        key = content_hash('hello')
+        TokenCache(self.cache_dir, 'a').put(key, np.array([1], dtype=np.uint32))
+        self.assertIsNone(TokenCache(self.cache_dir, 'b').get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()